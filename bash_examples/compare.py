@@ -5,9 +5,11 @@ from omegaconf import DictConfig, OmegaConf,ListConfig
 import os
 import numpy as np
 import plotly.express as px
-from inference import inference
+from inference import inference, store_entry, prediction_cache
 import hydra
 from dsipts import beauty_string
+from dsipts.data_structure.prediction_store import PredictionStore
+from utils import ErrorAccumulator, prediction_key
 import traceback
 
 VERBOSE = True
@@ -30,7 +32,7 @@ def compare(conf:DictConfig)-> None:
     
     res = []
     tot_losses = []
-    tot_predictions = []
+    stores = set()
     
     if isinstance( conf.models,list) or isinstance( conf.models,ListConfig):
         files =  conf.models
@@ -50,26 +52,38 @@ def compare(conf:DictConfig)-> None:
         conf_tmp.inference.set = conf.set
         conf_tmp.inference.rescaling = conf.rescaling
         conf_tmp.inference.batch_size = conf.get('batch_size',conf_tmp.inference.batch_size)
+        if conf.get('store_path',None) is not None:
+            conf_tmp.inference.store_path = conf.store_path
+        store, entry = store_entry(conf_tmp)
 
         beauty_string(f'PROCESSING {conf_tmp.model.type}_{conf_tmp.ts.name}_{conf_tmp.ts.version}','section',VERBOSE)
 
         try:
-            tmp,predictions, losses = inference(conf_tmp)
+            ##the errors are computed from the prediction store if the predictions are already there and generated by the same configuration and checkpoints
+            if conf.get('from_store',False) and prediction_cache(store).has(entry,prediction_key(conf_tmp)):
+                beauty_string(f'Reading the predictions of {entry} from {store.path}','info',VERBOSE)
+                accumulator = ErrorAccumulator()
+                for chunk in store.iter_query(*[[e] for e in entry]):
+                    accumulator.update(chunk)
+                tmp = accumulator.errors()
+                loss_file = os.path.join(conf_tmp.train_config.dirpath,'loss.csv')
+                losses = pd.read_csv(loss_file) if os.path.exists(loss_file) else None
+            else:
+                tmp,_, losses = inference(conf_tmp)
             if tmp is not None:
                 tmp['model'] = f'{conf_tmp.model.type}_{conf_tmp.ts.name}_{conf_tmp.ts.version}'
-                predictions['model'] = f'{conf_tmp.model.type}_{conf_tmp.ts.name}_{conf_tmp.ts.version}'
+                stores.add(store.path)
                 if losses is not None:
                     losses['epoch'] = list(range(losses.shape[0]))
                     losses = losses.melt(id_vars='epoch')
                     losses['model'] = f'{conf_tmp.model.type}_{conf_tmp.ts.name}_{conf_tmp.ts.version}'
+                    losses.value = np.log(losses.value)
+                    tot_losses.append(losses)
                 else:
                     beauty_string(f'Can not load losses {conf_tmp.model.type}_{conf_tmp.ts.name}_{conf_tmp.ts.version} maybe the train procedure is not completed','block',True)
                     beauty_string(f'ERROR:{traceback.format_exc()}','block',True)
 
-                losses.value = np.log(losses.value)
                 res.append(tmp )
-                tot_losses.append(losses)
-                tot_predictions.append(predictions)
             else:
                 beauty_string(f'Can not load model {conf_tmp.model.type}_{conf_tmp.ts.name}_{conf_tmp.ts.version} check function inference and load_model','',True)
 
@@ -80,7 +94,6 @@ def compare(conf:DictConfig)-> None:
             pass
 
     tot_losses = pd.concat(tot_losses,ignore_index=True)
-    tot_predictions = pd.concat(tot_predictions,ignore_index=True)
 
     res = pd.concat(res,ignore_index=True)
     res.MAPE = np.round(res.MAPE/100,4)
@@ -127,7 +140,10 @@ def compare(conf:DictConfig)-> None:
     '''
     tot_losses.to_csv(os.path.join(conf.dirpath,'csv',f'{conf.name}_{conf.set}_LOSSES.csv'))
     res.to_csv(os.path.join(conf.dirpath,'csv',f'{conf.name}_{conf.set}_errors.csv'))
-    tot_predictions.to_csv(os.path.join(conf.dirpath,'csv',f'{conf.name}_{conf.set}_tot_predictions.csv'))
+    ##the predictions are not collected anymore, use PredictionStore(path).query(models=...,sets=[conf.set])
+    beauty_string(f'Predictions available in the prediction stores {sorted(stores)}','info',VERBOSE)
+    for path in sorted(stores):
+        beauty_string(str(prediction_cache(PredictionStore(path))),'info',VERBOSE)
 
 
 
@@ -2,12 +2,15 @@
 import argparse
 import pandas as pd
 from omegaconf import DictConfig, OmegaConf
-from dsipts import TimeSeries, beauty_string, extend_time_df
+from dsipts import TimeSeries, beauty_string, fill_time_holes
+from dsipts.data_structure.prediction_store import PredictionStore, PredictionCache
 import os
-from typing import List
+from typing import List, Tuple
 from datetime import timedelta 
-from utils import mse, mape, load_model
+from utils import load_model, ErrorAccumulator, prediction_key
 VERBOSE = True
+##one cache for each store, the statistics are kept for all the run
+CACHES = {}
 
 def inference_stacked(conf:DictConfig,ts:TimeSeries)->List[pd.DataFrame]:
     predictions = None
@@ -15,7 +18,8 @@ def inference_stacked(conf:DictConfig,ts:TimeSeries)->List[pd.DataFrame]:
         f.inference.set = conf.inference.set
         f.inference.rescaling= conf.stack.rescaling
         f.inference.batch_size= conf.inference.batch_size
-        _,prediction, _ = inference(f)
+        f.inference.from_store = conf.stack.get('from_store',True)
+        prediction = base_predictions(f)
         
         ##this can be more informative but the names are too long
         #prediction['model'] = f'{conf_tmp.model.type}_{conf_tmp.ts.name}_{conf_tmp.ts.version}'
@@ -38,7 +42,7 @@ def inference_stacked(conf:DictConfig,ts:TimeSeries)->List[pd.DataFrame]:
 
     freq = prediction[prediction.lag==1].sort_values(by='time').time.diff()[1:].min()
 
-    predictions = extend_time_df(predictions,freq,group='lag',global_minmax=True).merge(predictions,how='left')
+    predictions = fill_time_holes(predictions,freq,group='lag',global_minmax=True)
     predictions['prediction_time'] = predictions.apply(lambda x: x.time-timedelta(seconds= x.lag*freq.seconds), axis=1)
 
     predictions['lag_m'] = predictions.lag.values
@@ -55,6 +59,50 @@ def inference_stacked(conf:DictConfig,ts:TimeSeries)->List[pd.DataFrame]:
     return res
 
 
+def store_entry(conf:DictConfig)->Tuple[PredictionStore,List[str]]:
+    """Prediction store and entry (model, version, set) where the predictions of a configuration are saved.
+    The store is in `inference.store_path` (default `inference.output_path/predictions`), the predictions not rescaled are saved in the set `{set}_scaled`
+
+    Args:
+        conf (DictConfig): inference configuration
+
+    Returns:
+        Tuple[PredictionStore,List[str]]: the store and the entry
+    """
+    store = PredictionStore(conf.inference.get('store_path',os.path.join(conf.inference.output_path,'predictions')))
+    set_name = conf.inference.set if conf.inference.rescaling else f'{conf.inference.set}_scaled'
+    return store, [f'{conf.model.type}_{conf.ts.name}',str(conf.ts.version),set_name]
+
+
+def prediction_cache(store:PredictionStore)->PredictionCache:
+    if store.path not in CACHES:
+        CACHES[store.path] = PredictionCache(store)
+    return CACHES[store.path]
+
+
+def base_predictions(conf:DictConfig)->pd.DataFrame:
+    """Predictions of a model used by the stacking. If `inference.from_store` is True (default) they are read from the prediction store when the entry has been written with the same configuration, checkpoints, set and rescaling (see `prediction_key`),
+    otherwise the entry is removed and the inference is performed (and saved in the store)
+
+    Args:
+        conf (DictConfig): inference configuration
+
+    Returns:
+        pd.DataFrame: the predictions (None if the model can not be loaded)
+    """
+    store, entry = store_entry(conf)
+    cache = prediction_cache(store)
+    res = cache.get(entry,prediction_key(conf)) if conf.inference.get('from_store',True) else None
+    if res is None:
+        _,res,_ = inference(conf)
+        if isinstance(res,str):
+            res = store.query(*[[e] for e in entry]).drop(columns=store.levels)
+    else:
+        beauty_string(f'Predictions of {entry} read from {store.path}','info',VERBOSE)
+    beauty_string(str(cache),'info',VERBOSE)
+    return res
+
+
 def inference(conf:DictConfig)->List[pd.DataFrame]:
     """Make inference on a selected set starting from a configuration file
 
@@ -64,7 +112,7 @@ def inference(conf:DictConfig)->List[pd.DataFrame]:
     Returns:
         List[pd.DataFrame]:  3 dataframes:
             errors : containing the errors
-            res : containing the predictions
+            res : containing the predictions (the folder of the entry in the prediction store if `inference.chunk_size` is set)
             losses : containing the losses during the train
     """
 
@@ -85,29 +133,34 @@ def inference(conf:DictConfig)->List[pd.DataFrame]:
     loaded = load_model(ts,conf)
     if loaded:
         beauty_string('Model successfully loaded','block',VERBOSE)
+        if conf.get('dataset_cache',None) is not None:
+            ts.set_dataset_cache(**conf.dataset_cache)
     else:
         beauty_string('Model NOT loaded','block',True)
         return None, None, None
 
+    ##the predictions are saved in the prediction store (see store_entry) while computing the errors
+    store, entry = store_entry(conf)
+    accumulator = ErrorAccumulator()
     if ts.stacked:
         res = inference_stacked(conf,ts)
+        chunks = [res]
+    elif conf.inference.get('chunk_size',None) is not None:
+        res = store.entry_path(*entry)
+        chunks = ts.iter_inference(batch_size = conf.inference.batch_size,
+                                   num_workers = conf.inference.num_workers,
+                                   set = conf.inference.set,
+                                   rescaling = conf.inference.rescaling,
+                                   chunk_size = conf.inference.chunk_size)
     else:
         res = ts.inference_on_set(batch_size = conf.inference.batch_size,
                                 num_workers = conf.inference.num_workers,
                                 set = conf.inference.set,
                                 rescaling =conf.inference.rescaling)
-
-    errors = []
-    feat = '_median' if ts.model.use_quantiles else '_pred'
-    for c in ts.target_variables:
-        
-        tmp = res.groupby('lag').apply(lambda x: mse(x[f'{c}{feat}'].values,x[c].values)).reset_index().rename(columns={0:'MSE'})
-        tmp['variable'] = c
-        
-        tmp2 = res.groupby('lag').apply(lambda x: mape(x[f'{c}{feat}'].values,x[c].values)).reset_index().rename(columns={0:'MAPE'})
-        tmp2['variable'] = c
-        errors.append(pd.merge(tmp,tmp2))
-    errors = pd.concat(errors,ignore_index=True)
+        chunks = [res]
+    rows = store.write(map(accumulator.update,chunks),*entry,key=prediction_key(conf))
+    beauty_string(f'{rows} predictions saved in {store.entry_path(*entry)}','info',VERBOSE)
+    errors = accumulator.errors()
     beauty_string(errors,'',VERBOSE)
 
     if not os.path.exists(os.path.join(conf.inference.output_path,'csv')):
@@ -50,6 +50,8 @@ def train(conf: DictConfig) -> None:
         beauty_string(f"LOADING {conf.dataset.dataset} ERROR {traceback.format_exc()}",'', True)
 
     ts.set_verbose(VERBOSE)
+    if conf.get('dataset_cache',None) is not None:
+        ts.set_dataset_cache(**conf.dataset_cache)
     ######################################################################################################
     ts
     check_split_parameters(conf)
@@ -72,7 +74,7 @@ def train(conf: DictConfig) -> None:
     beauty_string(f'Model and weights will be placed and read from {dirpath}','info', VERBOSE)
     
     retrain = True
-    if os.path.exists(os.path.join(dirpath,'model.pkl')):
+    if os.path.exists(os.path.join(dirpath,'model')) or os.path.exists(os.path.join(dirpath,'model.pkl')):
         if conf.model.get('retrain',False):
             pass
         else:
@@ -101,7 +103,7 @@ def train(conf: DictConfig) -> None:
     ts.dirpath = dirpath    
     ts.losses = None
     ts.checkpoint_file_last = os.path.join(dirpath,'checkpoint.ckpt')
-    ts.save(os.path.join(conf.train_config.dirpath,'model'))
+    ts.save(os.path.join(conf.train_config.dirpath,'model'),format='dir')
 
     ##save the config for the comparison task before training so we can get predictions during the training procedure
     path =  HydraConfig.get()['runtime']['config_sources'][1]['path']
@@ -117,7 +119,7 @@ def train(conf: DictConfig) -> None:
         ok = False
         
     if ok:
-        ts.save(os.path.join(conf.train_config.dirpath,'model'))
+        ts.save(os.path.join(conf.train_config.dirpath,'model'),format='dir')
         with open(os.path.join(used_config,selection+'.yaml'),'w') as f:
             f.write(OmegaConf.to_yaml(conf))
         beauty_string(f'FINISH TRAINING PROCEDURE in {(time.time()-tot_seconds)/60} with loss = {valid_loss}','block', VERBOSE)
@@ -1,14 +1,14 @@
 
 
 import pandas as pd
-from dsipts import TimeSeries, beauty_string,extend_time_df
+from dsipts import TimeSeries, beauty_string,fill_time_holes
 from omegaconf import DictConfig, OmegaConf,ListConfig
 from hydra.core.hydra_config import HydraConfig
 import hydra
 import os
 import shutil
 import logging
-from inference import inference
+from inference import base_predictions, CACHES
 from datetime import timedelta
 from utils import select_model
 
@@ -70,13 +70,14 @@ def train_stack(conf: DictConfig) -> None:
         conf_tmp.inference.set = conf.stack.set
         conf_tmp.inference.rescaling = conf.stack.rescaling
         conf_tmp.inference.batch_size = conf.stack.get('batch_size',conf_tmp.inference.batch_size)
+        conf_tmp.inference.from_store = conf.stack.get('from_store',True)
         beauty_string(f'PROCESSING {conf_tmp.model.type}_{conf_tmp.ts.name}_{conf_tmp.ts.version} ','block',VERBOSE)
 
 
 
         try:
             
-            _,prediction, _ = inference(conf_tmp)
+            prediction = base_predictions(conf_tmp)
             
             ##this can be more informative but the names are too long
             #prediction['model'] = f'{conf_tmp.model.type}_{conf_tmp.ts.name}_{conf_tmp.ts.version}'
@@ -113,6 +114,8 @@ def train_stack(conf: DictConfig) -> None:
     
     
     beauty_string(f'USING {N_models} models','section',VERBOSE)
+    for cache in CACHES.values():
+        beauty_string(str(cache),'info',VERBOSE)
 
     
     model_conf = conf.model_configs
@@ -125,7 +128,7 @@ def train_stack(conf: DictConfig) -> None:
     freq = prediction[prediction.lag==1].sort_values(by='time').time.diff()[1:].min()
 
     predictions['prediction_time'] = predictions.apply(lambda x: x.time-timedelta(seconds= x.lag*freq.seconds), axis=1)
-    predictions = extend_time_df(predictions,freq,group='lag',global_minmax=True).merge(predictions,how='left')
+    predictions = fill_time_holes(predictions,freq,group='lag',global_minmax=True)
     predictions['lag_m'] = predictions.lag.values
     silly_model = conf.ts.get('silly',False)
     ts.load_signal(predictions, 
@@ -153,7 +156,7 @@ def train_stack(conf: DictConfig) -> None:
     beauty_string(f'Model and weights will be placed and read from {dirpath}','info',VERBOSE)
     retrain = True
     ##if there is a model file look if you want to retrain it
-    if os.path.exists(os.path.join(dirpath,'model.pkl')):
+    if os.path.exists(os.path.join(dirpath,'model')) or os.path.exists(os.path.join(dirpath,'model.pkl')):
         if conf.model.get('retrain',False):
             pass
         else:
@@ -188,7 +191,7 @@ def train_stack(conf: DictConfig) -> None:
     ts.dirpath = dirpath    
     ts.losses = None
     ts.checkpoint_file_last = os.path.join(dirpath,'checkpoint.ckpt')
-    ts.save(os.path.join(conf.train_config.dirpath,'model'))
+    ts.save(os.path.join(conf.train_config.dirpath,'model'),format='dir')
 
     ##save the config for the comparison task before training so we can get predictions during the training procedure
     path =  HydraConfig.get()['runtime']['config_sources'][1]['path']
@@ -199,7 +202,7 @@ def train_stack(conf: DictConfig) -> None:
         f.write(OmegaConf.to_yaml(conf))
 
     valid_loss = ts.train_model(split_params=split_params,**conf.train_config)
-    ts.save(os.path.join(conf.train_config.dirpath,'model'))
+    ts.save(os.path.join(conf.train_config.dirpath,'model'),format='dir')
     beauty_string(f'FINISH TRAINING PROCEDURE with loss = {valid_loss}','block',VERBOSE)
     
     return valid_loss 
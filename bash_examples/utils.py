@@ -1,7 +1,12 @@
-from dsipts import RNN, LinearTS, Persistent, D3VAE, DilatedConv, TFT, Informer,VVA,VQVAEA,CrossFormer,Autoformer,PatchTST,Diffusion,DilatedConvED,TIDE,ITransformer,beauty_string
+from dsipts import beauty_string
+from dsipts.models import get_model
 import numpy as np
+import pandas as pd
 from sklearn.metrics import mean_squared_error
 import os
+import json
+import hashlib
+from omegaconf import DictConfig, OmegaConf
 def rmse(x:np.array,y:np.array)->float:
     """custom RMSE avoinding nan
 
@@ -50,80 +55,94 @@ def mape(x:np.array,y:np.array)->float:
     return np.nanmean(res)
 
 
+def prediction_key(conf:DictConfig)->dict:
+    """Key identifying the predictions of a configuration: hash of the configuration (without the parameters not changing the predictions), size and modification time of the checkpoints and of the saved model, set and rescaling
+
+    Args:
+        conf (DictConfig): inference configuration
+
+    Returns:
+        dict: the key
+    """
+    tmp = OmegaConf.to_container(conf,resolve=True)
+    tmp.pop('dataset_cache',None)
+    for k in ['batch_size','num_workers','from_store','store_path','chunk_size','output_path']:
+        tmp.get('inference',{}).pop(k,None)
+    checkpoints = {}
+    dirpath = conf.train_config.dirpath
+    if os.path.isdir(dirpath):
+        for f in sorted(os.listdir(dirpath)):
+            if f.endswith('.ckpt') or f in ['model.pkl','model']:
+                stat = os.stat(os.path.join(dirpath,f))
+                checkpoints[f] = [stat.st_size,stat.st_mtime_ns]
+    return {'config':hashlib.sha1(json.dumps(tmp,sort_keys=True,default=str).encode()).hexdigest(),
+            'checkpoints':checkpoints,
+            'set':conf.inference.set,
+            'rescaling':bool(conf.inference.rescaling)}
+
+
+class ErrorAccumulator():
+    def __init__(self):
+        """Compute MSE and MAPE per lag and variable (as `mse` and `mape`) on predictions arriving in blocks, only the sums by lag are kept
+        """
+        self.sums = []
+
+    def update(self,chunk:pd.DataFrame)->pd.DataFrame:
+        """Add a block of predictions in the long format, the targets are the columns with a `_median` or `_pred` companion
+
+        Args:
+            chunk (pd.DataFrame): the block
+
+        Returns:
+            pd.DataFrame: the same block, so it can be used inside a generator
+        """
+        for c in chunk.columns:
+            for feat in ['_median','_pred']:
+                if c.endswith(feat) and c[:-len(feat)] in chunk.columns:
+                    x = chunk[c].values.astype(float)
+                    y = chunk[c[:-len(feat)]].values.astype(float)
+                    valid = ~np.isnan(x*y)
+                    with np.errstate(divide='ignore',invalid='ignore'):
+                        ape = 100*np.abs((x-y)/y)
+                    finite = valid & np.isfinite(ape)
+                    tmp = pd.DataFrame({'lag':np.asarray(chunk.lag.values,dtype=int),
+                                        'se':np.where(valid,(x-y)**2,0),'n':valid,
+                                        'ape':np.where(finite,ape,0),'n_ape':finite}).groupby('lag').sum().reset_index()
+                    tmp['variable'] = c[:-len(feat)]
+                    self.sums.append(tmp)
+        return chunk
+
+    def errors(self)->pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: MSE and MAPE for each lag and variable
+        """
+        if len(self.sums)==0:
+            return pd.DataFrame(columns=['lag','MSE','variable','MAPE'])
+        errors = pd.concat(self.sums,ignore_index=True).groupby(['variable','lag']).sum().reset_index()
+        errors['MSE'] = errors.se/errors.n
+        errors['MAPE'] = errors.ape/errors.n_ape
+        return errors[['lag','MSE','variable','MAPE']]
+
+
 def select_model(conf, model_conf,ts):
-    
-    if conf.model.type == 'linear':
-        model =  LinearTS(**model_conf,
-                          optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )
-        
-    elif conf.model.type == 'rnn':
-        model =  RNN(**model_conf,
-                          optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )  
-        
-    elif conf.model.type == 'dilated_conv':
-        model =  DilatedConv(**model_conf,
-                          optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )      
-    
-    elif conf.model.type == 'persistent':
+    ##only the module of the selected architecture is imported (see dsipts.models.MODELS)
+    try:
+        model_class = get_model(conf.model.type)
+    except KeyError:
+        beauty_string(f"Not a valid model { conf.model.type}-{conf.ts.name}-{conf.ts.version}",'block',ts.verbose)
+        return None
+
+    if conf.model.type == 'persistent':
         model_conf = {'future_steps':model_conf['future_steps'],
                       'past_steps':model_conf['past_steps']}
-        model =  Persistent(**model_conf,
-                          optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )
-    elif conf.model.type == 'd3vae':
-
-        model =  D3VAE(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose ) 
-         
-    elif conf.model.type == 'tft':
-        model =  TFT(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )  
-        
-        
-    elif conf.model.type == 'vva':
-        model =  VVA(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )  
-    elif conf.model.type == 'vqvae':
-        model =  VQVAEA(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )  
-    elif conf.model.type == 'crossformer':
-        model =  CrossFormer(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )   
-    elif conf.model.type == 'informer':
+    elif conf.model.type in ['informer','autoformer']:
         ##gli servono, poi mette a 0 quelle che serve
         ts.future_variables +=ts.target_variables
         model_conf['future_channels']= len(ts.future_variables)
-        model =  Informer(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )  
-    elif conf.model.type == 'autoformer':
-        ##gli servono, poi mette a 0 quelle che serve
-        ts.future_variables +=ts.target_variables
-        model_conf['future_channels']= len(ts.future_variables)
-        model =  Autoformer(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )  
-        
-    elif conf.model.type == 'patchtst':
-        model =  PatchTST(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )  
-    elif conf.model.type == 'diffusion':
-        model =  Diffusion(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )  
-    elif conf.model.type == 'dilated_conv_ed':
-        model =  DilatedConvED(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )  
-    elif conf.model.type == 'tide':
-        model =  TIDE(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )  
-    elif conf.model.type == 'itransformer':
-        model =  ITransformer(**model_conf,   optim_config = conf.optim_config,
-                          scheduler_config =conf.scheduler_config,verbose=ts.verbose )  
-    else:
-        model = None
-        beauty_string(f"Not a valid model { conf.model.type}-{conf.ts.name}-{conf.ts.version}",'block',ts.verbose)
-        
+    model =  model_class(**model_conf,
+                         optim_config = conf.optim_config,
+                         scheduler_config =conf.scheduler_config,verbose=ts.verbose )
     return model
 
 def check_split_parameters(conf):
@@ -133,40 +152,10 @@ def check_split_parameters(conf):
 
 
 def load_model(ts,conf):
-    loaded = True
-    if conf.model.type == 'linear':
-        ts.load(LinearTS,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'rnn':
-        ts.load(RNN,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'persistent':
-        ts.load(Persistent,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'd3vae':
-        ts.load(D3VAE,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'dilated_conv':
-        ts.load(DilatedConv,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'tft':
-        ts.load(TFT,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'informer':
-        ts.load(Informer,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'vva':
-        ts.load(VVA,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'vqvae':
-        ts.load(VQVAEA,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'crossformer':
-        ts.load(CrossFormer,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'autoformer':
-        ts.load(Autoformer,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'patchtst':
-        ts.load(PatchTST,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'diffusion':
-        ts.load(Diffusion,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)  
-    elif conf.model.type == 'dilated_conv_ed':
-        ts.load(DilatedConvED,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'tide':
-        ts.load(TIDE,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    elif conf.model.type == 'itransformer':
-        ts.load(ITransformer,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
-    else:
+    try:
+        model_class = get_model(conf.model.type)
+    except KeyError:
         beauty_string('NO VALID MODEL FOUND','block',ts.verbose)
-        loaded=False
-    return loaded
\ No newline at end of file
+        return False
+    ts.load(model_class,os.path.join(conf.train_config.dirpath,'model'),load_last=conf.inference.load_last)
+    return True
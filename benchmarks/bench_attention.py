@@ -0,0 +1,83 @@
+"""Benchmark of the attention backends (see `dsipts.models.attention`): `math` (explicit computation, previous behaviour) against `sdpa`
+(`torch.nn.functional.scaled_dot_product_attention`) for increasing sequence length on the CPU. Causal self attention in training (forward and backward)
+and in inference (forward without gradients), each case runs in a new process and the peak RSS is measured from the creation of the inputs.
+On the CPU the fused kernel does not support the dropout on the attention weights, with `--dropout` greater than 0 pytorch falls back to its own explicit computation in training.
+
+Usage:
+    python benchmarks/bench_attention.py --lengths 96 192 336 720 --batch_size 32 --heads 8 --dim 32
+"""
+import argparse
+import sys
+import json
+import time
+import resource
+import subprocess
+
+
+def peak_rss(reset=False):
+    ##peak RSS in MB, on linux the peak can be reset (otherwise it includes the imports)
+    try:
+        if reset:
+            with open('/proc/self/clear_refs','w') as f:
+                f.write('5')
+        with open('/proc/self/status','r') as f:
+            return [int(l.split()[1])/1024 for l in f if l.startswith('VmHWM')][0]
+    except Exception as _:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def step(q,k,v,backend,training,dropout):
+    import torch
+    from dsipts.models.attention import scaled_dot_product_attention
+    if training:
+        out,_ = scaled_dot_product_attention(q,k,v,is_causal=True,dropout_p=dropout,training=True,backend=backend)
+        out.sum().backward()
+        q.grad = k.grad = v.grad = None
+    else:
+        with torch.no_grad():
+            out,_ = scaled_dot_product_attention(q,k,v,is_causal=True,backend=backend)
+
+
+def measure(backend,mode,length,batch_size,heads,dim,dropout,repeat):
+    import torch
+    torch.manual_seed(0)
+    q,k,v = [torch.randn(batch_size,heads,length,dim,requires_grad=mode=='train') for _ in range(3)]
+    ##warm up
+    step(q,k,v,backend,mode=='train',dropout)
+    baseline = peak_rss(reset=True)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        step(q,k,v,backend,mode=='train',dropout)
+    elapsed = (time.perf_counter()-start)/repeat
+    peak = peak_rss()
+    print(json.dumps({'backend':backend,'mode':mode,'length':length,'ms':elapsed*1000,'peak_mb':peak-baseline}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark attention backends")
+    parser.add_argument("--lengths", type=int, nargs='+', default=[96,192,336,720])
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--heads", type=int, default=8)
+    parser.add_argument("--dim", type=int, default=32)
+    parser.add_argument("--dropout", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--measure", type=str, default=None)
+    parser.add_argument("--mode", type=str, default='train')
+    parser.add_argument("--length", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        measure(args.measure,args.mode,args.length,args.batch_size,args.heads,args.dim,args.dropout,args.repeat)
+        sys.exit(0)
+    print(f'{"mode":>6} {"length":>8} {"backend":>8} {"ms":>10} {"peak RSS MB":>12}')
+    for mode in ['train','eval']:
+        for length in args.lengths:
+            for backend in ['math','sdpa']:
+                out = subprocess.run([sys.executable,__file__,'--measure',backend,'--mode',mode,'--length',str(length),'--batch_size',str(args.batch_size),
+                                      '--heads',str(args.heads),'--dim',str(args.dim),'--dropout',str(args.dropout),'--repeat',str(args.repeat)],capture_output=True,text=True)
+                if out.returncode!=0:
+                    ##usually out of memory
+                    print(f'{mode:>6} {length:>8} {backend:>8} {"failed":>10}')
+                    continue
+                res = json.loads(out.stdout.strip().split('\n')[-1])
+                print(f'{mode:>6} {length:>8} {backend:>8} {res["ms"]:10.1f} {res["peak_mb"]:12.0f}')
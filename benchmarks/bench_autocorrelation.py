@@ -0,0 +1,81 @@
+"""Benchmark of the AutoCorrelation block of Autoformer (`dsipts.models.autoformer.layers.AutoCorrelationLayer`) with ETTh1 sized configurations
+(d_model 512, 8 heads, batch 32, 7 channels embedded): training (forward and backward, `time_delay_agg_training`) and inference
+(forward without gradients, `time_delay_agg_inference`) for some input lengths on the CPU.
+Each case runs in a new process and the peak RSS is measured from the creation of the inputs.
+
+Usage:
+    python benchmarks/bench_autocorrelation.py --lengths 96 192 336 720 --batch_size 32 --d_model 512 --heads 8 --factor 3
+"""
+import argparse
+import sys
+import json
+import time
+import resource
+import subprocess
+
+
+def peak_rss(reset=False):
+    ##peak RSS in MB, on linux the peak can be reset (otherwise it includes the imports)
+    try:
+        if reset:
+            with open('/proc/self/clear_refs','w') as f:
+                f.write('5')
+        with open('/proc/self/status','r') as f:
+            return [int(l.split()[1])/1024 for l in f if l.startswith('VmHWM')][0]
+    except Exception as _:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def measure(mode,length,batch_size,d_model,heads,factor,repeat):
+    import torch
+    from dsipts.models.autoformer.layers import AutoCorrelation, AutoCorrelationLayer
+    torch.manual_seed(0)
+    layer = AutoCorrelationLayer(AutoCorrelation(False,factor,attention_dropout=0.0),d_model,heads)
+    layer.train(mode=='train')
+    x = torch.randn(batch_size,length,d_model,requires_grad=mode=='train')
+    def step():
+        if mode=='train':
+            out,_ = layer(x,x,x,None)
+            out.sum().backward()
+            x.grad = None
+            layer.zero_grad(set_to_none=True)
+        else:
+            with torch.no_grad():
+                out,_ = layer(x,x,x,None)
+    ##the freed memory is not always returned to the system, the peak is measured from before the first step
+    baseline = peak_rss(reset=True)
+    step()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        step()
+    elapsed = (time.perf_counter()-start)/repeat
+    peak = peak_rss()
+    print(json.dumps({'mode':mode,'length':length,'ms':elapsed*1000,'peak_mb':peak-baseline}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark AutoCorrelation")
+    parser.add_argument("--lengths", type=int, nargs='+', default=[96,192,336,720])
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--d_model", type=int, default=512)
+    parser.add_argument("--heads", type=int, default=8)
+    parser.add_argument("--factor", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--measure", type=str, default=None)
+    parser.add_argument("--length", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        measure(args.measure,args.length,args.batch_size,args.d_model,args.heads,args.factor,args.repeat)
+        sys.exit(0)
+    print(f'{"mode":>6} {"length":>8} {"ms":>10} {"peak RSS MB":>12}')
+    for mode in ['train','eval']:
+        for length in args.lengths:
+            out = subprocess.run([sys.executable,__file__,'--measure',mode,'--length',str(length),'--batch_size',str(args.batch_size),'--d_model',str(args.d_model),
+                                  '--heads',str(args.heads),'--factor',str(args.factor),'--repeat',str(args.repeat)],capture_output=True,text=True)
+            if out.returncode!=0:
+                ##usually out of memory
+                print(f'{mode:>6} {length:>8} {"failed":>10}')
+                continue
+            res = json.loads(out.stdout.strip().split('\n')[-1])
+            print(f'{mode:>6} {length:>8} {res["ms"]:10.1f} {res["peak_mb"]:12.0f}')
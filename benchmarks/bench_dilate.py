@@ -0,0 +1,81 @@
+"""Benchmark of the DILATE loss (`loss_type='dilated'`, see `dsipts.models.base.dilate_loss`): forward and backward of the loss with one call for each channel
+(`channel`, as the loss was computed before) against a single call for all the channels (`batched`) for some output lengths.
+On the CPU the soft-DTW and the path kernels run in parallel on the samples with numba (set `NUMBA_NUM_THREADS` to limit the threads),
+on the other devices (`--device cuda`) with an anti-diagonal wavefront in torch. The first call compiles the numba kernels (cached in `__pycache__`), it is excluded from the timings.
+Each case runs in a new process and the peak RSS is measured from the creation of the inputs.
+
+Usage:
+    python benchmarks/bench_dilate.py --lengths 24 48 96 --batch_size 32 --channels 3
+"""
+import argparse
+import sys
+import json
+import time
+import resource
+import subprocess
+
+
+def peak_rss(reset=False):
+    ##peak RSS in MB, on linux the peak can be reset (otherwise it includes the imports)
+    try:
+        if reset:
+            with open('/proc/self/clear_refs','w') as f:
+                f.write('5')
+        with open('/proc/self/status','r') as f:
+            return [int(l.split()[1])/1024 for l in f if l.startswith('VmHWM')][0]
+    except Exception as _:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def measure(case,length,batch_size,channels,device,repeat):
+    import torch
+    from dsipts.models.base import dilate_loss
+    torch.manual_seed(0)
+    y = torch.randn(batch_size,length,channels,device=device)
+    x = torch.randn(batch_size,length,channels,device=device,requires_grad=True)
+    def step():
+        if case=='channel':
+            loss = 0
+            for i in range(channels):
+                loss+= dilate_loss(y[:,:,i:i+1],x[:,:,i:i+1],0.5,0.01)
+        else:
+            loss = dilate_loss(y,x,0.5,0.01)
+        loss.backward()
+        x.grad = None
+        if x.device.type=='cuda':
+            torch.cuda.synchronize()
+    ##warm up (and compilation of the kernels)
+    step()
+    baseline = peak_rss(reset=True)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        step()
+    elapsed = (time.perf_counter()-start)/repeat
+    peak = peak_rss()
+    print(json.dumps({'case':case,'length':length,'ms':elapsed*1000,'peak_mb':peak-baseline}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark DILATE loss")
+    parser.add_argument("--lengths", type=int, nargs='+', default=[24,48,96])
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--channels", type=int, default=3)
+    parser.add_argument("--device", type=str, default='cpu')
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--measure", type=str, default=None)
+    parser.add_argument("--length", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        measure(args.measure,args.length,args.batch_size,args.channels,args.device,args.repeat)
+        sys.exit(0)
+    print(f'{"length":>8} {"case":>8} {"ms":>10} {"peak RSS MB":>12}')
+    for length in args.lengths:
+        for case in ['channel','batched']:
+            out = subprocess.run([sys.executable,__file__,'--measure',case,'--length',str(length),'--batch_size',str(args.batch_size),'--channels',str(args.channels),
+                                  '--device',args.device,'--repeat',str(args.repeat)],capture_output=True,text=True)
+            if out.returncode!=0:
+                print(f'{length:>8} {case:>8} {"failed":>10}')
+                continue
+            res = json.loads(out.stdout.strip().split('\n')[-1])
+            print(f'{length:>8} {case:>8} {res["ms"]:10.1f} {res["peak_mb"]:12.0f}')
@@ -0,0 +1,95 @@
+"""Benchmark of the loading of a trained model: `load_from_checkpoint` on the lightning checkpoint (previous behaviour) against `TimeSeries.load`
+with the pickle file, the folder format and the weights exported in float16. Each case runs in a new process, the peak RSS is measured from the end of the imports.
+
+Usage:
+    python benchmarks/bench_load.py --hidden 1024 --layers 4
+"""
+import argparse
+import os
+import sys
+import json
+import time
+import resource
+import subprocess
+import tempfile
+import numpy as np
+import pandas as pd
+
+
+def model_conf(ts,hidden,layers):
+    return dict(past_steps=24,future_steps=6,past_channels=len(ts.past_variables),future_channels=0,embs=[ts.dataset[c].nunique() for c in ts.cat_var],
+                out_channels=1,cat_emb_dim=4,hidden_RNN=hidden,num_layers_RNN=layers,kind='gru',kernel_size=3,sum_emb=True,quantiles=[],dropout_rate=0.1)
+
+
+def build(folder,hidden,layers):
+    from dsipts import TimeSeries, RNN
+    rng = np.random.default_rng(42)
+    length = 2000
+    data = pd.DataFrame({'time':pd.date_range('2020-01-01',periods=length,freq='h'),'y':rng.normal(size=length),'x':rng.normal(size=length)})
+    ts = TimeSeries('bench')
+    ts.set_verbose(False)
+    ts.load_signal(data,past_variables=['x'],target_variables=['y'],enrich_cat=['hour'])
+    conf = model_conf(ts,hidden,layers)
+    ts.set_model(RNN(**conf,optim_config={'lr':1e-4},scheduler_config=None,verbose=False),config=dict(model_configs=conf,optim_config={'lr':1e-4},scheduler_config=None))
+    os.makedirs(os.path.join(folder,'weights'))
+    ts.train_model(os.path.join(folder,'weights'),dict(past_steps=24,future_steps=6,perc_train=0.6,perc_valid=0.2),batch_size=128,num_workers=0,max_epochs=1,auto_lr_find=False)
+    ts.save(os.path.join(folder,'model'))
+    ts.save(os.path.join(folder,'model_dir'),format='dir')
+    ts.save(os.path.join(folder,'model_fp16'),format='dir',weights_dtype='float16')
+    return ts
+
+
+def peak_rss(reset=False):
+    ##peak RSS in MB, on linux the peak can be reset (otherwise it includes the imports)
+    try:
+        if reset:
+            with open('/proc/self/clear_refs','w') as f:
+                f.write('5')
+        with open('/proc/self/status','r') as f:
+            return [int(l.split()[1])/1024 for l in f if l.startswith('VmHWM')][0]
+    except Exception as _:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def measure(folder,case):
+    from dsipts import TimeSeries, RNN
+    import torch
+    baseline = peak_rss(reset=True)
+    start = time.perf_counter()
+    ts = TimeSeries('bench')
+    ts.set_verbose(False)
+    if case=='load_from_checkpoint':
+        with open(os.path.join(folder,'model.pkl'),'rb') as f:
+            import pickle
+            params = pickle.load(f)
+        model = RNN(**params['config']['model_configs'],optim_config=params['config']['optim_config'],scheduler_config=params['config']['scheduler_config'],verbose=False)
+        ##torch>=2.6 loads with weights_only=True by default, the hyperparameters need the full unpickler
+        _load = torch.load
+        torch.load = lambda *args,**kwargs: _load(*args,**{**kwargs,'weights_only':False})
+        model = model.load_from_checkpoint(params['checkpoint_file_last'])
+        torch.load = _load
+    else:
+        ts.load(RNN,os.path.join(folder,{'pkl':'model','dir':'model_dir','dir_fp16':'model_fp16'}[case]))
+    elapsed = time.perf_counter()-start
+    peak = peak_rss()
+    print(json.dumps({'case':case,'ms':elapsed*1000,'peak_mb':peak-baseline}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark model loading")
+    parser.add_argument("--hidden", type=int, default=1024)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--measure", type=str, default=None)
+    parser.add_argument("--folder", type=str, default=None)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        measure(args.folder,args.measure)
+        sys.exit(0)
+    folder = tempfile.mkdtemp()
+    ts = build(folder,args.hidden,args.layers)
+    print(f'checkpoint {os.path.getsize(ts.checkpoint_file_last)/1024**2:.1f} MB, weights {os.path.getsize(os.path.join(folder,"model_dir","weights.pt"))/1024**2:.1f} MB, float16 {os.path.getsize(os.path.join(folder,"model_fp16","weights.pt"))/1024**2:.1f} MB')
+    for case in ['load_from_checkpoint','pkl','dir','dir_fp16']:
+        out = subprocess.run([sys.executable,__file__,'--measure',case,'--folder',folder],capture_output=True,text=True)
+        res = json.loads(out.stdout.strip().split('\n')[-1])
+        print(f'{case:>22}: {res["ms"]:8.1f} ms, peak RSS +{res["peak_mb"]:.0f} MB')
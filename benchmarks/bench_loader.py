@@ -0,0 +1,47 @@
+"""Benchmark of the data loading used in `TimeSeries.train_model`: per-sample indexing plus default collate against whole-batch fetching.
+
+Usage:
+    python benchmarks/bench_loader.py --samples 50000 --past_steps 96 --future_steps 24 --batch_size 256
+"""
+import argparse
+import time
+import numpy as np
+from torch.utils.data import DataLoader
+from dsipts.data_structure.utils import MyDataset, batch_data_loader
+
+
+def samples_per_second(loader,epochs):
+    n = 0
+    t0 = time.perf_counter()
+    for _ in range(epochs):
+        for batch in loader:
+            n+=batch['y'].shape[0]
+    return n/(time.perf_counter()-t0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark batch fetching")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--past_steps", type=int, default=96)
+    parser.add_argument("--future_steps", type=int, default=24)
+    parser.add_argument("--batch_size", type=int, default=128)
+    parser.add_argument("--num_workers", type=int, default=0)
+    parser.add_argument("--epochs", type=int, default=2)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    N = args.samples
+    data = {'y':rng.normal(size=(N,args.future_steps,1)).astype(np.float32),
+            'x_num_past':rng.normal(size=(N,args.past_steps,args.channels)).astype(np.float32),
+            'x_num_future':rng.normal(size=(N,args.future_steps,2)).astype(np.float32),
+            'x_cat_past':rng.integers(0,24,size=(N,args.past_steps,2)),
+            'x_cat_future':rng.integers(0,24,size=(N,args.future_steps,2))}
+    dataset = MyDataset(data,np.zeros((N,args.future_steps)),np.zeros(N),[0],None)
+    params = dict(batch_size=args.batch_size,shuffle=True,drop_last=True,num_workers=args.num_workers)
+
+    res = {}
+    for name,loader in [('collate',DataLoader(dataset,**params)),('batch',batch_data_loader(dataset,**params))]:
+        res[name] = samples_per_second(loader,args.epochs)
+        print(f'{name:>12}: {res[name]:.0f} samples/s')
+    print(f'speedup x{res["batch"]/res["collate"]:.1f}')
@@ -0,0 +1,85 @@
+"""Benchmark of the ProbSparse attention of Informer (`dsipts.models.informer.attn.ProbAttention`) against the full attention (`math` and `sdpa` backends)
+for long sequences on the CPU: forward and backward of the encoder self attention (or of the causal decoder self attention with `--causal`).
+Each case runs in a new process and the peak RSS is measured from the creation of the inputs.
+
+Usage:
+    python benchmarks/bench_probattention.py --lengths 336 720 1440 2880 --batch_size 32 --heads 8 --dim 64
+"""
+import argparse
+import sys
+import json
+import time
+import resource
+import subprocess
+
+
+def peak_rss(reset=False):
+    ##peak RSS in MB, on linux the peak can be reset (otherwise it includes the imports)
+    try:
+        if reset:
+            with open('/proc/self/clear_refs','w') as f:
+                f.write('5')
+        with open('/proc/self/status','r') as f:
+            return [int(l.split()[1])/1024 for l in f if l.startswith('VmHWM')][0]
+    except Exception as _:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def get_attention(case,causal,factor):
+    from dsipts.models.informer.attn import ProbAttention, FullAttention
+    if case=='prob':
+        return ProbAttention(causal,factor,attention_dropout=0.0)
+    attention = FullAttention(causal,factor,attention_dropout=0.0)
+    attention.attention_backend = case
+    return attention
+
+
+def measure(case,length,batch_size,heads,dim,factor,causal,repeat):
+    import torch
+    torch.manual_seed(0)
+    attention = get_attention(case,causal,factor)
+    q,k,v = [torch.randn(batch_size,length,heads,dim,requires_grad=True) for _ in range(3)]
+    def step():
+        out,_ = attention(q,k,v,None)
+        out.sum().backward()
+        q.grad = k.grad = v.grad = None
+    ##warm up
+    step()
+    baseline = peak_rss(reset=True)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        step()
+    elapsed = (time.perf_counter()-start)/repeat
+    peak = peak_rss()
+    print(json.dumps({'case':case,'length':length,'ms':elapsed*1000,'peak_mb':peak-baseline}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark ProbSparse attention")
+    parser.add_argument("--lengths", type=int, nargs='+', default=[336,720,1440,2880])
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--heads", type=int, default=8)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--factor", type=int, default=5)
+    parser.add_argument("--causal", action='store_true')
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cases", type=str, nargs='+', default=['prob','math','sdpa'])
+    parser.add_argument("--measure", type=str, default=None)
+    parser.add_argument("--length", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        measure(args.measure,args.length,args.batch_size,args.heads,args.dim,args.factor,args.causal,args.repeat)
+        sys.exit(0)
+    print(f'{"length":>8} {"case":>6} {"ms":>10} {"peak RSS MB":>12}')
+    for length in args.lengths:
+        for case in args.cases:
+            cmd = [sys.executable,__file__,'--measure',case,'--length',str(length),'--batch_size',str(args.batch_size),'--heads',str(args.heads),
+                   '--dim',str(args.dim),'--factor',str(args.factor),'--repeat',str(args.repeat)]
+            out = subprocess.run(cmd+(['--causal'] if args.causal else []),capture_output=True,text=True)
+            if out.returncode!=0:
+                ##usually out of memory
+                print(f'{length:>8} {case:>6} {"failed":>10}')
+                continue
+            res = json.loads(out.stdout.strip().split('\n')[-1])
+            print(f'{length:>8} {case:>6} {res["ms"]:10.1f} {res["peak_mb"]:12.0f}')
@@ -0,0 +1,71 @@
+"""Benchmark of the forecasting latency: one `TimeSeries.inference(data=...)` call per request against the batched `ForecastServer` with concurrent clients.
+
+Usage:
+    python benchmarks/bench_serving.py --groups 20 --requests 200 --clients 16 --max_latency_ms 5
+"""
+import argparse
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from dsipts import TimeSeries, LinearTS
+from dsipts.serving import ForecastServer
+
+
+def build(groups,length,past_steps,future_steps):
+    rng = np.random.default_rng(42)
+    t = pd.date_range('2020-01-01',periods=length,freq='h')
+    data = pd.concat([pd.DataFrame({'time':t,'y':rng.normal(size=length)+g,'x':rng.normal(size=length),'region':f'g{g}'}) for g in range(groups)],ignore_index=True)
+    ts = TimeSeries('bench')
+    ts.set_verbose(False)
+    ts.load_signal(data,past_variables=['x'],target_variables=['y'],enrich_cat=['hour'],group='region')
+    model_conf = dict(past_steps=past_steps,future_steps=future_steps,past_channels=len(ts.past_variables),future_channels=0,
+                      embs=[ts.dataset[c].nunique() for c in ts.cat_var],out_channels=1,cat_emb_dim=4,hidden_size=16,kernel_size=3,
+                      sum_emb=True,kind='linear',quantiles=[],activation='torch.nn.ReLU')
+    ts.set_model(LinearTS(**model_conf,optim_config={'lr':1e-3},scheduler_config=None,verbose=False),config=dict(model_configs=model_conf))
+    ts.train_model(tempfile.mkdtemp(),dict(past_steps=past_steps,future_steps=future_steps,perc_train=0.6,perc_valid=0.2),
+                   batch_size=256,num_workers=0,max_epochs=1,auto_lr_find=False)
+    return ts,data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark forecasting latency")
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--length", type=int, default=2000)
+    parser.add_argument("--past_steps", type=int, default=48)
+    parser.add_argument("--future_steps", type=int, default=12)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--max_batch_size", type=int, default=64)
+    parser.add_argument("--max_latency_ms", type=float, default=5)
+    args = parser.parse_args()
+
+    ts,data = build(args.groups,args.length,args.past_steps,args.future_steps)
+    rng = np.random.default_rng(0)
+    histories = []
+    for _ in range(args.requests):
+        g = f'g{rng.integers(args.groups)}'
+        end = rng.integers(args.past_steps,args.length-args.future_steps)
+        histories.append(data[data.region==g].iloc[end-args.past_steps:end])
+
+    latencies = []
+    for h in histories[:min(20,len(histories))]:
+        ##inference needs also the target window, the rows of the future are added
+        window = data[(data.region==h.region.values[0])&(data.time>=h.time.min())].iloc[:args.past_steps+args.future_steps+1]
+        t0 = time.perf_counter()
+        ts.inference(batch_size=1,num_workers=0,data=window)
+        latencies.append(time.perf_counter()-t0)
+    print(f'  inference: p50 {np.percentile(latencies,50)*1000:.1f} ms per request')
+
+    with ForecastServer(ts,max_batch_size=args.max_batch_size,max_latency_ms=args.max_latency_ms) as server:
+        server.forecast_many(histories[:10])
+        server.latencies.clear()
+        server.batch_sizes.clear()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            list(pool.map(server.forecast,histories))
+        elapsed = time.perf_counter()-t0
+        stats = server.stats()
+    print(f'     server: p50 {stats["p50_ms"]:.1f} ms, p99 {stats["p99_ms"]:.1f} ms, {args.requests/elapsed:.0f} requests/s, {stats["batches"]} batches')
+    print(f'batch sizes: {stats["batch_sizes"]}')
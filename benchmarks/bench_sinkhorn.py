@@ -0,0 +1,91 @@
+"""Benchmark of the Sinkhorn loss (`loss_type='sinkhorn'`, see `dsipts.models.utils.SinkhornDistance`) in a training step (forward of a linear model,
+loss, backward and optimizer step) for some output lengths: `check_every=1` with a new object in each step (as the loss was computed before, the stopping criterion
+is read from the device at each iteration) against the object reused in all the steps with `check_every=10`.
+The host synchronizations matter mainly on the gpu (`--device cuda`). `--noise` is the noise of the predictions with respect to the targets,
+a larger noise needs more iterations to converge.
+Each case runs in a new process and the peak RSS is measured from the creation of the inputs.
+
+Usage:
+    python benchmarks/bench_sinkhorn.py --lengths 24 96 192 --batch_size 32 --channels 3
+"""
+import argparse
+import sys
+import json
+import time
+import resource
+import subprocess
+
+
+def peak_rss(reset=False):
+    ##peak RSS in MB, on linux the peak can be reset (otherwise it includes the imports)
+    try:
+        if reset:
+            with open('/proc/self/clear_refs','w') as f:
+                f.write('5')
+        with open('/proc/self/status','r') as f:
+            return [int(l.split()[1])/1024 for l in f if l.startswith('VmHWM')][0]
+    except Exception as _:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def measure(case,length,batch_size,channels,noise,device,repeat):
+    import torch
+    from dsipts.models.utils import SinkhornDistance
+    torch.manual_seed(0)
+    past = torch.randn(batch_size,length,channels,device=device)
+    y = torch.randn(batch_size,length,channels,device=device)
+    model = torch.nn.Linear(length*channels,length*channels).to(device)
+    with torch.no_grad():
+        ##predictions close to the targets
+        model.weight.zero_()
+        model.bias.zero_()
+    optimizer = torch.optim.Adam(model.parameters(),lr=1e-4)
+    sinkhorn = SinkhornDistance(eps=0.1, max_iter=100, reduction='mean')
+    def step():
+        if case=='previous':
+            loss_fn = SinkhornDistance(eps=0.1, max_iter=100, reduction='mean', check_every=1)
+        else:
+            loss_fn = sinkhorn
+        x = model(past.flatten(1)).view(batch_size,length,channels)+y+noise*past
+        loss = loss_fn.compute(x,y)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        if device=='cuda':
+            torch.cuda.synchronize()
+    ##warm up
+    step()
+    baseline = peak_rss(reset=True)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        step()
+    elapsed = (time.perf_counter()-start)/repeat
+    peak = peak_rss()
+    print(json.dumps({'case':case,'length':length,'ms':elapsed*1000,'peak_mb':peak-baseline}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark Sinkhorn loss")
+    parser.add_argument("--lengths", type=int, nargs='+', default=[24,96,192])
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--channels", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=1.0)
+    parser.add_argument("--device", type=str, default='cpu')
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--measure", type=str, default=None)
+    parser.add_argument("--length", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        measure(args.measure,args.length,args.batch_size,args.channels,args.noise,args.device,args.repeat)
+        sys.exit(0)
+    print(f'{"length":>8} {"case":>10} {"ms":>10} {"peak RSS MB":>12}')
+    for length in args.lengths:
+        for case in ['previous','persistent']:
+            out = subprocess.run([sys.executable,__file__,'--measure',case,'--length',str(length),'--batch_size',str(args.batch_size),'--channels',str(args.channels),
+                                  '--noise',str(args.noise),'--device',args.device,'--repeat',str(args.repeat)],capture_output=True,text=True)
+            if out.returncode!=0:
+                print(f'{length:>8} {case:>10} {"failed":>10}')
+                continue
+            res = json.loads(out.stdout.strip().split('\n')[-1])
+            print(f'{length:>8} {case:>10} {res["ms"]:10.1f} {res["peak_mb"]:12.0f}')
@@ -0,0 +1,68 @@
+"""Benchmark of the sample builder used in `TimeSeries.create_data_loader`: the old python loop against the strided-view engine.
+
+Usage:
+    python benchmarks/bench_windows.py --groups 50 --length 20000 --past_steps 96 --future_steps 24
+"""
+import argparse
+import time
+import numpy as np
+from dsipts.data_structure.utils import valid_window_starts, sliding_windows
+
+
+def legacy_windows(group_codes,x_num_past,x_num_future,y_target,past_steps,future_steps,shift,skip_step):
+    """The python loop used before the vectorized engine (no stacked, no starting point)"""
+    x_num_past_samples = []
+    x_num_future_samples = []
+    y_samples = []
+    for group in np.unique(group_codes):
+        idx = np.where(group_codes==group)[0]
+        xp = x_num_past[idx]
+        xf = x_num_future[idx]
+        yy = y_target[idx]
+        for i in range(past_steps,len(idx)-future_steps,skip_step):
+            xx = xf[i-shift:i+future_steps-shift].mean()
+            if np.isfinite(xp[i-past_steps:i].min() + yy[i:i+future_steps].min() + xx):
+                x_num_past_samples.append(xp[i-past_steps:i])
+                x_num_future_samples.append(xf[i-shift:i+future_steps-shift])
+                y_samples.append(yy[i:i+future_steps])
+    return np.stack(x_num_past_samples),np.stack(x_num_future_samples),np.stack(y_samples)
+
+
+def vectorized_windows(group_codes,x_num_past,x_num_future,y_target,past_steps,future_steps,shift,skip_step):
+    starts = valid_window_starts(group_codes,past_steps,future_steps,0,skip_step,None,x_num_past,y_target,x_num_future,shift,future_steps)
+    return (sliding_windows(x_num_past,starts-past_steps,past_steps),
+            sliding_windows(x_num_future,starts-shift,future_steps),
+            sliding_windows(y_target,starts,future_steps))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark window creation")
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--length", type=int, default=10000)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--past_steps", type=int, default=96)
+    parser.add_argument("--future_steps", type=int, default=24)
+    parser.add_argument("--shift", type=int, default=0)
+    parser.add_argument("--skip_step", type=int, default=1)
+    parser.add_argument("--nan_fraction", type=float, default=0.001)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    N = args.groups*args.length
+    group_codes = np.repeat(np.arange(args.groups),args.length)
+    x_num_past = rng.normal(size=(N,args.channels))
+    x_num_past[rng.random(N)<args.nan_fraction,0] = np.nan
+    x_num_future = rng.normal(size=(N,2))
+    y_target = x_num_past[:,:1].copy()
+    params = (args.past_steps,args.future_steps,args.shift,args.skip_step)
+
+    res = {}
+    for name,fn in [('loop',legacy_windows),('vectorized',vectorized_windows)]:
+        t0 = time.perf_counter()
+        res[name] = fn(group_codes,x_num_past,x_num_future,y_target,*params)
+        res[name+'_seconds'] = time.perf_counter()-t0
+        print(f'{name:>12}: {res[name+"_seconds"]:.3f}s, {len(res[name][0])} samples')
+
+    for a,b in zip(res['loop'],res['vectorized']):
+        np.testing.assert_array_equal(a,b)
+    print(f'same output, speedup x{res["loop_seconds"]/res["vectorized_seconds"]:.1f}')
@@ -1,22 +1,42 @@
-from .data_management.monash import Monash,get_freq
-from .data_structure.data_structure import TimeSeries,Categorical
-from .data_structure.utils import extend_time_df
-from .models.RNN import RNN
-from .models.LinearTS import LinearTS
-from .data_management.public_datasets import read_public_dataset
-from .models.base import Base
-from .models.Persistent import Persistent
-from .models.D3VAE import D3VAE
-from .models.DilatedConv import DilatedConv
-from .models.TFT import TFT
-from .models.Informer import Informer
-from .models.VVA import VVA
-from .models.VQVAEA import VQVAEA
-from .models.CrossFormer import CrossFormer
-from .data_structure.utils import beauty_string
-from .models.Autoformer import Autoformer
-from .models.PatchTST import PatchTST
-from .models.Diffusion import Diffusion
-from .models.DilatedConvED import DilatedConvED
-from .models.TIDE import TIDE
-from .models.ITransformer import ITransformer
\ No newline at end of file
+import importlib
+
+##the public objects are imported at the first access (PEP 562): `import dsipts` does not import torch, the models or the optional dependencies
+_attributes = {'Monash':'.data_management.monash',
+               'get_freq':'.data_management.monash',
+               'read_public_dataset':'.data_management.public_datasets',
+               'TimeSeries':'.data_structure.data_structure',
+               'Categorical':'.data_structure.data_structure',
+               'extend_time_df':'.data_structure.utils',
+               'fill_time_holes':'.data_structure.utils',
+               'beauty_string':'.data_structure.utils',
+               'Base':'.models.base',
+               'RNN':'.models.RNN',
+               'LinearTS':'.models.LinearTS',
+               'Persistent':'.models.Persistent',
+               'D3VAE':'.models.D3VAE',
+               'DilatedConv':'.models.DilatedConv',
+               'TFT':'.models.TFT',
+               'Informer':'.models.Informer',
+               'VVA':'.models.VVA',
+               'VQVAEA':'.models.VQVAEA',
+               'CrossFormer':'.models.CrossFormer',
+               'Autoformer':'.models.Autoformer',
+               'PatchTST':'.models.PatchTST',
+               'Diffusion':'.models.Diffusion',
+               'DilatedConvED':'.models.DilatedConvED',
+               'TIDE':'.models.TIDE',
+               'ITransformer':'.models.ITransformer'}
+
+__all__ = list(_attributes.keys())
+
+
+def __getattr__(name:str):
+    if name in _attributes:
+        value = getattr(importlib.import_module(_attributes[name],__name__),name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals().keys()).union(__all__))
@@ -0,0 +1,245 @@
+import os
+import json
+import shutil
+import pickle
+import numpy as np
+import pandas as pd
+import torch
+from collections import OrderedDict
+from typing import Union
+from .scalers import NumericalScaler, CategoricalEncoder
+
+ARTIFACT_VERSION = 1
+##the objects saved in their own files
+SCALERS = {'scaler_num':NumericalScaler,'scaler_cat':CategoricalEncoder}
+
+
+def _encode(obj):
+    """JSON encoding of the types used in the metadata of a timeseries
+
+    :meta private:
+    """
+    if isinstance(obj,pd.Timedelta):
+        return {'__timedelta__':int(obj.value)}
+    if isinstance(obj,pd.Timestamp):
+        return {'__timestamp__':obj.isoformat()}
+    if isinstance(obj,np.bool_):
+        return bool(obj)
+    if isinstance(obj,np.integer):
+        return int(obj)
+    if isinstance(obj,np.floating):
+        return float(obj)
+    raise TypeError(f'{type(obj)} is not JSON serializable')
+
+def _decode(obj:dict):
+    """Inverse of `_encode`
+
+    :meta private:
+    """
+    if '__timedelta__' in obj:
+        return pd.Timedelta(obj['__timedelta__'])
+    if '__timestamp__' in obj:
+        return pd.Timestamp(obj['__timestamp__'])
+    return obj
+
+def _jsonable(value)->bool:
+    """True if the value is the same after a JSON round trip (for example tuples and dictionaries with integer keys are not)
+
+    :meta private:
+    """
+    try:
+        res = json.loads(json.dumps(value,default=_encode),object_hook=_decode)
+        return type(res) is type(value) and bool(res==value)
+    except Exception:
+        return False
+
+def _save_arrays(filename:str,arrays:dict)->dict:
+    """Save the arrays in a npz file, the object arrays of strings are saved as unicode arrays so that the file can be read without pickle
+
+    :meta private:
+    """
+    objects = []
+    pickled = False
+    for k,v in arrays.items():
+        if v.dtype==object:
+            if all([isinstance(x,str) for x in v]):
+                arrays[k] = v.astype(str)
+                objects.append(k)
+            else:
+                pickled = True
+    np.savez(filename,**arrays)
+    return {'objects':objects,'pickled':pickled}
+
+def _load_arrays(filename:str,meta:dict)->dict:
+    """Inverse of `_save_arrays`
+
+    :meta private:
+    """
+    with np.load(filename,allow_pickle=meta['pickled']) as f:
+        arrays = {k:f[k] for k in f.files}
+    for k in meta['objects']:
+        arrays[k] = arrays[k].astype(object)
+    return arrays
+
+
+def save_artifact(params:dict,path:str,model:Union[torch.nn.Module,None]=None,weights_dtype:Union[str,None]=None)->None:
+    """Save the attributes of a timeseries in a folder: the metadata in `metadata.json` (the attributes that are not JSON serializable in `objects.pkl`), the scalers in `scalers.npz`,
+    the dataset in `dataset.parquet` and the weights of the model (if any) in `weights.pt`. The folder is written aside and then replaced, so a reader never sees a partial artifact
+
+    Args:
+        params (dict): attributes of the timeseries
+        path (str): folder of the artifact
+        model (Union[torch.nn.Module,None], optional): model whose weights are saved. Defaults to None.
+        weights_dtype (Union[str,None], optional): see `export_state_dict`. Defaults to None.
+    """
+    tmp_path = path+'.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    params = params.copy()
+    dataset = params.pop('dataset',None)
+    meta = {'version':ARTIFACT_VERSION,'attributes':{},'scalers':{},'dataset':None,'weights':None}
+    arrays = {}
+    for k,cls in SCALERS.items():
+        scaler = params.pop(k,None)
+        if isinstance(scaler,cls):
+            meta['scalers'][k],tmp = scaler.to_arrays()
+            arrays.update({f'{k}.{j}':v for j,v in tmp.items()})
+        elif scaler is not None:
+            ##not fitted or saved by the previous versions
+            params[k] = scaler
+    if len(arrays)>0:
+        meta['arrays'] = _save_arrays(os.path.join(tmp_path,'scalers.npz'),arrays)
+    if isinstance(dataset,pd.DataFrame):
+        try:
+            dataset.to_parquet(os.path.join(tmp_path,'dataset.parquet'))
+            meta['dataset'] = 'dataset.parquet'
+        except Exception:
+            ##pyarrow missing or columns with mixed types
+            dataset.to_pickle(os.path.join(tmp_path,'dataset.pkl'))
+            meta['dataset'] = 'dataset.pkl'
+    elif dataset is not None:
+        params['dataset'] = dataset
+    if model is not None:
+        export_state_dict(model,os.path.join(tmp_path,'weights.pt'),weights_dtype)
+        meta['weights'] = 'weights.pt'
+    objects = {}
+    for k,v in params.items():
+        if _jsonable(v):
+            meta['attributes'][k] = v
+        else:
+            objects[k] = v
+    if len(objects)>0:
+        with open(os.path.join(tmp_path,'objects.pkl'),'wb') as f:
+            pickle.dump(objects,f)
+    with open(os.path.join(tmp_path,'metadata.json'),'w') as f:
+        json.dump(meta,f,default=_encode,indent=1)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path,path)
+
+
+def export_state_dict(model:torch.nn.Module,filename:str,dtype:Union[str,None]=None)->int:
+    """Save only the weights of a model (without the optimizer states and the hyperparameters of a lightning checkpoint), the file can be read with `weights_only=True`
+
+    Args:
+        model (torch.nn.Module): the model
+        filename (str): output file
+        dtype (Union[str,None], optional): `float16` or `bfloat16` to halve the size of the floating point weights, they are cast back to the dtype of the model while loading. Defaults to None.
+
+    Returns:
+        int: size of the file in bytes
+    """
+    dtype = getattr(torch,dtype) if isinstance(dtype,str) else dtype
+    state_dict = OrderedDict()
+    for k,v in model.state_dict().items():
+        v = v.detach().cpu()
+        state_dict[k] = v.to(dtype) if dtype is not None and v.is_floating_point() else v
+    torch.save({'state_dict':state_dict},filename)
+    return os.path.getsize(filename)
+
+
+def load_checkpoint(filename:str)->dict:
+    """Read a file saved by `export_state_dict` or a lightning checkpoint. The tensors are memory mapped (torch>=2.1), so the unused parts of a checkpoint
+    (e.g. the optimizer states) are never read and the weights are copied only once in the model
+
+    Args:
+        filename (str): the file
+
+    Returns:
+        dict: the checkpoint, with the weights in `state_dict`
+    """
+    try:
+        return _torch_load(filename,weights_only=True)
+    except pickle.UnpicklingError:
+        ##lightning checkpoints contain also the hyperparameters (classes and functions)
+        return _torch_load(filename,weights_only=False)
+
+def _torch_load(filename:str,weights_only:bool)->dict:
+    """`torch.load` on the cpu with mmap if available
+
+    :meta private:
+    """
+    try:
+        return torch.load(filename,map_location='cpu',mmap=True,weights_only=weights_only)
+    except TypeError:
+        return torch.load(filename,map_location='cpu',weights_only=weights_only)
+
+
+def load_artifact(path:str)->dict:
+    """Read the attributes of a timeseries saved with `save_artifact`, the dataset is not read: its file is returned in `_dataset_file`
+    and the weights file (if any) in `_weights_file`
+
+    Args:
+        path (str): folder of the artifact
+
+    Returns:
+        dict: attributes of the timeseries
+    """
+    with open(os.path.join(path,'metadata.json'),'r') as f:
+        meta = json.load(f,object_hook=_decode)
+    if meta['version']>ARTIFACT_VERSION:
+        raise ValueError(f'Artifact version {meta["version"]} not supported, please update dsipts')
+    params = meta['attributes']
+    if os.path.exists(os.path.join(path,'objects.pkl')):
+        with open(os.path.join(path,'objects.pkl'),'rb') as f:
+            params.update(pickle.load(f))
+    if len(meta['scalers'])>0:
+        arrays = _load_arrays(os.path.join(path,'scalers.npz'),meta['arrays'])
+        for k,scaler_meta in meta['scalers'].items():
+            tmp = {j.split('.',1)[1]:v for j,v in arrays.items() if j.split('.',1)[0]==k}
+            params[k] = SCALERS[k].from_arrays(scaler_meta,tmp)
+    params['_dataset_file'] = os.path.join(path,meta['dataset']) if meta['dataset'] is not None else None
+    params['_weights_file'] = os.path.join(path,meta['weights']) if meta['weights'] is not None else None
+    return params
+
+
+def read_dataset(filename:str)->pd.DataFrame:
+    """Read the dataset of an artifact
+
+    Args:
+        filename (str): file of the dataset (see `load_artifact`)
+
+    Returns:
+        pd.DataFrame: the dataset
+    """
+    if filename.endswith('.parquet'):
+        return pd.read_parquet(filename)
+    return pd.read_pickle(filename)
+
+
+def migrate_pickle(filename:str,path:Union[str,None]=None)->str:
+    """Convert a timeseries saved by `TimeSeries.save` in the pickle format (without the model weights, they remain in the checkpoints)
+
+    Args:
+        filename (str): filename of the saved timeseries (without `.pkl`)
+        path (Union[str,None], optional): folder of the artifact, if None `filename`. Defaults to None.
+
+    Returns:
+        str: folder of the artifact
+    """
+    path = filename if path is None else path
+    with open(filename+'.pkl','rb') as f:
+        params = pickle.load(f)
+    save_artifact(params,path)
+    return path
@@ -1,24 +1,26 @@
 import numpy as np
-import plotly.express as px
 import pandas as pd
 from typing import List
-from sklearn.preprocessing import LabelEncoder
-from sklearn.preprocessing import * 
 from torch.utils.data import DataLoader
 from pytorch_lightning.callbacks import ModelCheckpoint
 import pytorch_lightning as pl
 from pytorch_lightning.loggers import CSVLogger
-from typing import Union
+from typing import Union, Iterator
 import os
 import torch
 import pickle
-from .utils import extend_time_df,MetricsCallback, MyDataset, ActionEnum,beauty_string
+import json
+from .utils import extend_time_df,fill_time_holes,MetricsCallback, MyDataset, batch_data_loader, DeviceDataLoader, WindowedDataset, MemmapDataset, ActionEnum,beauty_string,valid_window_starts,sliding_windows
 from datetime import datetime
 from ..models.base import Base
 from ..models.utils import weight_init_zeros,weight_init
 import logging 
 from .modifiers import *
-from aim.pytorch_lightning import AimLogger
+from .dataset_cache import DatasetCache
+from .workers import WorkerPool, PoolDataLoader, memory_usage
+from .prediction_store import PredictionWriter
+from .artifact import save_artifact, load_artifact, read_dataset, export_state_dict, load_checkpoint
+from .scalers import NumericalScaler, CategoricalEncoder
 import time
 
 
@@ -102,6 +104,8 @@ class Categorical():
     def plot(self)->None:
         """Plot the series
         """
+        ##plotly is imported only for plotting, it is slow to import
+        import plotly.express as px
         tmp = pd.DataFrame({'time':range(len(self.classes_array)),'signal':self.signal,'class':self.classes_array})
         fig = px.scatter(tmp,x='time',y='signal',color='class',title=self.name)
         fig.show()
@@ -134,6 +138,8 @@ class TimeSeries():
         self.stacked = stacked
         self.verbose = True
         self.group = None
+        self.dataset_cache = None
+        self.worker_pool = None
     def __str__(self) -> str:
         return f"Timeseries named {self.name} of length {self.dataset.shape[0]}.\n Categorical variable: {self.cat_var},\n Future variables: {self.future_variables},\n Past variables: {self.past_variables},\n Target variables: {self.target_variables} \n With {'no group' if self.group is None else self.group+' as group' }"
     def __repr__(self) -> str:
@@ -141,6 +147,54 @@ class TimeSeries():
     
     def set_verbose(self,verbose:bool):
         self.verbose = verbose
+
+    def set_dataset_cache(self,path:Union[str,None],max_size_mb:float=10000)->None:
+        """Use a persistent cache for the datasets created by `split_for_train` (see `DatasetCache`). The datasets are reused if the content of the dataset, the scalers and the split parameters are the same
+
+        Args:
+            path (Union[str,None]): folder of the cache, if None the cache is disabled
+            max_size_mb (float, optional): maximum size of the cache in MB. Defaults to 10000.
+        """
+        self.dataset_cache = None if path is None else DatasetCache(path,max_size_mb,self.verbose)
+
+    def get_worker_pool(self,num_workers:int)->WorkerPool:
+        """Get the pool of workers used for building the batches, it is created at the first call and reused by `train_model` and `inference_on_set` (see `WorkerPool`)
+
+        Args:
+            num_workers (int): number of workers, if different from the current pool a new pool is created
+
+        Returns:
+            WorkerPool: the pool
+        """
+        pool = getattr(self,'worker_pool',None)
+        if pool is not None and (pool.num_workers!=num_workers or not pool.is_alive()):
+            self.close_worker_pool()
+            pool = None
+        if pool is None:
+            beauty_string(f'Starting a pool of {num_workers} workers','info',self.verbose)
+            self.worker_pool = WorkerPool(num_workers)
+        return self.worker_pool
+
+    def close_worker_pool(self)->None:
+        """Stop the workers and release the datasets kept by the pool
+        """
+        if getattr(self,'worker_pool',None) is not None:
+            self.worker_pool.close()
+        self.worker_pool = None
+
+    def _data_loader(self,dataset:torch.utils.data.Dataset,batch_size:int,shuffle:bool,drop_last:bool,num_workers:int,persistent_workers:bool=False):
+        """Loader used for training and inference: the workers of the pool if num_workers>0, otherwise the batches are built in the main process (see `batch_data_loader`)
+
+        :meta private:
+        """
+        if num_workers>0 and isinstance(dataset,MyDataset):
+            return PoolDataLoader(dataset,batch_size,shuffle,drop_last,self.get_worker_pool(num_workers))
+        return batch_data_loader(dataset,batch_size=batch_size,shuffle=shuffle,drop_last=drop_last,num_workers=num_workers,persistent_workers=persistent_workers)
+
+    def _log_worker_memory(self)->None:
+        if getattr(self,'worker_pool',None) is not None:
+            for _,row in self.worker_pool.memory_usage().iterrows():
+                beauty_string(f'Worker {row.pid}: RSS {row.rss_mb:.1f} MB (shared {row.shared_mb:.1f} MB)','info',self.verbose)
     def _generate_base(self,length:int,type:int=0)-> None:
         """Generate a basic timeseries 
 
@@ -268,7 +322,7 @@ class TimeSeries():
             if differences.nunique()>1:
                 beauty_string("There are holes in the dataset i will try to extend the dataframe inserting NAN",'info',self.verbose)
                 beauty_string(f'Detected minumum frequency: {freq}','section',self.verbose)
-                dataset = extend_time_df(dataset,freq,group).merge(dataset,how='left')
+                dataset = fill_time_holes(dataset,freq,group)
         else:
             beauty_string("I will compute the frequency as minimum of the time difference",'info',self.verbose)
             self.freq =  dataset.time.diff()[1:].min()
@@ -318,6 +372,7 @@ class TimeSeries():
         """
       
         beauty_string('Plotting only target variables','block',self.verbose)
+        import plotly.express as px
         if self.group is None:
             tmp = self.dataset[['time']+self.target_variables].melt(id_vars=['time'])
             fig = px.line(tmp,x='time',y='value',color='variable',title=self.name)
@@ -329,13 +384,42 @@ class TimeSeries():
         return fig
     
         
+    def _scale_data(self,data:pd.DataFrame)->pd.DataFrame:
+        """Apply the fitted scalers to the categorical and numerical columns and add the `_GROUP_` column
+
+        Args:
+            data (pd.DataFrame): input dataset
+
+        Returns:
+            pd.DataFrame: scaled dataset
+        """
+        ##overwrite categorical columns
+        for c in self.cat_var:
+            self.enrich(data,c)
+
+        if self.group is None:
+            data['_GROUP_'] = '1'
+        else:
+            data['_GROUP_'] = data[self.group].values
+            
+            
+        groups = data['_GROUP_'].values if self.normalize_per_group else None
+        if len(self.cat_var)>0:
+            data[self.cat_var] = self.scaler_cat.transform(data[self.cat_var],groups)
+        if len(self.num_var)>0:
+            data[self.num_var] = self.scaler_num.transform(data[self.num_var].values,groups)
+        return data
+
     def create_data_loader(self,data:pd.DataFrame,
                            past_steps:int,
                            future_steps:int,
                            shift:int=0,
                            keep_entire_seq_while_shifting:bool=False,
                            starting_point:Union[None,dict]=None,
-                           skip_step:int=1
+                           skip_step:int=1,
+                           windowed:bool=False,
+                           store_path:Union[str,None]=None,
+                           chunk_size:int=1000000
                          
                            )->MyDataset:
         """ Create the dataset for the training/inference step
@@ -348,6 +432,9 @@ class TimeSeries():
             keep_entire_seq_while_shifting (bool, optional): if the dataset is shifted, you may want the future data be of length future_step+shift (like informer), default false
             starting_point (Union[None,dict], optional): a dictionary indicating if a sample must be considered. It is checked for the first lag in the future (useful in the case your model has to predict only starting from hour 12). Defaults to None.
             skip_step (int, optional): list of the categortial variables (same for past and future). Usual there is a skip of one between two saples but for debugging  or training time purposes you can skip some samples. Defaults to 1.
+            windowed (bool, optional): if True a `WindowedDataset` is returned: the windows are sliced while iterating the dataset instead of being materialized, so the memory does not depend on the window lengths. Defaults to False.
+            store_path (Union[str,None], optional): if not None the dataset is built chunk by chunk in this folder (see `create_stored_dataset`) and a `MemmapDataset` is returned. Defaults to None.
+            chunk_size (int, optional): maximum number of rows scaled at once when `store_path` is not None. Defaults to 1000000.
         Returns:
             MyDataset: class thath extends torch.utils.data.Dataset (see utils)
                 keys of a batch:
@@ -360,50 +447,10 @@ class TimeSeries():
         """
         beauty_string('Creating data loader','block',self.verbose)
         
-        x_num_past_samples = []
-        x_num_future_samples = []
-        x_cat_past_samples = []
-        x_cat_future_samples = []
-        y_samples = []
-        t_samples = []
-        g_samples = []
-        
         if starting_point is not None:
             kk = list(starting_point.keys())[0]
             assert kk not in self.cat_var, beauty_string('CAN NOT USE FEATURE {kk} as starting point it may have a different value due to the normalization step, please add a second column with a suitable name','info',True)
         
-        ##overwrite categorical columns
-        for c in self.cat_var:
-            self.enrich(data,c)
-
-        if self.group is None:
-            data['_GROUP_'] = '1'
-        else:
-            data['_GROUP_'] = data[self.group].values
-            
-            
-        if self.normalize_per_group:
-            tot = []
-            groups = data[self.group].unique()
-            
-            data[self.group] = self.scaler_cat[self.group].transform(data[self.group].values.ravel()).flatten()
-            
-            for group in groups:
-                tmp = data[data['_GROUP_']==group].copy()
-                
-                for c in self.num_var:
-                    tmp[c] = self.scaler_num[f'{c}_{group}'].transform(tmp[c].values.reshape(-1,1)).flatten()
-                for c in self.cat_var:      
-                    if c!=self.group:                         
-                        tmp[c] = self.scaler_cat[f'{c}_{group}'].transform(tmp[c].values.ravel()).flatten()
-                tot.append(tmp)
-            data = pd.concat(tot,ignore_index=True)
-        else:
-            for c in self.cat_var:
-                data[c] = self.scaler_cat[c].transform(data[c].values.ravel()).flatten()
-            for c in self.num_var: 
-                data[c] = self.scaler_num[c].transform(data[c].values.reshape(-1,1)).flatten()
-
         idx_target = []
         for c in self.target_variables:
             idx_target.append(self.past_variables.index(c))
@@ -421,70 +468,61 @@ class TimeSeries():
             skip_stacked = future_steps*future_steps-future_steps
         else:
             skip_stacked = 0
-        for group in data['_GROUP_'].unique():
-            tmp = data[data['_GROUP_']==group]
-            groups = tmp['_GROUP_'].values  
-            t = tmp.time.values 
-            x_num_past = tmp[self.past_variables].values
-            if len(self.future_variables)>0:
-                x_num_future = tmp[self.future_variables].values
-            if len(self.cat_var)>0:
-                x_cat = tmp[self.cat_var].values
-            y_target = tmp[self.target_variables].values
+        if store_path is not None:
+            return self.create_stored_dataset(data,store_path,past_steps,future_steps,shift,keep_entire_seq_while_shifting,starting_point,skip_step,skip_stacked,idx_target,idx_target_future,chunk_size)
 
+        data = self._scale_data(data)
         
-            if starting_point is not None:
-                check = tmp[list(starting_point.keys())[0]].values == starting_point[list(starting_point.keys())[0]]
-            else:
-                check = [True]*len(y_target)
-            
-            for i in range(past_steps,tmp.shape[0]-future_steps-skip_stacked,skip_step):
-                if check[i]:
-
-                    if len(self.future_variables)>0:
-                        if keep_entire_seq_while_shifting:
-                            xx = x_num_future[i-shift+skip_stacked:i+future_steps+skip_stacked].mean()
-                        else:
-                            xx = x_num_future[i-shift+skip_stacked:i+future_steps-shift+skip_stacked].mean()
-                    else:
-                        xx = 0.0
-                    if np.isfinite(x_num_past[i-past_steps:i].min() + y_target[i+skip_stacked:i+future_steps+skip_stacked].min() + xx):
-                        
-                        x_num_past_samples.append(x_num_past[i-past_steps:i])
-                        if len(self.future_variables)>0:
-                            if keep_entire_seq_while_shifting:
-                                x_num_future_samples.append(x_num_future[i-shift+skip_stacked:i+future_steps+skip_stacked])
-                            else:
-                                x_num_future_samples.append(x_num_future[i-shift+skip_stacked:i+future_steps-shift+skip_stacked])
-                        if len(self.cat_var)>0:
-                            x_cat_past_samples.append(x_cat[i-past_steps:i])
-                            if keep_entire_seq_while_shifting:
-                                x_cat_future_samples.append(x_cat[i-shift+skip_stacked:i+future_steps+skip_stacked])
-                            else:
-                                x_cat_future_samples.append(x_cat[i-shift+skip_stacked:i+future_steps-shift+skip_stacked])
-                        y_samples.append(y_target[i+skip_stacked:i+future_steps+skip_stacked])
-                        t_samples.append(t[i+skip_stacked:i+future_steps+skip_stacked])
-                        g_samples.append(groups[i])
+        ##the groups are placed in contiguous blocks (keeping the order of appearance) so that the samples are extracted with strided views
+        group_codes,_ = pd.factorize(data['_GROUP_'])
+        order = np.argsort(group_codes,kind='stable')
+        group_codes = group_codes[order]
+        groups = data['_GROUP_'].values[order]
+        t = data.time.values[order]
+        x_num_past = data[self.past_variables].values[order]
+        if len(self.future_variables)>0:
+            x_num_future = data[self.future_variables].values[order]
+        if len(self.cat_var)>0:
+            x_cat = data[self.cat_var].values[order]
+        y_target = data[self.target_variables].values[order]
 
-    
+        if starting_point is not None:
+            check = data[list(starting_point.keys())[0]].values[order] == starting_point[list(starting_point.keys())[0]]
+        else:
+            check = None
+        future_length = future_steps+shift if keep_entire_seq_while_shifting else future_steps
         
-        if len(self.future_variables)>0:
-            try:
-                x_num_future_samples = np.stack(x_num_future_samples)
-            except Exception as e:
-                beauty_string('WARNING x_num_future_samples is empty and it should not','info',True)
-        y_samples = np.stack(y_samples)
-        t_samples = np.stack(t_samples)   
-        g_samples = np.stack(g_samples)
+        starts = valid_window_starts(group_codes,past_steps,future_steps,skip_stacked,skip_step,check,
+                                     x_num_past,y_target,
+                                     x_num_future if len(self.future_variables)>0 else None,
+                                     shift,future_length)
 
-        if len(self.cat_var)>0:
-            x_cat_past_samples = np.stack(x_cat_past_samples)
-            x_cat_future_samples = np.stack(x_cat_future_samples)
-        x_num_past_samples = np.stack(x_num_past_samples)
         if self.stacked:
             mod = 0
         else:
             mod = 1.0
+        if windowed:
+            arrays = {'y':y_target.astype(np.float32),'x_num_past':(x_num_past*mod).astype(np.float32)}
+            windows = {'y':('y',skip_stacked,future_steps),'x_num_past':('x_num_past',-past_steps,past_steps)}
+            if len(self.cat_var)>0:
+                arrays['x_cat'] = x_cat
+                windows['x_cat_past'] = ('x_cat',-past_steps,past_steps)
+                windows['x_cat_future'] = ('x_cat',skip_stacked-shift,future_length)
+            if len(self.future_variables)>0:
+                arrays['x_num_future'] = x_num_future.astype(np.float32)
+                windows['x_num_future'] = ('x_num_future',skip_stacked-shift,future_length)
+            return WindowedDataset(arrays,windows,starts,t,groups,(skip_stacked,future_steps),idx_target,idx_target_future)
+
+        x_num_past_samples = sliding_windows(x_num_past,starts-past_steps,past_steps)
+        if len(self.future_variables)>0:
+            x_num_future_samples = sliding_windows(x_num_future,starts-shift+skip_stacked,future_length)
+        if len(self.cat_var)>0:
+            x_cat_past_samples = sliding_windows(x_cat,starts-past_steps,past_steps)
+            x_cat_future_samples = sliding_windows(x_cat,starts-shift+skip_stacked,future_length)
+        y_samples = sliding_windows(y_target,starts+skip_stacked,future_steps)
+        t_samples = sliding_windows(t,starts+skip_stacked,future_steps)
+        g_samples = groups[starts]
+        
         dd = {'y':y_samples.astype(np.float32),
 
               'x_num_past':(x_num_past_samples*mod).astype(np.float32)}
@@ -495,6 +533,97 @@ class TimeSeries():
             dd['x_num_future'] = x_num_future_samples.astype(np.float32)
         
         return MyDataset(dd,t_samples,g_samples,idx_target,idx_target_future)
+
+    def create_stored_dataset(self,data:pd.DataFrame,
+                              store_path:str,
+                              past_steps:int,
+                              future_steps:int,
+                              shift:int,
+                              keep_entire_seq_while_shifting:bool,
+                              starting_point:Union[None,dict],
+                              skip_step:int,
+                              skip_stacked:int,
+                              idx_target:List[int],
+                              idx_target_future:Union[List[int],None],
+                              chunk_size:int=1000000)->MemmapDataset:
+        """Out of core version of `create_data_loader`. The data are scaled group by group (and chunk by chunk inside each group) and written in a folder containing one `.npy` file for each array plus an `index.json` file.
+        Only the compact series are stored (see `WindowedDataset`) and the returned dataset reads them as read-only memory maps, so the memory used does not depend on the size of the dataset.
+
+        Args:
+            data (pd.DataFrame): input dataset, usually a subset of self.data
+            store_path (str): folder where the arrays will be written. It is overwritten if already exists
+            past_steps (int): see `create_data_loader`
+            future_steps (int): see `create_data_loader`
+            shift (int): see `create_data_loader`
+            keep_entire_seq_while_shifting (bool): see `create_data_loader`
+            starting_point (Union[None,dict]): see `create_data_loader`
+            skip_step (int): see `create_data_loader`
+            skip_stacked (int): offset of the target window (used by stacked models)
+            idx_target (List[int]): index of target features in the past array
+            idx_target_future (Union[List[int],None]): index of target features in the future array
+            chunk_size (int, optional): maximum number of rows scaled at once. Defaults to 1000000.
+
+        Returns:
+            MemmapDataset: the dataset reading from `store_path`
+        """
+        beauty_string(f'Writing the dataset in {store_path}','info',self.verbose)
+        os.makedirs(store_path,exist_ok=True)
+        future_length = future_steps+shift if keep_entire_seq_while_shifting else future_steps
+        mod = 0 if self.stacked else 1.0
+        N = data.shape[0]
+        group_codes,uniques = pd.factorize(data[self.group] if self.group is not None else pd.Series(['1']*N))
+        order = np.argsort(group_codes,kind='stable')
+        counts = np.bincount(group_codes,minlength=len(uniques))
+        begin = np.concatenate([[0],np.cumsum(counts)]).astype(int)
+
+        blocks = {'y':self.target_variables,'x_num_past':self.past_variables}
+        windows = {'y':('y',skip_stacked,future_steps),'x_num_past':('x_num_past',-past_steps,past_steps)}
+        if len(self.cat_var)>0:
+            blocks['x_cat'] = self.cat_var
+            windows['x_cat_past'] = ('x_cat',-past_steps,past_steps)
+            windows['x_cat_future'] = ('x_cat',skip_stacked-shift,future_length)
+        if len(self.future_variables)>0:
+            blocks['x_num_future'] = self.future_variables
+            windows['x_num_future'] = ('x_num_future',skip_stacked-shift,future_length)
+
+        arrays = {}
+        starts = []
+        for k in range(len(uniques)):
+            nan_mask = {name:np.zeros(counts[k],dtype=np.float32) for name in ['y','x_num_past','x_num_future']} ##0 if the row is finite, nan otherwise
+            check = None if starting_point is None else np.zeros(counts[k],dtype=bool)
+            for a in range(begin[k],begin[k+1],chunk_size):
+                b = min(a+chunk_size,begin[k+1])
+                tmp = self._scale_data(data.iloc[order[a:b]].copy())
+                values = {name:tmp[columns].values for name,columns in blocks.items()}
+                values['x_num_past'] = values['x_num_past']*mod
+                values['time'] = tmp.time.values
+                values['groups'] = np.full(b-a,k,dtype=np.int64)
+                for name in values:
+                    if name not in arrays:
+                        dtype = np.float32 if name in nan_mask else values[name].dtype
+                        arrays[name] = np.lib.format.open_memmap(os.path.join(store_path,f'{name}.npy'),mode='w+',dtype=dtype,shape=(N,)+values[name].shape[1:])
+                    arrays[name][a:b] = values[name]
+                for name in nan_mask:
+                    if name in values:
+                        nan_mask[name][a-begin[k]:b-begin[k]] = np.where(np.isfinite(values[name].astype(float)).all(axis=1),0.0,np.nan)
+                if check is not None:
+                    check[a-begin[k]:b-begin[k]] = tmp[list(starting_point.keys())[0]].values == starting_point[list(starting_point.keys())[0]]
+            starts.append(begin[k]+valid_window_starts(np.zeros(counts[k],dtype=np.int64),past_steps,future_steps,skip_stacked,skip_step,check,
+                                                       nan_mask['x_num_past'],nan_mask['y'],
+                                                       nan_mask['x_num_future'] if len(self.future_variables)>0 else None,
+                                                       shift,future_length))
+        for name in arrays:
+            arrays[name].flush()
+        del arrays
+        starts = np.concatenate(starts) if len(starts)>0 else np.zeros(0,dtype=np.int64)
+        np.save(os.path.join(store_path,'starts.npy'),starts.astype(np.int64))
+        with open(os.path.join(store_path,'index.json'),'w') as f:
+            json.dump({'windows':windows,
+                       't_window':[skip_stacked,future_steps],
+                       'groups':[g.item() if hasattr(g,'item') else g for g in uniques],
+                       'idx_target':idx_target,
+                       'idx_target_future':idx_target_future},f)
+        return MemmapDataset(store_path)
     
           
     
@@ -512,7 +641,9 @@ class TimeSeries():
                         skip_step:int=1,
                         normalize_per_group: bool=False,
                         check_consecutive: bool=True,
-                        scaler: str='StandardScaler()' 
+                        scaler: str='StandardScaler()',
+                        windowed: bool=False,
+                        store_path: Union[str,None]=None
                         )->List[DataLoader]:
         """Split the data and create the datasets.
 
@@ -532,12 +663,30 @@ class TimeSeries():
             normalize_per_group (boolean, optional): if true and self.group is not None, the variables are scaled respect to the groups. Default False
             check_consecutive (boolean, optional): if false it skips the check on the consecutive ranges. Default True
             scaler: instance of a sklearn.preprocessing scaler. Default 'StandardScaler()'
+            windowed (boolean, optional): see `create_data_loader`. Default False
+            store_path (str, optional): if not None the three datasets are written in the `train`, `validation` and `test` subfolders of `store_path` (see `create_data_loader`). Default None
         Returns:
             List[DataLoader,DataLoader,DataLoadtrainer]: three dataloader used for training or inference
         """
 
+        split_params = {k:v for k,v in locals().items() if k!='self'}
         beauty_string('Splitting for train','block',self.verbose)
 
+        dataset_cache = getattr(self,'dataset_cache',None)
+        if dataset_cache is not None and store_path is None:
+            def cache_key(scalers):
+                return dataset_cache.fingerprint(self.dataset,
+                                                 split_params=split_params,
+                                                 variables=[self.past_variables,self.future_variables,self.target_variables,self.cat_var,self.group,self.stacked],
+                                                 scalers=scalers)
+            key = cache_key((self.scaler_cat,self.scaler_num,self.normalize_per_group) if self.is_trained else None)
+            cached = dataset_cache.get(key)
+            if cached is not None:
+                if not self.is_trained:
+                    self.scaler_cat,self.scaler_num,self.normalize_per_group = cached['scalers']
+                return cached['datasets']
+        else:
+            key = None
         
         try:
             ls = self.dataset.shape[0]
@@ -553,20 +702,18 @@ class TimeSeries():
                 test = self.dataset.iloc[int(perc_train*ls+perc_valid*ls):]
             else:
                 beauty_string(f'Split temporally using perc_train: {perc_train} and perc_valid:{perc_valid} for each group!','info',self.verbose)
-                train = []
-                validation =[]
-                test = []
-                ls = self.dataset.groupby(self.group).time.count().reset_index()
-                for group in self.dataset[self.group].unique():
-                    tmp = self.dataset[self.dataset[self.group]==group]
-                    lt = ls[ls[self.group]==group].time.values[0]
-                    train.append(tmp[0:int(perc_train*lt)])
-                    validation.append(tmp[int(perc_train*lt):int(perc_train*lt+perc_valid*lt)])
-                    test.append(tmp[int(perc_train*lt+perc_valid*lt):])
-
-                train = pd.concat(train,ignore_index=True)
-                validation = pd.concat(validation,ignore_index=True)
-                test = pd.concat(test,ignore_index=True)
+                ##sort once by group (keeping the temporal order) and compute the position of each row inside its group
+                codes,_ = pd.factorize(self.dataset[self.group])
+                order = np.argsort(codes,kind='stable')
+                order = order[codes[order]>=0]
+                codes = codes[order]
+                position = np.arange(len(order))-np.searchsorted(codes,codes)
+                lt = np.bincount(codes[pd.notnull(self.dataset.time.values[order])],minlength=codes.max()+1 if len(codes)>0 else 0)
+                end_train = (perc_train*lt).astype(int)[codes]
+                end_validation = (perc_train*lt+perc_valid*lt).astype(int)[codes]
+                train = self.dataset.iloc[order[position<end_train]].reset_index(drop=True)
+                validation = self.dataset.iloc[order[(position>=end_train)&(position<end_validation)]].reset_index(drop=True)
+                test = self.dataset.iloc[order[position>=end_validation]].reset_index(drop=True)
 
 
         else:
@@ -583,38 +730,33 @@ class TimeSeries():
         if self.is_trained:
             pass
         else:
-            self.scaler_cat = {}
-            self.scaler_num = {}
-        
             if self.group is None or normalize_per_group is False:
                 self.normalize_per_group = False
-                for c in self.num_var:
-                    self.scaler_num[c] =  eval(scaler)
-                    self.scaler_num[c].fit(train[c].values.reshape(-1,1))
-                for c in self.cat_var:                               
-                    self.scaler_cat[c] =  LabelEncoder()
-                    self.scaler_cat[c].fit(train[c].values.ravel())  
+                groups = None
             else:
                 self.normalize_per_group = True
-                self.scaler_cat[self.group] =  LabelEncoder()
-                self.scaler_cat[self.group].fit(train[self.group].values.ravel())  
-                for group in train[self.group].unique():
-                    tmp = train[train[self.group]==group]
-
-                    for c in self.num_var:
-                        self.scaler_num[f'{c}_{group}'] =  eval(scaler)
-                        self.scaler_num[f'{c}_{group}'].fit(tmp[c].values.reshape(-1,1))
-                    for c in self.cat_var:
-                        if c!=self.group:                               
-                            self.scaler_cat[f'{c}_{group}'] =  LabelEncoder()
-                            self.scaler_cat[f'{c}_{group}'].fit(tmp[c].values.ravel())  
+                groups = train[self.group].values
+            ##all the columns and groups are fitted at once, the group column is always encoded globally
+            self.scaler_num = NumericalScaler(scaler).fit(train[self.num_var].values,groups)
+            self.scaler_cat = CategoricalEncoder().fit(train[self.cat_var],groups,[c!=self.group for c in self.cat_var])
         
-        dl_train = self.create_data_loader(train,past_steps,future_steps,shift,keep_entire_seq_while_shifting,starting_point,skip_step)
-        dl_validation = self.create_data_loader(validation,past_steps,future_steps,shift,keep_entire_seq_while_shifting,starting_point,skip_step)
+        store = {k:None if store_path is None else os.path.join(store_path,k) for k in ['train','validation','test']}
+        dl_train = self.create_data_loader(train,past_steps,future_steps,shift,keep_entire_seq_while_shifting,starting_point,skip_step,windowed,store['train'])
+        dl_validation = self.create_data_loader(validation,past_steps,future_steps,shift,keep_entire_seq_while_shifting,starting_point,skip_step,windowed,store['validation'])
         if test.shape[0]>0:
-            dl_test = self.create_data_loader(test,past_steps,future_steps,shift,keep_entire_seq_while_shifting,starting_point,skip_step)
+            dl_test = self.create_data_loader(test,past_steps,future_steps,shift,keep_entire_seq_while_shifting,starting_point,skip_step,windowed,store['test'])
         else:
             dl_test = None
+        if key is not None:
+            ##the datasets are identified by the key of the cache also in the pool of workers (see `MyDataset.fingerprint`)
+            for name,d in zip(['train','validation','test'],[dl_train,dl_validation,dl_test]):
+                if isinstance(d,MyDataset):
+                    d._fingerprint = f'{key}_{name}'
+            entry = {'datasets':(dl_train,dl_validation,dl_test),'scalers':(self.scaler_cat,self.scaler_num,self.normalize_per_group)}
+            dataset_cache.put(key,entry)
+            if not self.is_trained:
+                ##after the training the scalers are part of the key (see `inference_on_set`): the same entry is stored also with the fitted scalers
+                dataset_cache.put(cache_key(entry['scalers']),entry)
         return dl_train,dl_validation,dl_test
             
     def set_model(self,model:Base,config:dict=None,custom_init:bool=False):
@@ -647,7 +789,8 @@ class TimeSeries():
                     precision:Union[str,int]=32,
                     modifier:Union[None,str]=None,
                     modifier_params:Union[None,dict]=None,
-                    seed:int=42
+                    seed:int=42,
+                    dataset_on_device:Union[None,str]=None
                     )-> float:
         """Train the model
 
@@ -665,6 +808,7 @@ class TimeSeries():
             modifier (Union[str,int], optional): if not None a modifier is applyed to the dataloader. Sometimes lightening has very restrictive rules on the dataloader, or we want to use a ML model before or after the DL model (See readme for more information)
             modifier_params (Union[dict,int], optional): parameters of the modifier
             seed (int, optional): seed for reproducibility
+            dataset_on_device (Union[None,str], optional): if 'device' the train and validation tensors are moved once on the training device (the device of the trainer), if 'pinned' they are kept in pinned CPU memory and each batch is copied asynchronously on the training device. The batches are sampled directly there without DataLoader workers (see `DeviceDataLoader`). Use it only if the datasets fit in memory and with a single device. Defaults to None.
         """
 
         beauty_string('Training the model','block',self.verbose)
@@ -699,8 +843,13 @@ class TimeSeries():
             self.modifier = modifier
         else:
             self.modifier = None
-        train_dl = DataLoader(train, batch_size = batch_size , shuffle=True,drop_last=True,num_workers=num_workers,persistent_workers=persistent_workers)
-        valid_dl = DataLoader(validation, batch_size = batch_size , shuffle=False,drop_last=True,num_workers=num_workers,persistent_workers=persistent_workers)
+        ##the device loaders are built after the trainer, on its device
+        device_resident = dataset_on_device is not None and isinstance(train,MyDataset) and isinstance(validation,MyDataset)
+        if device_resident:
+            assert dataset_on_device in ['device','pinned'], beauty_string('dataset_on_device must be None, device or pinned','info',True)
+        else:
+            train_dl = self._data_loader(train, batch_size = batch_size , shuffle=True,drop_last=True,num_workers=num_workers,persistent_workers=persistent_workers)
+            valid_dl = self._data_loader(validation, batch_size = batch_size , shuffle=False,drop_last=True,num_workers=num_workers,persistent_workers=persistent_workers)
    
         checkpoint_callback = ModelCheckpoint(dirpath=dirpath,
                                      monitor='val_loss',
@@ -712,6 +861,8 @@ class TimeSeries():
         
         
         #logger = CSVLogger("logs", name=dirpath)
+        ##aim is imported only for training, it is slow to import
+        from aim.pytorch_lightning import AimLogger
         aim_logger = AimLogger(
             experiment=self.name,
             train_metric_prefix='train_',
@@ -734,8 +885,8 @@ class TimeSeries():
 
         aim_logger.experiment.track(n_params,name='N-parameters')
         aim_logger.experiment.track(size_all_mb,name='dim-model-MB')
-        aim_logger.experiment.track(len(train_dl.dataset),name='len-train')
-        aim_logger.experiment.track(len(valid_dl.dataset),name='len-valid')
+        aim_logger.experiment.track(len(train),name='len-train')
+        aim_logger.experiment.track(len(validation),name='len-valid')
         #aim_logger.experiment.track(self.config,name=None)
         tmp = self.config.copy()
         tmp['model_name'] = self.model.name
@@ -757,6 +908,13 @@ class TimeSeries():
                              precision=precision,
                              gradient_clip_val=gradient_clip_val,
                              gradient_clip_algorithm=gradient_clip_algorithm)#,devices=1)
+        if device_resident:
+            ##each process would iterate the whole dataset: there is no distributed sampler
+            assert trainer.num_devices*trainer.num_nodes==1, beauty_string('dataset_on_device supports only one device, set devices (e.g. devices=[0])','info',True)
+            device = trainer.strategy.root_device
+            beauty_string(f'Storing the datasets on {dataset_on_device} memory ({device})','info',self.verbose)
+            train_dl = DeviceDataLoader(train, batch_size = batch_size , shuffle=True,drop_last=True,device=device,pin_memory=dataset_on_device=='pinned')
+            valid_dl = DeviceDataLoader(validation, batch_size = batch_size , shuffle=False,drop_last=True,device=device,pin_memory=dataset_on_device=='pinned')
         tot_seconds = time.time()
 
         if auto_lr_find:
@@ -789,7 +947,7 @@ class TimeSeries():
         if isinstance(self.losses,dict):
             self.losses = pd.DataFrame()
         try:
-            self.model = self.model.load_from_checkpoint(self.checkpoint_file_last)
+            self._load_weights(self.checkpoint_file_last)
         except Exception as _:
             beauty_string(f'There is a problem loading the weights on file {self.checkpoint_file_last}','section',self.verbose)
 
@@ -799,6 +957,7 @@ class TimeSeries():
             beauty_string('Can not extract the validation loss, maybe it is a persistent model','info',self.verbose)
             val_loss = 100
         self.is_trained = True
+        self._log_worker_memory()
         
         beauty_string('END of the training process','block',self.verbose)
 
@@ -813,7 +972,8 @@ class TimeSeries():
                          num_workers:int=4,
                          split_params:Union[None,dict]=None,set:str='test',
                          rescaling:bool=True,
-                         data:Union[None,torch.utils.data.Dataset]=None)->pd.DataFrame:
+                         data:Union[None,torch.utils.data.Dataset]=None,
+                         wide:bool=False)->Union[pd.DataFrame,dict]:
         """This function allows to get the prediction on a particular set (train, test or validation). 
 
         Args:
@@ -823,12 +983,38 @@ class TimeSeries():
             set (str, optional): trai, validation or test. Defaults to 'test'.
             rescaling (bool, optional):  If rescaling is true the output will be rescaled to the initial values. . Defaults to True.
             data (None or pd.DataFrame, optional). If not None the inference is performed on the given data. In the case of custom data please call inference because it will normalize the data for you!
+            wide (bool, optional): if True the arrays are returned without building the long format: a dictionary with `prediction` (sample x lag x target x quantile), `real` (sample x lag x target), `time` (sample x lag), `group` (sample) and the `coords` of the axes. Defaults to False.
         Returns:
-            pd.DataFrame: the predicted values in a pandas format
+            Union[pd.DataFrame,dict]: the predicted values in a pandas format (or the wide dictionary)
         """
         
         beauty_string('Inference on a set (train, validation o test)','block',self.verbose)
-     
+        for chunk in self.iter_inference(batch_size=batch_size,num_workers=num_workers,split_params=split_params,set=set,rescaling=rescaling,data=data,chunk_size=None,wide=wide):
+            return chunk
+
+    def iter_inference(self,batch_size:int=100,
+                       num_workers:int=4,
+                       split_params:Union[None,dict]=None,set:str='test',
+                       rescaling:bool=True,
+                       data:Union[None,torch.utils.data.Dataset]=None,
+                       chunk_size:Union[int,None]=10000,
+                       wide:bool=False)->Iterator[Union[pd.DataFrame,dict]]:
+        """Same as `inference_on_set` but the predictions are yielded in blocks of (at least) `chunk_size` samples, already rescaled, so the memory does not depend on the size of the set.
+        The rows of each block are ordered by lag and then by sample. See also `inference_to_parquet`
+
+        Args:
+            batch_size (int, optional): see inference_on_set. Defaults to 100.
+            num_workers (int, optional): see inference_on_set. Defaults to 4.
+            split_params (Union[None,dict], optional): see inference_on_set. Defaults to None.
+            set (str, optional): see inference_on_set. Defaults to 'test'.
+            rescaling (bool, optional): see inference_on_set. Defaults to True.
+            data (Union[None,torch.utils.data.Dataset], optional): see inference_on_set. Defaults to None.
+            chunk_size (Union[int,None], optional): number of samples of each block, if None a single block is returned. Defaults to 10000.
+            wide (bool, optional): see inference_on_set. Defaults to False.
+
+        Yields:
+            Union[pd.DataFrame,dict]: the predictions of each block
+        """
         if data is None:
             if split_params is None:
                 beauty_string(f'splitting using train parameters {self.split_params}','section',self.verbose)
@@ -839,15 +1025,15 @@ class TimeSeries():
         if set=='test':
             if self.modifier is not None:
                 test = self.modifier.transform(test)
-            dl = DataLoader(test, batch_size = batch_size , shuffle=False,drop_last=False,num_workers=num_workers)
+            dl = self._data_loader(test, batch_size = batch_size , shuffle=False,drop_last=False,num_workers=num_workers)
         elif set=='validation':
             if self.modifier is not None:
                 validation = self.modifier.transform(validation)
-            dl = DataLoader(validation, batch_size = batch_size , shuffle=False,drop_last=False,num_workers=num_workers)
+            dl = self._data_loader(validation, batch_size = batch_size , shuffle=False,drop_last=False,num_workers=num_workers)
         elif set=='train':
             if self.modifier is not None:
                 train = self.modifier.transform(train)
-            dl = DataLoader(train, batch_size = batch_size , shuffle=False,drop_last=False,num_workers=num_workers)    
+            dl = self._data_loader(train, batch_size = batch_size , shuffle=False,drop_last=False,num_workers=num_workers)    
         elif set=='custom':
             if self.check_custom:
                 pass
@@ -855,7 +1041,7 @@ class TimeSeries():
                 beauty_string('If you are here something went wrong, please report it','section',self.verbose)
             if self.modifier is not None:
                 data = self.modifier.transform(data)
-            dl = DataLoader(data, batch_size = batch_size , shuffle=False,drop_last=False,num_workers=num_workers)    
+            dl = self._data_loader(data, batch_size = batch_size , shuffle=False,drop_last=False,num_workers=num_workers)    
   
         else:
             beauty_string('Select one of train, test, or validation set','section',self.verbose)
@@ -866,76 +1052,126 @@ class TimeSeries():
         self.model.to(torch.device("cuda:0" if torch.cuda.is_available() else "cpu"))
         beauty_string(f'Device used: {self.model.device}','info',self.verbose)
 
+        columns = [self.num_var.index(c) for c in self.target_variables]
+        ##without modifiers the batches are rescaled in place on the device before the transfer
+        rescale_batches = rescaling and self.modifier is None
+        if rescaling:
+            beauty_string('Scaling back','info',self.verbose)
+        start = 0
+        offset = 0
         for batch in dl:
-            res.append(self.model.inference(batch).cpu().detach().numpy())
-            real.append(batch['y'].cpu().detach().numpy())
-       
+            prediction = self.model.inference(batch).detach()
+            y = batch['y'].detach()
+            if rescale_batches:
+                batch_groups = self._samples_groups(dl.dataset,offset,offset+y.shape[0]) if self.normalize_per_group else None
+                self.scaler_num.inverse_transform_(prediction,batch_groups,columns,axis=2)
+                self.scaler_num.inverse_transform_(y,batch_groups,columns,axis=2)
+            offset+=y.shape[0]
+            res.append(prediction.cpu().numpy())
+            real.append(y.cpu().numpy())
+            if chunk_size is not None and offset-start>=chunk_size:
+                yield self._inference_chunk(dl.dataset,res,real,start,offset,rescaling and not rescale_batches,columns,wide)
+                res = []
+                real = []
+                start = offset
+        self._log_worker_memory()
+        if len(res)>0:
+            yield self._inference_chunk(dl.dataset,res,real,start,offset,rescaling and not rescale_batches,columns,wide)
+
+    def _samples_time(self,dataset:torch.utils.data.Dataset,start:int,end:int)->np.array:
+        if isinstance(dataset,MyDataset):
+            return dataset.get_time(slice(start,end))
+        return dataset.t[start:end]
+
+    def _samples_groups(self,dataset:torch.utils.data.Dataset,start:int,end:int)->Union[np.array,None]:
+        if isinstance(dataset,MyDataset):
+            return dataset.get_groups(slice(start,end))
+        groups = getattr(dataset,'groups',None)
+        return None if groups is None else groups[start:end]
+
+    def _inference_chunk(self,dataset:torch.utils.data.Dataset,res:List[np.array],real:List[np.array],start:int,end:int,rescaling:bool,columns:List[int],wide:bool)->Union[pd.DataFrame,dict]:
+        """Stack the batches of a block of samples, apply the modifier and (if not already done on the device) the rescaling and build the output
+
+        :meta private:
+        """
         res = np.vstack(res)
- 
         real = np.vstack(real)
-        time = dl.dataset.t
-        groups = dl.dataset.groups
-        #import pdb
-        #pdb.set_trace()
+        time = self._samples_time(dataset,start,end)
+        groups = self._samples_groups(dataset,start,end)
         if self.modifier is not None:
             res,real = self.modifier.inverse_transform(res,real)
 
         ## BxLxCx3
         if rescaling:
-            beauty_string('Scaling back','info',self.verbose)
-            if self.normalize_per_group is False:
-                for i, c in enumerate(self.target_variables):
-                    real[:,:,i] = self.scaler_num[c].inverse_transform(real[:,:,i].reshape(-1,1)).reshape(-1,real.shape[1])
-                    for j in range(res.shape[3]):
-                        res[:,:,i,j] = self.scaler_num[c].inverse_transform(res[:,:,i,j].reshape(-1,1)).reshape(-1,res.shape[1])
-            else:
-                for group in np.unique(groups):
-                    idx = np.where(groups==group)[0]
-                    for i, c in enumerate(self.target_variables):
-                        real[idx,:,i] = self.scaler_num[f'{c}_{group}'].inverse_transform(real[idx,:,i].reshape(-1,1)).reshape(-1,real.shape[1])
-                        for j in range(res.shape[3]):
-                            res[idx,:,i,j] = self.scaler_num[f'{c}_{group}'].inverse_transform(res[idx,:,i,j].reshape(-1,1)).reshape(-1,res.shape[1])
-
-        if self.model.use_quantiles:
-            time = pd.DataFrame(time,columns=[i+1 for i in range(res.shape[1])])
-            
-            if self.group is not None:
-                time[self.group] = groups
-                time = time.melt(id_vars=['region'])
-            else:
-                time = time.melt()
-            time.rename(columns={'value':'time','variable':'lag'},inplace=True)
+            scaling_groups = groups if self.normalize_per_group else None
+            real = self.scaler_num.inverse_transform(real,scaling_groups,columns,axis=2).astype(real.dtype)
+            res = self.scaler_num.inverse_transform(res,scaling_groups,columns,axis=2).astype(res.dtype)
+
+        if wide:
+            return {'prediction':res,
+                    'real':real,
+                    'time':time,
+                    'group':groups if self.group is not None else None,
+                    'coords':{'lag':np.arange(1,res.shape[1]+1),
+                              'target':list(self.target_variables),
+                              'quantile':['low','median','high'] if self.model.use_quantiles else ['pred']}}
+        return self._predictions_frame(res,real,time,groups)
+
+    def inference_to_parquet(self,path:str,
+                             batch_size:int=100,
+                             num_workers:int=4,
+                             split_params:Union[None,dict]=None,set:str='test',
+                             rescaling:bool=True,
+                             data:Union[None,torch.utils.data.Dataset]=None,
+                             chunk_size:int=10000)->int:
+        """Write the predictions of `iter_inference` block by block in a parquet dataset partitioned by group (if any) and lag (see `PredictionWriter`), the memory is bounded by `chunk_size`
 
-                
-            tot = [time]
-            for i, c in enumerate(self.target_variables):
-                tot.append(pd.DataFrame(real[:,:,i],columns=[i+1 for i in range(res.shape[1])]).melt().rename(columns={'value':c}).drop(columns=['variable']))
-                tot.append(pd.DataFrame(res[:,:,i,0],columns=[i+1 for i in range(res.shape[1])]).melt().rename(columns={'value':c+'_low'}).drop(columns=['variable']))
-                tot.append(pd.DataFrame(res[:,:,i,1],columns=[i+1 for i in range(res.shape[1])]).melt().rename(columns={'value':c+'_median'}).drop(columns=['variable']))
-                tot.append(pd.DataFrame(res[:,:,i,2],columns=[i+1 for i in range(res.shape[1])]).melt().rename(columns={'value':c+'_high'}).drop(columns=['variable']))
-
-            res = pd.concat(tot,axis=1)
-        
-            
-        ## BxLxCx1
-        else:
-            time = pd.DataFrame(time,columns=[i+1 for i in range(res.shape[1])])#.melt()
+        Args:
+            path (str): folder of the parquet dataset, it is overwritten
+            batch_size (int, optional): see inference_on_set. Defaults to 100.
+            num_workers (int, optional): see inference_on_set. Defaults to 4.
+            split_params (Union[None,dict], optional): see inference_on_set. Defaults to None.
+            set (str, optional): see inference_on_set. Defaults to 'test'.
+            rescaling (bool, optional): see inference_on_set. Defaults to True.
+            data (Union[None,torch.utils.data.Dataset], optional): see inference_on_set. Defaults to None.
+            chunk_size (int, optional): see iter_inference. Defaults to 10000.
 
-            if self.group is not None:
-                time[self.group] = groups
-                time = time.melt(id_vars=['region'])
-            else:
-                time = time.melt()
-            time.rename(columns={'value':'time','variable':'lag'},inplace=True)
-                 
+        Returns:
+            int: number of rows written
+        """
+        beauty_string(f'Writing the predictions in {path}','block',self.verbose)
+        with PredictionWriter(path,partition_cols=['lag'] if self.group is None else [self.group,'lag']) as writer:
+            for chunk in self.iter_inference(batch_size=batch_size,num_workers=num_workers,split_params=split_params,set=set,rescaling=rescaling,data=data,chunk_size=chunk_size):
+                writer.write(chunk)
+        return writer.rows
 
-            tot = [time]
-            for i, c in enumerate(self.target_variables):
-                tot.append(pd.DataFrame(real[:,:,i],columns=[i+1 for i in range(res.shape[1])]).melt().rename(columns={'value':c}).drop(columns=['variable']))
-                tot.append(pd.DataFrame(res[:,:,i,0],columns=[i+1 for i in range(res.shape[1])]).melt().rename(columns={'value':c+'_pred'}).drop(columns=['variable']))
-            res = pd.concat(tot,axis=1)
+    def _predictions_frame(self,res:np.array,real:np.array,time:np.array,groups:np.array)->pd.DataFrame:
+        """Long format of the predictions (one row for each sample and lag) built directly from the arrays, the rows are ordered by lag and then by sample
+
+        Args:
+            res (np.array): predictions of shape BxLxCxQ (Q=3 if the model uses quantiles)
+            real (np.array): real values of shape BxLxC
+            time (np.array): time of the targets of shape BxL
+            groups (np.array): group of each sample
+
+        Returns:
+            pd.DataFrame: the columns are the group (if any), lag, time, the real values, the predictions (low, median and high if the model uses quantiles) and prediction_time
 
-        res['prediction_time'] = res.apply(lambda x: x.time-self.freq*x.lag, axis=1)
+        :meta private:
+        """
+        B,L = res.shape[0],res.shape[1]
+        suffixes = ['_low','_median','_high'] if self.model.use_quantiles else ['_pred']
+        tot = {}
+        if self.group is not None:
+            tot[self.group] = np.tile(np.asarray(groups),L)
+        tot['lag'] = np.repeat(np.arange(1,L+1),B)
+        tot['time'] = np.asarray(time).reshape(B,L).T.reshape(-1)
+        for i, c in enumerate(self.target_variables):
+            tot[c] = real[:,:,i].T.reshape(-1)
+            for j,suffix in enumerate(suffixes):
+                tot[c+suffix] = res[:,:,i,j].T.reshape(-1)
+        res = pd.DataFrame(tot)
+        res['prediction_time'] = res['time']-res['lag']*self.freq
         return res
     def inference(self,batch_size:int=100,
                   num_workers:int=4,
@@ -943,11 +1179,12 @@ class TimeSeries():
                   rescaling:bool=True,
                   data:pd.DataFrame=None,
                   steps_in_future:int=0,
-                  check_holes_and_duplicates:bool=True)->pd.DataFrame:
+                  check_holes_and_duplicates:bool=True,
+                  wide:bool=False)->Union[pd.DataFrame,dict]:
         
         """similar to `inference_on_set`
         only change is split_params that must contain this keys but using the default can be sufficient:
-        'past_steps','future_steps','shift','keep_entire_seq_while_shifting','starting_point'
+        'past_steps','future_steps','shift','keep_entire_seq_while_shifting','starting_point','windowed'
         
         skip_step is set to 1 for convenience (generally you want all the predictions)
         You can set split_params to None and use the standard parameters (at your own risck)
@@ -961,6 +1198,7 @@ class TimeSeries():
             data (pd.DataFrame, optional): startin dataset. Defaults to None.
             steps_in_future (int, optional): if>0 the dataset is extendend in order to make predictions in the future. Defaults to 0.
             check_holes_and_duplicates (bool, optional): if False the routine does not check for holes or for duplicates, set to False for stacked model. Defaults to True.
+            wide (bool, optional): see inference_on_set. Defaults to False.
 
         Returns:
             pd.DataFrame: predicted values
@@ -971,20 +1209,14 @@ class TimeSeries():
         ## enlarge the dataset in order to have all the rows needed
         if check_holes_and_duplicates:
             if self.group is None:
-                freq = pd.to_timedelta(np.diff(data.time).min())
+                freq = np.diff(data.time).min()
                 beauty_string(f'Detected minumum frequency: {freq}','section',self.verbose)
-                empty = pd.DataFrame({'time':pd.date_range(data.time.min(),data.time.max()+freq*(steps_in_future+self.split_params['past_steps']+self.split_params['future_steps']),freq=freq)})
-
             else:
-                freq = pd.to_timedelta(np.diff(data[data[self.group==data[self.group].unique()[0]]].time).min())
+                freq = np.diff(data[data[self.group]==data[self.group].unique()[0]].time).min()
                 beauty_string(f'Detected minumum frequency: {freq} supposing constant frequence inside the groups','section',self.verbose)
-                _min = data.groupby(self.group).time.min()
-                _max = data.groupby(self.group).time.max()
-                empty = []
-                for c in data[self.group].unique():
-                    empty.append(pd.DataFrame({self.group:c,'time':pd.date_range(_min.time[_min[self.group]==c].values[0],_max.time[_max[self.group]==c].values[0]+freq*(steps_in_future+self.split_params['past_steps']+self.split_params['future_steps']),freq=freq)}))
-                empty = pd.concat(empty,ignore_index=True)
-            dataset = empty.merge(data,how='left')
+            if pd.api.types.is_datetime64_any_dtype(data.time):
+                freq = pd.to_timedelta(freq)
+            dataset = fill_time_holes(data,freq,self.group,extra_steps=steps_in_future+self.split_params['past_steps']+self.split_params['future_steps'])
         else:
             dataset = data.copy()
         
@@ -992,39 +1224,152 @@ class TimeSeries():
         if split_params is None:
             split_params = {}
             for c in self.split_params.keys():
-                if c in ['past_steps','future_steps','shift','keep_entire_seq_while_shifting','starting_point']:
+                if c in ['past_steps','future_steps','shift','keep_entire_seq_while_shifting','starting_point','windowed']:
                     split_params[c] = self.split_params[c]
             split_params['skip_step']=1
             data = self.create_data_loader(dataset,**split_params)
         else:
             data = self.create_data_loader(data,**split_params)
 
-        res = self.inference_on_set(batch_size=batch_size,num_workers=num_workers,split_params=None,set='custom',rescaling=rescaling,data=data)
+        res = self.inference_on_set(batch_size=batch_size,num_workers=num_workers,split_params=None,set='custom',rescaling=rescaling,data=data,wide=wide)
         self.check_custom = False
         return res
         
-    def save(self, filename:str)->None:
+    def prepare_forecast(self,history:pd.DataFrame,future:Union[pd.DataFrame,None]=None)->dict:
+        """Build the input of the model for forecasting the steps after the end of a single series, without creating a dataset (see `dsipts.serving.ForecastServer`)
+
+        Args:
+            history (pd.DataFrame): raw recent history of one series (and one group), the last `past_steps` time steps must be present with all the past variables
+            future (Union[pd.DataFrame,None], optional): the known variables (future and categorical not derived from the time) for the next `future_steps` time steps. It can be None if the model does not use future variables. Defaults to None.
+
+        Returns:
+            dict: `batch` (the arrays of a batch of one sample, without `idx_target`), `time` (time of the predicted steps) and `group`
+        """
+        if self.stacked or self.modifier is not None:
+            raise ValueError('Forecasting without a dataset is not available for stacked models and models with a modifier')
+        past_steps = self.split_params['past_steps']
+        future_steps = self.split_params['future_steps']
+        shift = self.split_params.get('shift',0)
+        future_length = future_steps+shift if self.split_params.get('keep_entire_seq_while_shifting',False) else future_steps
+        if self.group is not None and history[self.group].nunique()!=1:
+            raise ValueError(f'The history must contain one {self.group}')
+        group = history[self.group].values[0] if self.group is not None else None
+
+        ##the rows are aligned on the expected time grid, the holes become nan
+        last = history.time.max()
+        times = np.concatenate([np.asarray(last-np.arange(past_steps-1,-1,-1)*self.freq),np.asarray(last+np.arange(1,future_steps+1)*self.freq)])
+        sources = [(history,pd.Index(history.time.values).get_indexer(times[:past_steps]),slice(0,past_steps))]
+        if future is not None:
+            sources.append((future,pd.Index(future.time.values).get_indexer(times[past_steps:]),slice(past_steps,None)))
+        ##the categorical variables derived from the time are added by `enrich`
+        enriched = ['hour','dow','month','minute']
+        required = self.future_variables+[c for c in self.cat_var if c not in enriched+[self.group]]
+        missing = [c for c in required if future is None or c not in future.columns or (sources[1][1]<0).any()]
+        if len(missing)>0:
+            raise ValueError(f'The future values of {missing} are required')
+
+        data = pd.DataFrame({'time':times})
+        for c in self.cat_var:
+            if c in enriched:
+                self.enrich(data,c)
+            elif c!=self.group:
+                data[c] = np.concatenate([frame[c].values[index] for frame,index,_ in sources])
+        for c in self.num_var:
+            values = np.full(len(times),np.nan)
+            for frame,index,position in sources:
+                if c in frame.columns:
+                    values[position] = np.where(index>=0,frame[c].values[index],np.nan)
+            data[c] = values
+        if not np.isfinite(data[self.past_variables].values[:past_steps].astype(float)).all():
+            raise ValueError(f'The history must contain the last {past_steps} steps without holes')
+        group_name = group if self.group is not None else '1'
+        groups = np.repeat(group_name,len(times)) if self.normalize_per_group else None
+        if self.group is not None:
+            data[self.group] = group
+        num = self.scaler_num.transform(data[self.num_var].values,groups)
+        num = {c:num[:,i] for i,c in enumerate(self.num_var)}
+        x_num_past = np.stack([num[c] for c in self.past_variables],axis=1)
+
+        batch = {'y':np.nan_to_num(np.stack([num[c] for c in self.target_variables],axis=1)[past_steps:]).astype(np.float32)[None],
+                 'x_num_past':x_num_past[:past_steps].astype(np.float32)[None]}
+        if len(self.future_variables)>0:
+            x_num_future = np.stack([num[c] for c in self.future_variables],axis=1)
+            batch['x_num_future'] = x_num_future[past_steps-shift:past_steps-shift+future_length].astype(np.float32)[None]
+            if not np.isfinite(batch['x_num_future']).all():
+                raise ValueError(f'The future values of {self.future_variables} contain holes')
+        if len(self.cat_var)>0:
+            x_cat = self.scaler_cat.transform(data[self.cat_var],groups)
+            batch['x_cat_past'] = x_cat[:past_steps][None]
+            batch['x_cat_future'] = x_cat[past_steps-shift:past_steps-shift+future_length][None]
+        return {'batch':batch,'time':times[past_steps:],'group':group_name}
+
+    def save(self, filename:str,format:str='pkl',weights_dtype:Union[str,None]=None)->None:
         """save the timeseries object
 
         Args:
             filename (str): name of the file
+            format (str, optional): `pkl` for a single pickle file (`filename.pkl`), `dir` for a folder (`filename`) with the metadata in JSON, the scalers in numpy format, the dataset in parquet and the weights of the model (if trained),
+                that can be loaded without reading the dataset (see `dsipts.data_structure.artifact`). Defaults to 'pkl'.
+            weights_dtype (Union[str,None], optional): dtype of the weights saved in the folder, see `export_weights`. Defaults to None.
         """
         beauty_string('Saving','block',self.verbose)
-        with open(f'{filename}.pkl','wb') as f:
-            params =  self.__dict__.copy()
-            for k in ['model']:
-                if k in params.keys():
-                    _ = params.pop(k)
-            pickle.dump(params,f)
+        ##the dataset of a loaded folder is read before saving
+        _ = self.dataset if self.__dict__.get('_dataset_file',None) is not None else None
+        params =  self.__dict__.copy()
+        for k in ['model','dataset_cache','worker_pool','_dataset_file','_weights_file']:
+            if k in params.keys():
+                _ = params.pop(k)
+        if format=='dir':
+            save_artifact(params,filename,self.model if self.is_trained and getattr(self,'model',None) is not None else None,weights_dtype)
+        elif format=='pkl':
+            with open(f'{filename}.pkl','wb') as f:
+                pickle.dump(params,f)
+        else:
+            raise ValueError(f'Format {format} not supported, use pkl or dir')
+
+    def __getattr__(self,name:str):
+        ##the dataset of a timeseries loaded from a folder is read at the first access
+        if name=='dataset' and self.__dict__.get('_dataset_file',None) is not None:
+            self.dataset = read_dataset(self.__dict__.pop('_dataset_file'))
+            return self.dataset
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def _load_weights(self,path:str)->None:
+        """Load the weights of a checkpoint (or of a file saved by `export_weights`) in the current model. `load_from_checkpoint` would instantiate the model a second time
+        and read the whole checkpoint, here the file is memory mapped and only the weights are copied in the model
+
+        Args:
+            path (str): path of the checkpoint
+        """
+        start = time.time()
+        before = memory_usage()['rss_mb']
+        checkpoint = load_checkpoint(path)
+        self.model.on_load_checkpoint(checkpoint)
+        self.model.load_state_dict(checkpoint['state_dict'])
+        del checkpoint
+        beauty_string(f'Weights loaded from {path} in {(time.time()-start)*1000:.1f} ms, RSS {before:.0f} -> {memory_usage()["rss_mb"]:.0f} MB','info',self.verbose)
+
+    def export_weights(self,path:str,dtype:Union[str,None]=None)->int:
+        """Save only the weights of the model, they can be loaded with `ts.load(...,weight_path=path)`. It is also done by `save` with `format='dir'`
+
+        Args:
+            path (str): output file
+            dtype (Union[str,None], optional): `float16` or `bfloat16` for halving the size of the file. Defaults to None.
 
+        Returns:
+            int: size of the file in bytes
+        """
+        size = export_state_dict(self.model,path,dtype)
+        beauty_string(f'Weights saved in {path} ({size/1024**2:.2f} MB)','info',self.verbose)
+        return size
 
     def load(self,model:Base, filename:str,load_last:bool=True,dirpath:Union[str,None]=None,weight_path:Union[str, None]=None)->None:
         """ Load a saved model
 
         Args:
             model (Base): class of the model to load (it will be initiated by pytorch-lightening)
-            filename (str): filename of the saved model
-            load_last (bool, optional): if true the last checkpoint will be loaded otherwise the best (in the validation set). Defaults to True.
+            filename (str): filename of the saved model (a folder if saved with `format='dir'`, in this case the dataset is read only if used)
+            load_last (bool, optional): if true the last checkpoint (or the weights saved in the folder) will be loaded otherwise the best (in the validation set). Defaults to True.
             dirpath (Union[str,None], optional): if None we asssume that the model is loaded from the same pc where it has been trained, otherwise we can pass the dirpath where all the stuff has been saved . Defaults to None.
             weight_path (Union[str, None], optional): if None the standard path will be used. Defaults to None.
         """
@@ -1035,10 +1380,20 @@ class TimeSeries():
         self.modifier = None
         self.check_custom = False
         self.is_trained = True
-        with open(filename+'.pkl','rb') as f:
-            params = pickle.load(f)
-            for p in params:
-                setattr(self,p, params[p])    
+        self.__dict__.pop('dataset',None)
+        self._weights_file = None
+        if os.path.isdir(filename):
+            params = load_artifact(filename)
+        else:
+            with open(filename+'.pkl','rb') as f:
+                params = pickle.load(f)
+        for p in params:
+            setattr(self,p, params[p])    
+        if isinstance(self.scaler_num,dict):
+            ##objects saved with the previous versions, one sklearn scaler per column (and group)
+            groups = self.scaler_cat[self.group].classes_ if self.normalize_per_group else None
+            self.scaler_num = NumericalScaler.from_sklearn(self.scaler_num,self.num_var,groups)
+            self.scaler_cat = CategoricalEncoder.from_sklearn(self.scaler_cat,self.cat_var,groups,self.group)
         if 'verbose' in self.config['model_configs'].keys():
             self.config['model_configs'].pop('verbose')
         self.model = model(**self.config['model_configs'],optim_config = self.config['optim_config'],scheduler_config =self.config['scheduler_config'],verbose=self.verbose )
@@ -1046,6 +1401,8 @@ class TimeSeries():
         
         if weight_path is not None:
             tmp_path = weight_path
+        elif load_last and self._weights_file is not None:
+            tmp_path = self._weights_file
         else:
             if self.dirpath is not None:
                 directory = self.dirpath
@@ -1067,6 +1424,6 @@ class TimeSeries():
                     beauty_string('checkpoint_file_best not defined try to load best','section',self.verbose)
                     tmp_path = os.path.join(directory,self.checkpoint_file_last.split('/')[-1])
         try:
-            self.model = self.model.load_from_checkpoint(tmp_path,verbose=self.verbose)
+            self._load_weights(tmp_path)
         except Exception as e:
             beauty_string(f'There is a problem loading the weights on file {tmp_path} {e}','section',self.verbose)
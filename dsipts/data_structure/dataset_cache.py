@@ -0,0 +1,124 @@
+import os
+import json
+import pickle
+import hashlib
+import shutil
+import uuid
+import pandas as pd
+from typing import Union, Any
+from .utils import beauty_string
+
+
+class DatasetCache():
+
+    def __init__(self,path:str,max_size_mb:float=10000,verbose:bool=True):
+        """Persistent cache of the datasets built by `TimeSeries.split_for_train`. Each entry is a folder in `path` named with the fingerprint of the inputs (dataset content, scalers and split parameters),
+        so it can be shared among different processes and runs. When the total size exceeds `max_size_mb` the least recently used entries are removed.
+
+        Args:
+            path (str): folder of the cache
+            max_size_mb (float, optional): maximum size of the cache in MB. Defaults to 10000.
+            verbose (bool, optional): log hits and misses. Defaults to True.
+        """
+        self.path = path
+        self.max_size_mb = max_size_mb
+        self.verbose = verbose
+        os.makedirs(path,exist_ok=True)
+
+    @staticmethod
+    def fingerprint(dataset:pd.DataFrame,**kwargs)->str:
+        """Compute the key of an entry
+
+        Args:
+            dataset (pd.DataFrame): the dataset, its content, columns and types are hashed
+            kwargs: other objects identifying the entry. Plain json objects are hashed as json, all the other objects (e.g. fitted scalers, datetimes) are pickled
+                so that their whole state enters the key
+
+        Returns:
+            str: hexadecimal digest
+        """
+        h = hashlib.sha1()
+        h.update(pd.util.hash_pandas_object(dataset,index=True).values.tobytes())
+        h.update(str(list(zip(dataset.columns,dataset.dtypes.astype(str)))).encode())
+        for k in sorted(kwargs.keys()):
+            h.update(k.encode())
+            ##no default=str here: it would reduce a fitted object to its name (e.g. StandardScaler())
+            try:
+                h.update(json.dumps(kwargs[k],sort_keys=True).encode())
+            except (TypeError,ValueError) as _:
+                h.update(pickle.dumps(kwargs[k]))
+        return h.hexdigest()
+
+    def _entry(self,key:str)->str:
+        return os.path.join(self.path,key,'entry.pkl')
+
+    def get(self,key:str)->Union[Any,None]:
+        """Get an entry and mark it as used
+
+        Args:
+            key (str): key of the entry
+
+        Returns:
+            Union[Any,None]: the stored object or None if not present
+        """
+        filename = self._entry(key)
+        try:
+            with open(filename,'rb') as f:
+                res = pickle.load(f)
+            os.utime(filename)
+            beauty_string(f'Dataset cache hit {key}','info',self.verbose)
+            return res
+        except Exception as _:
+            beauty_string(f'Dataset cache miss {key}','info',self.verbose)
+            return None
+
+    def put(self,key:str,value:Any)->None:
+        """Store an entry and evict the least recently used entries if needed. The file is written with a temporary name and then renamed, so concurrent processes never read partial entries
+
+        Args:
+            key (str): key of the entry
+            value (Any): object to store
+        """
+        os.makedirs(os.path.join(self.path,key),exist_ok=True)
+        tmp = os.path.join(self.path,key,f'.{uuid.uuid4().hex}.tmp')
+        with open(tmp,'wb') as f:
+            pickle.dump(value,f,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp,self._entry(key))
+        self.evict()
+
+    def entries(self)->pd.DataFrame:
+        """List the entries of the cache
+
+        Returns:
+            pd.DataFrame: key, size in MB and last access of each entry ordered from the least recently used
+        """
+        res = []
+        for key in os.listdir(self.path):
+            filename = self._entry(key)
+            if os.path.exists(filename):
+                stat = os.stat(filename)
+                res.append({'key':key,'size_mb':stat.st_size/1024**2,'last_access':stat.st_mtime})
+        return pd.DataFrame(res,columns=['key','size_mb','last_access']).sort_values(by='last_access',ignore_index=True)
+
+    def evict(self)->None:
+        """Remove the least recently used entries until the size of the cache is below `max_size_mb`
+        """
+        entries = self.entries()
+        size = entries.size_mb.sum()
+        for _,row in entries.iterrows():
+            if size<=self.max_size_mb:
+                break
+            self.invalidate(row.key)
+            size-=row.size_mb
+
+    def invalidate(self,key:Union[str,None]=None)->None:
+        """Remove an entry or the whole cache
+
+        Args:
+            key (Union[str,None], optional): key to remove, if None all the entries are removed. Defaults to None.
+        """
+        if key is None:
+            for k in os.listdir(self.path):
+                shutil.rmtree(os.path.join(self.path,k),ignore_errors=True)
+        else:
+            shutil.rmtree(os.path.join(self.path,key),ignore_errors=True)
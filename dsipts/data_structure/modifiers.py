@@ -1,7 +1,5 @@
 
 from abc import  abstractmethod,ABC
-from sklearn.cluster import BisectingKMeans
-from scipy.stats import bootstrap
 from torch.utils.data import Dataset
 import torch
 import numpy as np
@@ -129,6 +127,9 @@ class ModifierVVA(Modifier):
         _,length_in, _ = tmp.shape
         length_out = length//self.token_split
         tmp = tmp.reshape(-1,self.token_split)
+        ##imported here for not slowing down the import of the package
+        from sklearn.cluster import BisectingKMeans
+        from scipy.stats import bootstrap
         cl = BisectingKMeans(n_clusters=self.max_voc_size)
         clusters = cl.fit_predict(tmp)
         self.cl = cl
@@ -0,0 +1,327 @@
+import os
+import json
+import shutil
+from urllib.parse import quote, unquote
+import pandas as pd
+from typing import Iterator, List, Union
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError('pyarrow is required for writing and reading the predictions in parquet format, please install it with `pip install pyarrow`') from e
+    return pa,pq
+
+
+class PredictionWriter():
+
+    def __init__(self,path:str,partition_cols:Union[List[str],None]=None,overwrite:bool=True):
+        """Append blocks of predictions (for example the ones yielded by `TimeSeries.iter_inference`) to a parquet dataset, each block is written as soon as it arrives so only one block is kept in memory.
+        The schema is fixed by the first block.
+
+        Args:
+            path (str): folder of the dataset
+            partition_cols (Union[List[str],None], optional): columns used for the hive partitioning (for example the group and the lag). Defaults to None.
+            overwrite (bool, optional): remove the folder if already exists. Defaults to True.
+        """
+        self.pa,self.pq = _import_pyarrow()
+        self.path = path
+        self.partition_cols = partition_cols
+        self.schema = None
+        self.chunks = 0
+        self.rows = 0
+        if overwrite and os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path,exist_ok=True)
+
+    def write(self,chunk:pd.DataFrame)->None:
+        """Write a block of predictions
+
+        Args:
+            chunk (pd.DataFrame): the predictions
+        """
+        if chunk.shape[0]==0:
+            return None
+        table = self.pa.Table.from_pandas(chunk,schema=self.schema,preserve_index=False)
+        if self.schema is None:
+            self.schema = table.schema
+        ##the name of the files contains the number of the block so the blocks do not overwrite each other
+        self.pq.write_to_dataset(table,self.path,partition_cols=self.partition_cols,
+                                 basename_template=f'part-{self.chunks:06d}-{{i}}.parquet',
+                                 existing_data_behavior='overwrite_or_ignore')
+        self.chunks+=1
+        self.rows+=chunk.shape[0]
+
+    def write_all(self,chunks:Iterator[pd.DataFrame])->int:
+        """Write all the blocks of an iterator
+
+        Args:
+            chunks (Iterator[pd.DataFrame]): the blocks
+
+        Returns:
+            int: number of rows written
+        """
+        for chunk in chunks:
+            self.write(chunk)
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        return False
+
+
+def _plain_partitions(res:pd.DataFrame)->pd.DataFrame:
+    ##the partition columns are read as categorical
+    for c in res.columns:
+        if isinstance(res[c].dtype,pd.CategoricalDtype):
+            res[c] = res[c].astype(res[c].cat.categories.dtype)
+    return res
+
+
+def iter_predictions(path:str,filters:Union[List[tuple],None]=None,columns:Union[List[str],None]=None,batch_size:int=100000)->Iterator[pd.DataFrame]:
+    """Read the predictions written by `PredictionWriter` in blocks of at most `batch_size` rows
+
+    Args:
+        path (str): folder of the dataset
+        filters (Union[List[tuple],None], optional): see `read_predictions`. Defaults to None.
+        columns (Union[List[str],None], optional): see `read_predictions`. Defaults to None.
+        batch_size (int, optional): maximum number of rows of each block. Defaults to 100000.
+
+    Yields:
+        pd.DataFrame: the blocks of predictions
+    """
+    _,pq = _import_pyarrow()
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(path,format='parquet',partitioning='hive')
+    expression = None if filters is None else pq.filters_to_expression(filters)
+    for batch in dataset.to_batches(columns=columns,filter=expression,batch_size=batch_size):
+        if batch.num_rows>0:
+            yield _plain_partitions(batch.to_pandas())
+
+
+def read_predictions(path:str,filters:Union[List[tuple],None]=None,columns:Union[List[str],None]=None)->pd.DataFrame:
+    """Read the predictions written by `PredictionWriter`, the partition columns are converted back from categorical
+
+    Args:
+        path (str): folder of the dataset
+        filters (Union[List[tuple],None], optional): filters in the pyarrow format, for example [('lag','<=',3)]. The partitions not matching are not read. Defaults to None.
+        columns (Union[List[str],None], optional): columns to read, None for all. Defaults to None.
+
+    Returns:
+        pd.DataFrame: the predictions
+    """
+    _,pq = _import_pyarrow()
+    return _plain_partitions(pq.read_table(path,filters=filters,columns=columns).to_pandas())
+
+
+class PredictionStore():
+
+    levels = ['model','version','set']
+
+    def __init__(self,path:str):
+        """Local store of the predictions of several models: a parquet dataset partitioned by model, version, set and lag (`path/model=.../version=.../set=.../lag=...`).
+        Each entry (model, version, set) is written once by `write` and read with `query`, the filters on the partitions and on the time are pushed down to pyarrow so only the needed files and row groups are read.
+
+        Args:
+            path (str): root folder of the store
+        """
+        self.pa,self.pq = _import_pyarrow()
+        self.path = path
+        os.makedirs(path,exist_ok=True)
+
+    def entry_path(self,model:str,version:str,set:str)->str:
+        """Folder of an entry
+
+        Args:
+            model (str): name of the model
+            version (str): version of the model
+            set (str): set predicted (train, validation, test or custom)
+
+        Returns:
+            str: the folder
+        """
+        return os.path.join(self.path,*[f'{k}={quote(str(v),safe="")}' for k,v in zip(self.levels,[model,version,set])])
+
+    def has(self,model:str,version:str,set:str)->bool:
+        return os.path.isdir(self.entry_path(model,version,set))
+
+    def entries(self)->pd.DataFrame:
+        """List the entries in the store
+
+        Returns:
+            pd.DataFrame: one row for each entry with model, version and set
+        """
+        res = [[]]
+        root = [self.path]
+        for level in self.levels:
+            res_level, root_level = [],[]
+            for values,folder in zip(res,root):
+                for f in sorted(os.listdir(folder)):
+                    if f.startswith(f'{level}=') and not f.endswith('.tmp') and os.path.isdir(os.path.join(folder,f)):
+                        res_level.append(values+[unquote(f[len(level)+1:])])
+                        root_level.append(os.path.join(folder,f))
+            res, root = res_level, root_level
+        return pd.DataFrame(res,columns=self.levels)
+
+    def write(self,predictions:Union[pd.DataFrame,Iterator[pd.DataFrame]],model:str,version:str,set:str,key:Union[dict,None]=None)->int:
+        """Write (or replace) the predictions of an entry, the blocks of an iterator (for example `TimeSeries.iter_inference`) are written one at the time.
+        The entry is written in a temporary folder and moved in place at the end, so an interrupted write does not leave a partial entry
+
+        Args:
+            predictions (Union[pd.DataFrame,Iterator[pd.DataFrame]]): the predictions in the long format (see `TimeSeries.inference_on_set`)
+            model (str): name of the model
+            version (str): version of the model
+            set (str): set predicted
+            key (Union[dict,None], optional): what generated the predictions (for example hashes of the configuration and of the checkpoint), it is saved with the entry and used by `PredictionCache`. Defaults to None.
+
+        Returns:
+            int: number of rows written
+        """
+        path = self.entry_path(model,version,set)
+        tmp = path+'.tmp'
+        writer = PredictionWriter(tmp,partition_cols=['lag'])
+        writer.write_all([predictions] if isinstance(predictions,pd.DataFrame) else predictions)
+        if key is not None:
+            ##the files starting with _ are ignored by pyarrow while reading the dataset
+            with open(os.path.join(tmp,'_key.json'),'w') as f:
+                json.dump(key,f,sort_keys=True,default=str)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp,path)
+        return writer.rows
+
+    def get_key(self,model:str,version:str,set:str)->Union[dict,None]:
+        """Key saved with an entry
+
+        Returns:
+            Union[dict,None]: the key, None if the entry does not exist or has been saved without key
+        """
+        path = os.path.join(self.entry_path(model,version,set),'_key.json')
+        if not os.path.exists(path):
+            return None
+        with open(path,'r') as f:
+            return json.load(f)
+
+    def delete(self,model:str,version:str,set:str)->None:
+        path = self.entry_path(model,version,set)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+    def iter_query(self,models:Union[List[str],None]=None,
+                   versions:Union[List[str],None]=None,
+                   sets:Union[List[str],None]=None,
+                   lags:Union[List[int],None]=None,
+                   start=None,
+                   end=None,
+                   columns:Union[List[str],None]=None,
+                   batch_size:int=100000)->Iterator[pd.DataFrame]:
+        """Same as `query` but the predictions are yielded in blocks of at most `batch_size` rows
+
+        Yields:
+            pd.DataFrame: the blocks of predictions
+        """
+        import pyarrow.dataset as ds
+        entries = self.entries()
+        for level,values in zip(self.levels,[models,versions,sets]):
+            if values is not None:
+                entries = entries[entries[level].isin([str(v) for v in values])]
+        expression = None
+        for e in [None if lags is None else ds.field('lag').isin(list(lags)),
+                  None if start is None else ds.field('time')>=start,
+                  None if end is None else ds.field('time')<=end]:
+            if e is not None:
+                expression = e if expression is None else expression & e
+        for _,entry in entries.iterrows():
+            dataset = ds.dataset(self.entry_path(*entry.values),format='parquet',partitioning='hive')
+            read_columns = None if columns is None else [c for c in columns if c in dataset.schema.names]
+            for batch in dataset.to_batches(columns=read_columns,filter=expression,batch_size=batch_size):
+                if batch.num_rows>0:
+                    res = _plain_partitions(batch.to_pandas())
+                    for level in self.levels[::-1]:
+                        if columns is None or level in columns:
+                            res.insert(0,level,pd.Categorical([entry[level]]*res.shape[0]))
+                    yield res
+
+    def query(self,models:Union[List[str],None]=None,
+              versions:Union[List[str],None]=None,
+              sets:Union[List[str],None]=None,
+              lags:Union[List[int],None]=None,
+              start=None,
+              end=None,
+              columns:Union[List[str],None]=None)->pd.DataFrame:
+        """Read the predictions from the store
+
+        Args:
+            models (Union[List[str],None], optional): models to read, None for all. Defaults to None.
+            versions (Union[List[str],None], optional): versions to read, None for all. Defaults to None.
+            sets (Union[List[str],None], optional): sets to read, None for all. Defaults to None.
+            lags (Union[List[int],None], optional): lags to read, None for all. Defaults to None.
+            start (optional): minimum time (included). Defaults to None.
+            end (optional): maximum time (included). Defaults to None.
+            columns (Union[List[str],None], optional): columns to read, None for all. Defaults to None.
+
+        Returns:
+            pd.DataFrame: the predictions, model, version and set are categorical
+        """
+        res = list(self.iter_query(models,versions,sets,lags,start,end,columns))
+        if len(res)==0:
+            return pd.DataFrame(columns=self.levels if columns is None else columns)
+        res = pd.concat(res,ignore_index=True)
+        for level in self.levels:
+            if level in res.columns:
+                res[level] = res[level].astype('category')
+        return res
+
+
+class PredictionCache():
+
+    def __init__(self,store:PredictionStore):
+        """Cache of the predictions on top of a `PredictionStore`: an entry is valid only if it has been written with the same key (see `PredictionStore.write`),
+        the entries with a different key (for example a new checkpoint) are removed. The number of hits, misses and evictions is kept in `stats`
+
+        Args:
+            store (PredictionStore): the store
+        """
+        self.store = store
+        self.stats = {'hits':0,'misses':0,'evictions':0}
+
+    def has(self,entry:List[str],key:dict)->bool:
+        """Check if an entry is valid, removing it if the key is changed
+
+        Args:
+            entry (List[str]): model, version and set
+            key (dict): the current key
+
+        Returns:
+            bool: True if the predictions can be read from the store
+        """
+        if self.store.has(*entry):
+            ##normalized as written in the json file
+            if self.store.get_key(*entry)==json.loads(json.dumps(key,sort_keys=True,default=str)):
+                self.stats['hits']+=1
+                return True
+            self.store.delete(*entry)
+            self.stats['evictions']+=1
+        self.stats['misses']+=1
+        return False
+
+    def get(self,entry:List[str],key:dict)->Union[pd.DataFrame,None]:
+        """Predictions of a valid entry
+
+        Args:
+            entry (List[str]): model, version and set
+            key (dict): the current key
+
+        Returns:
+            Union[pd.DataFrame,None]: the predictions (without model, version and set) or None if the entry is not valid
+        """
+        if not self.has(entry,key):
+            return None
+        return self.store.query(*[[e] for e in entry]).drop(columns=self.store.levels)
+
+    def __repr__(self):
+        return f"PredictionCache({self.store.path}, hits={self.stats['hits']}, misses={self.stats['misses']}, evictions={self.stats['evictions']})"
@@ -0,0 +1,453 @@
+import pickle
+import numpy as np
+import pandas as pd
+import torch
+from typing import Union, List, Tuple
+
+EPS = np.finfo(np.float64).eps
+
+
+def _group_codes(groups:Union[np.array,None],values:Union[np.array,None],N:int)->np.array:
+    """Position of each value in `groups` (all zeros if the scaler is global)
+
+    :meta private:
+    """
+    if groups is None or values is None:
+        return np.zeros(N,dtype=np.int64)
+    codes = pd.Index(groups).get_indexer(np.asarray(values))
+    if (codes<0).any():
+        raise KeyError(f'Groups {np.unique(np.asarray(values)[codes<0])} not seen while fitting the scalers')
+    return codes
+
+def _columns(x:Union[np.array,pd.DataFrame])->List[np.array]:
+    """Columns of x keeping the type of each column of a DataFrame
+
+    :meta private:
+    """
+    if isinstance(x,pd.DataFrame):
+        return [x.iloc[:,j].values for j in range(x.shape[1])]
+    x = np.asarray(x)
+    return [x[:,j] for j in range(x.shape[1])]
+
+def _segment_sum(x:np.array,codes:np.array,n_groups:int)->np.array:
+    """Sum ignoring nans of the rows of x (NxC) belonging to the same group, the rows must be sorted by code.
+    Each column of each group is summed as a contiguous vector (pairwise summation), with the same rounding of sklearn
+
+    :meta private:
+    """
+    bounds = np.searchsorted(codes,np.arange(n_groups+1))
+    x = np.ascontiguousarray(np.where(np.isnan(x),0,x).T)
+    res = np.zeros((n_groups,x.shape[0]))
+    for g in range(n_groups):
+        res[g] = x[:,bounds[g]:bounds[g+1]].sum(axis=1)
+    return res
+
+def _segment_quantile(x:np.array,codes:np.array,n_groups:int,q:float,median:bool=False)->np.array:
+    """Quantile ignoring nans of the rows of x (NxC) for each group (same interpolation of `np.nanpercentile` or `np.nanmedian`)
+
+    :meta private:
+    """
+    res = np.full((n_groups,x.shape[1]),np.nan)
+    for j in range(x.shape[1]):
+        valid = ~np.isnan(x[:,j])
+        c = codes[valid]
+        v = x[valid,j]
+        order = np.lexsort((v,c))
+        v = v[order]
+        n = np.bincount(c,minlength=n_groups)
+        begin = np.concatenate([[0],np.cumsum(n)[:-1]])
+        ok = n>0
+        if median:
+            lo = begin+(n-1)//2
+            hi = begin+n//2
+            res[ok,j] = np.where(lo==hi,v[lo.clip(0,len(v)-1)],(v[lo.clip(0,len(v)-1)]+v[hi.clip(0,len(v)-1)])/2)[ok]
+        else:
+            ##same virtual index and interpolation of numpy linear method
+            index = (n-1)*q
+            lo = np.floor(index).astype(int)
+            hi = np.minimum(lo+1,n-1)
+            t = index-lo
+            a = v[(begin+lo).clip(0,len(v)-1)]
+            b = v[(begin+hi).clip(0,len(v)-1)]
+            diff = b-a
+            val = np.where(t>=0.5,b-diff*(1-t),a+diff*t)
+            res[ok,j] = val[ok]
+    return res
+
+
+class NumericalScaler():
+
+    def __init__(self,scaler:str='StandardScaler()'):
+        """Scaler of all the numerical columns (and all the groups) at once. The parameters are stored in two arrays of shape groups x columns
+        and the transformations are a single broadcasted operation. It reproduces `StandardScaler`, `MinMaxScaler` and `RobustScaler` of sklearn (including their parameters),
+        any other sklearn scaler is fitted as in the previous versions with one object for each group and column (slower)
+
+        Args:
+            scaler (str, optional): string representing the sklearn scaler. Defaults to 'StandardScaler()'.
+        """
+        ##sklearn is imported only for parsing the string, it is slow to import
+        from sklearn import preprocessing
+        sk = eval(scaler,{**globals(),**vars(preprocessing)})
+        if isinstance(sk,preprocessing.StandardScaler):
+            self.kind = 'standard'
+        elif isinstance(sk,preprocessing.MinMaxScaler):
+            self.kind = 'minmax'
+        elif isinstance(sk,preprocessing.RobustScaler):
+            self.kind = 'robust'
+        else:
+            self.kind = 'sklearn'
+        self.scaler = scaler
+        self.params = sk.get_params()
+        self.groups = None
+        self.scalers = None
+
+    def fit(self,x:np.array,groups:Union[np.array,None]=None)->'NumericalScaler':
+        """Fit the parameters
+
+        Args:
+            x (np.array): array of shape N x C
+            groups (Union[np.array,None], optional): group of each row. If None the parameters are shared among all the rows. Defaults to None.
+
+        Returns:
+            NumericalScaler: the fitted scaler
+        """
+        x = np.asarray(x,dtype=np.float64)
+        if groups is not None:
+            self.groups = pd.unique(np.asarray(groups))
+            codes = _group_codes(self.groups,groups,x.shape[0])
+        else:
+            codes = np.zeros(x.shape[0],dtype=np.int64)
+        G = len(self.groups) if self.groups is not None else 1
+        order = np.argsort(codes,kind='stable')
+        x = x[order]
+        codes = codes[order]
+        nan = np.isnan(x)
+        if self.kind=='sklearn':
+            from sklearn import preprocessing
+            begin = np.searchsorted(codes,np.arange(G+1))
+            self.scalers = [[eval(self.scaler,{**globals(),**vars(preprocessing)}).fit(x[begin[g]:begin[g+1],j:j+1]) for j in range(x.shape[1])] for g in range(G)]
+            self.center = self.scale = None
+        elif self.kind=='standard':
+            n = _segment_sum((~nan).astype(np.float64),codes,G)
+            total = _segment_sum(x,codes,G)
+            mean = total/n
+            temp = x-mean[codes]
+            correction = _segment_sum(temp,codes,G)
+            var = _segment_sum(temp**2,codes,G)
+            var -= correction**2/n
+            var = var/n
+            scale = np.sqrt(var)
+            scale[var<=n*EPS*var+(n*mean*EPS)**2] = 1.0
+            self.center = mean if self.params['with_mean'] else np.zeros_like(mean)
+            self.scale = scale if self.params['with_std'] else np.ones_like(scale)
+        elif self.kind=='minmax':
+            begin = np.searchsorted(codes,np.arange(G))
+            data_min = np.fmin.reduceat(x,begin,axis=0)
+            data_max = np.fmax.reduceat(x,begin,axis=0)
+            data_range = data_max-data_min
+            data_range[data_range<10*EPS] = 1.0
+            feature_range = self.params['feature_range']
+            self.scale = (feature_range[1]-feature_range[0])/data_range
+            self.center = feature_range[0]-data_min*self.scale
+        else:
+            q_min,q_max = self.params['quantile_range']
+            center = _segment_quantile(x,codes,G,0.5,median=True)
+            scale = _segment_quantile(x,codes,G,q_max/100)-_segment_quantile(x,codes,G,q_min/100)
+            scale[scale<10*EPS] = 1.0
+            if self.params['unit_variance']:
+                from scipy import stats
+                scale = scale/(stats.norm.ppf(q_max/100.0)-stats.norm.ppf(q_min/100.0))
+            self.center = center if self.params['with_centering'] else np.zeros_like(center)
+            self.scale = scale if self.params['with_scaling'] else np.ones_like(scale)
+        return self
+
+    def _gather(self,x:np.array,groups:Union[np.array,None],columns:Union[List[int],None],axis:int)->List[np.array]:
+        """Parameters broadcastable to x: the first dimension of x is aligned with groups and the dimension `axis` with columns
+
+        :meta private:
+        """
+        codes = _group_codes(self.groups,groups,x.shape[0])
+        center = self.center if columns is None else self.center[:,columns]
+        scale = self.scale if columns is None else self.scale[:,columns]
+        shape = [x.shape[0]]+[1]*(x.ndim-1)
+        shape[axis] = center.shape[1]
+        center = np.moveaxis(center[codes].reshape([x.shape[0],center.shape[1]]+[1]*(x.ndim-2)),1,axis).reshape(shape)
+        scale = np.moveaxis(scale[codes].reshape([x.shape[0],scale.shape[1]]+[1]*(x.ndim-2)),1,axis).reshape(shape)
+        return center,scale
+
+    def _apply_sklearn(self,x:np.array,groups:Union[np.array,None],columns:Union[List[int],None],axis:int,method:str)->np.array:
+        """Apply `method` of the sklearn object of each group and column, same arguments of `transform`
+
+        :meta private:
+        """
+        codes = _group_codes(self.groups,groups,x.shape[0])
+        res = np.moveaxis(x.copy(),axis,-1)
+        columns = range(res.shape[-1]) if columns is None else columns
+        for g in np.unique(codes):
+            idx = codes==g
+            for i,j in enumerate(columns):
+                tmp = res[idx,...,i]
+                res[idx,...,i] = getattr(self.scalers[g][j],method)(tmp.reshape(-1,1)).reshape(tmp.shape)
+        return np.moveaxis(res,-1,axis)
+
+    def transform(self,x:np.array,groups:Union[np.array,None]=None,columns:Union[List[int],None]=None,axis:int=-1)->np.array:
+        """Scale the data
+
+        Args:
+            x (np.array): array with the first dimension aligned with groups and the dimension `axis` aligned with the columns
+            groups (Union[np.array,None], optional): group of each element of the first dimension (ignored if the scaler is global). Defaults to None.
+            columns (Union[List[int],None], optional): index of the fitted columns contained in x, if None all the columns. Defaults to None.
+            axis (int, optional): dimension of the columns. Defaults to -1.
+
+        Returns:
+            np.array: scaled data
+        """
+        x = np.asarray(x,dtype=np.float64)
+        if self.kind=='sklearn':
+            return self._apply_sklearn(x,groups,columns,axis,'transform')
+        center,scale = self._gather(x,groups,columns,axis)
+        if self.kind=='minmax':
+            return x*scale+center
+        return (x-center)/scale
+
+    def inverse_transform(self,x:np.array,groups:Union[np.array,None]=None,columns:Union[List[int],None]=None,axis:int=-1)->np.array:
+        """Inverse of `transform`, same arguments
+
+        Returns:
+            np.array: data in the original scale
+        """
+        x = np.asarray(x,dtype=np.float64)
+        if self.kind=='sklearn':
+            return self._apply_sklearn(x,groups,columns,axis,'inverse_transform')
+        center,scale = self._gather(x,groups,columns,axis)
+        if self.kind=='minmax':
+            return (x-center)/scale
+        return x*scale+center
+
+    def inverse_transform_(self,x:torch.Tensor,groups:Union[np.array,None]=None,columns:Union[List[int],None]=None,axis:int=-1)->torch.Tensor:
+        """In place `inverse_transform` of a torch tensor: the parameters of each sample are gathered and moved on the device of x,
+        so the predictions can be rescaled before transferring them. Same arguments of `transform`
+
+        Returns:
+            torch.Tensor: x in the original scale
+        """
+        if self.kind=='sklearn':
+            ##the sklearn objects work on the CPU
+            return x.copy_(torch.from_numpy(self.inverse_transform(x.detach().cpu().numpy(),groups,columns,axis)))
+        center,scale = self._gather(x,groups,columns,axis)
+        center = torch.from_numpy(center).to(device=x.device,dtype=x.dtype)
+        scale = torch.from_numpy(scale).to(device=x.device,dtype=x.dtype)
+        if self.kind=='minmax':
+            return x.sub_(center).div_(scale)
+        return x.mul_(scale).add_(center)
+
+    def to_arrays(self)->Tuple[dict,dict]:
+        """Fitted parameters as JSON serializable metadata and numpy arrays (see `from_arrays`)
+
+        Returns:
+            Tuple[dict,dict]: metadata and arrays
+        """
+        if self.kind=='sklearn':
+            ##the fitted sklearn objects are pickled
+            arrays = {'scalers':np.frombuffer(pickle.dumps(self.scalers),dtype=np.uint8)}
+        else:
+            arrays = {'center':self.center,'scale':self.scale}
+        if self.groups is not None:
+            arrays['groups'] = self.groups
+        return {'kind':self.kind,'scaler':self.scaler,'params':self.params},arrays
+
+    @classmethod
+    def from_arrays(cls,meta:dict,arrays:dict)->'NumericalScaler':
+        """Build the scaler from the output of `to_arrays`
+
+        Args:
+            meta (dict): metadata
+            arrays (dict): arrays
+
+        Returns:
+            NumericalScaler: the fitted scaler
+        """
+        res = cls.__new__(cls)
+        res.kind = meta['kind']
+        res.scaler = meta.get('scaler',None)
+        res.params = meta['params']
+        res.center = arrays.get('center',None)
+        res.scale = arrays.get('scale',None)
+        res.scalers = pickle.loads(arrays['scalers'].tobytes()) if 'scalers' in arrays else None
+        res.groups = arrays.get('groups',None)
+        return res
+
+    @classmethod
+    def from_sklearn(cls,scalers:dict,columns:List[str],groups:Union[np.array,None]=None)->'NumericalScaler':
+        """Build the scaler starting from the dictionary of sklearn scalers used by the previous versions (keys `column` or `column_group`)
+
+        Args:
+            scalers (dict): dictionary of fitted sklearn scalers
+            columns (List[str]): numerical columns
+            groups (Union[np.array,None], optional): groups if the scalers are fitted per group. Defaults to None.
+
+        Returns:
+            NumericalScaler: equivalent scaler
+        """
+        first = scalers[columns[0] if groups is None else f'{columns[0]}_{groups[0]}']
+        res = cls(f'{first.__class__.__name__}(**{first.get_params()})')
+        res.groups = None if groups is None else np.asarray(groups)
+        G = 1 if groups is None else len(groups)
+        if res.kind=='sklearn':
+            res.scalers = [[scalers[c if groups is None else f'{c}_{groups[g]}'] for c in columns] for g in range(G)]
+            res.center = res.scale = None
+            return res
+        res.center = np.zeros((G,len(columns)))
+        res.scale = np.ones((G,len(columns)))
+        for g in range(G):
+            for j,c in enumerate(columns):
+                sk = scalers[c if groups is None else f'{c}_{groups[g]}']
+                if res.kind=='minmax':
+                    res.center[g,j],res.scale[g,j] = sk.min_[0],sk.scale_[0]
+                else:
+                    center = sk.mean_ if res.kind=='standard' else sk.center_
+                    if center is not None:
+                        res.center[g,j] = center[0]
+                    if sk.scale_ is not None:
+                        res.scale[g,j] = sk.scale_[0]
+        return res
+
+
+class CategoricalEncoder():
+
+    def __init__(self):
+        """Label encoder of all the categorical columns (and all the groups) at once, equivalent to a `LabelEncoder` for each column (and for each group).
+        The vocabulary of each column is a sorted array and the codes of each group are positions in the sorted array of the (group, value) pairs, so that the transformations are `searchsorted` operations
+        """
+        self.groups = None
+
+    def fit(self,x:Union[np.array,pd.DataFrame],groups:Union[np.array,None]=None,per_group:Union[List[bool],None]=None)->'CategoricalEncoder':
+        """Fit the vocabularies
+
+        Args:
+            x (Union[np.array,pd.DataFrame]): data of shape N x C
+            groups (Union[np.array,None], optional): group of each row. If None the vocabularies are shared among all the rows. Defaults to None.
+            per_group (Union[List[bool],None], optional): for each column, if the vocabulary depends on the group. Defaults to None (all True).
+
+        Returns:
+            CategoricalEncoder: the fitted encoder
+        """
+        columns = _columns(x)
+        self.groups = None if groups is None else pd.unique(np.asarray(groups))
+        codes = _group_codes(self.groups,groups,x.shape[0])
+        G = 1 if self.groups is None else len(self.groups)
+        self.per_group = [True]*len(columns) if per_group is None else list(per_group)
+        self.vocabulary,self.pairs,self.begin = [],[],[]
+        for j,values in enumerate(columns):
+            vocabulary = np.array(sorted(set(values)),dtype=values.dtype) if values.dtype==object else np.unique(values)
+            c = codes if self.per_group[j] else np.zeros_like(codes)
+            pairs = np.unique(c*len(vocabulary)+np.searchsorted(vocabulary,values))
+            self.vocabulary.append(vocabulary)
+            self.pairs.append(pairs)
+            self.begin.append(np.searchsorted(pairs,np.arange(G)*len(vocabulary)))
+        return self
+
+    def transform(self,x:Union[np.array,pd.DataFrame],groups:Union[np.array,None]=None)->np.array:
+        """Encode the data
+
+        Args:
+            x (Union[np.array,pd.DataFrame]): data of shape N x C
+            groups (Union[np.array,None], optional): group of each row (ignored if the encoder is global). Defaults to None.
+
+        Returns:
+            np.array: integer codes
+        """
+        columns = _columns(x)
+        codes = _group_codes(self.groups,groups,x.shape[0])
+        res = np.zeros(x.shape,dtype=np.int64)
+        for j,values in enumerate(columns):
+            vocabulary = self.vocabulary[j]
+            c = codes if self.per_group[j] else np.zeros_like(codes)
+            index = np.searchsorted(vocabulary,values).clip(0,max(len(vocabulary)-1,0))
+            pair = c*len(vocabulary)+index
+            position = np.searchsorted(self.pairs[j],pair).clip(0,max(len(self.pairs[j])-1,0))
+            found = (self.pairs[j][position]==pair)&((vocabulary[index]==values)|(pd.isnull(vocabulary[index])&pd.isnull(values)))
+            if not found.all():
+                raise ValueError(f'y contains previously unseen labels: {np.unique(values[~found])}')
+            res[:,j] = position-self.begin[j][c]
+        return res
+
+    def inverse_transform(self,x:np.array,groups:Union[np.array,None]=None)->np.array:
+        """Decode the data
+
+        Args:
+            x (np.array): integer codes of shape N x C
+            groups (Union[np.array,None], optional): group of each row (ignored if the encoder is global). Defaults to None.
+
+        Returns:
+            np.array: original values
+        """
+        x = np.asarray(x)
+        codes = _group_codes(self.groups,groups,x.shape[0])
+        res = []
+        for j in range(x.shape[1]):
+            c = codes if self.per_group[j] else np.zeros_like(codes)
+            res.append(self.vocabulary[j][self.pairs[j][self.begin[j][c]+x[:,j]]-c*len(self.vocabulary[j])])
+        return np.stack(res,axis=1) if len(res)>0 else np.zeros(x.shape)
+
+    def to_arrays(self)->Tuple[dict,dict]:
+        """Fitted vocabularies as JSON serializable metadata and numpy arrays (see `from_arrays`)
+
+        Returns:
+            Tuple[dict,dict]: metadata and arrays
+        """
+        arrays = {}
+        for j in range(len(self.vocabulary)):
+            arrays[f'vocabulary_{j}'] = self.vocabulary[j]
+            arrays[f'pairs_{j}'] = self.pairs[j]
+            arrays[f'begin_{j}'] = self.begin[j]
+        if self.groups is not None:
+            arrays['groups'] = self.groups
+        return {'per_group':[bool(x) for x in self.per_group]},arrays
+
+    @classmethod
+    def from_arrays(cls,meta:dict,arrays:dict)->'CategoricalEncoder':
+        """Build the encoder from the output of `to_arrays`
+
+        Args:
+            meta (dict): metadata
+            arrays (dict): arrays
+
+        Returns:
+            CategoricalEncoder: the fitted encoder
+        """
+        res = cls()
+        res.groups = arrays.get('groups',None)
+        res.per_group = meta['per_group']
+        res.vocabulary = [arrays[f'vocabulary_{j}'] for j in range(len(res.per_group))]
+        res.pairs = [arrays[f'pairs_{j}'] for j in range(len(res.per_group))]
+        res.begin = [arrays[f'begin_{j}'] for j in range(len(res.per_group))]
+        return res
+
+    @classmethod
+    def from_sklearn(cls,encoders:dict,columns:List[str],groups:Union[np.array,None]=None,group_column:Union[str,None]=None)->'CategoricalEncoder':
+        """Build the encoder starting from the dictionary of `LabelEncoder` used by the previous versions (keys `column` or `column_group`)
+
+        Args:
+            encoders (dict): dictionary of fitted LabelEncoder
+            columns (List[str]): categorical columns
+            groups (Union[np.array,None], optional): groups if the encoders are fitted per group. Defaults to None.
+            group_column (Union[str,None], optional): the column containing the groups, encoded globally. Defaults to None.
+
+        Returns:
+            CategoricalEncoder: equivalent encoder
+        """
+        res = cls()
+        res.groups = None if groups is None else np.asarray(groups)
+        res.per_group = [groups is not None and c!=group_column for c in columns]
+        G = 1 if groups is None else len(groups)
+        res.vocabulary,res.pairs,res.begin = [],[],[]
+        for j,c in enumerate(columns):
+            classes = [encoders[c].classes_] if not res.per_group[j] else [encoders[f'{c}_{g}'].classes_ for g in groups]
+            values = np.concatenate(classes)
+            vocabulary = np.array(sorted(set(values)),dtype=values.dtype) if values.dtype==object else np.unique(values)
+            pairs = np.unique(np.concatenate([g*len(vocabulary)+np.searchsorted(vocabulary,cl) for g,cl in enumerate(classes)]))
+            res.vocabulary.append(vocabulary)
+            res.pairs.append(pairs)
+            res.begin.append(np.searchsorted(pairs,np.arange(G)*len(vocabulary)))
+        return res
@@ -1,13 +1,17 @@
 from enum import Enum
 from typing import Union
 import pandas as pd
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, DataLoader, BatchSampler, RandomSampler, SequentialSampler
 import numpy as np
 from pytorch_lightning import Callback
 import torch
 import os
+import json
+import pickle
+import hashlib
 import logging
-from typing import Union
+from typing import Union, List
+from collections.abc import Mapping
 def beauty_string(message:str,type:str,verbose:bool):
     
     size = 150
@@ -34,8 +38,69 @@ def beauty_string(message:str,type:str,verbose:bool):
 
 
 
+def _time_grid(x:pd.DataFrame,freq:Union[str,int],group:Union[str,None]=None,global_minmax:bool=False,extra_steps:int=0)->List[Union[pd.DataFrame,np.array]]:
+    """Build the regular time grid of each group and the position of each row of x inside it.
+    Each group is a contiguous block of the grid starting from its minimum and the position of a row is `(time - t0) // freq` plus the beginning of its block,
+    so no merge is needed. Pandas frequencies that are not fixed (e.g. month starts) fall back to one `pd.date_range` per group.
+
+    :meta private:
+    """
+    if group is None:
+        codes,uniques = np.zeros(len(x),dtype=np.int64),None
+    else:
+        codes,uniques = pd.factorize(x[group])
+    G = 1 if uniques is None else len(uniques)
+    ##rows without group or time are not placed on the grid
+    observed = (codes>=0) & ~pd.isna(x.time.values)
+    is_datetime = pd.api.types.is_datetime64_any_dtype(x.time)
+    tz = getattr(x.time.dtype,'tz',None)
+    if is_datetime:
+        t = pd.DatetimeIndex(x.time).tz_convert(None).values.astype('datetime64[ns]').view(np.int64) if tz is not None else x.time.values.astype('datetime64[ns]').view(np.int64)
+        try:
+            step = pd.tseries.frequencies.to_offset(freq).nanos
+        except (ValueError,TypeError) as _:
+            step = None
+    else:
+        t = x.time.values.astype(np.int64)
+        step = int(freq)
+
+    t0 = np.full(G,np.iinfo(np.int64).max)
+    t1 = np.full(G,np.iinfo(np.int64).min)
+    np.minimum.at(t0,codes[observed],t[observed])
+    np.maximum.at(t1,codes[observed],t[observed])
+    if global_minmax:
+        t0[:] = t0.min()
+        t1[:] = t1.max()
+
+    ##groups without valid times have an empty block
+    empty_group = t1<t0
+    if step is not None:
+        lengths = np.where(empty_group,0,(t1-t0)//step+1+extra_steps)
+        begin = np.concatenate([[0],np.cumsum(lengths)[:-1]]).astype(np.int64)
+        block = np.repeat(np.arange(G),lengths)
+        grid = t0[block]+(np.arange(lengths.sum())-begin[block])*step
+        offset = t[observed]-t0[codes[observed]]
+        position = np.full(len(x),-1,dtype=np.int64)
+        position[observed] = np.where(offset%step==0,begin[codes[observed]]+offset//step,-1)
+    else:
+        ##not fixed frequency: one date range for each group
+        times = [pd.DatetimeIndex([]) if empty_group[i] else pd.date_range(pd.Timestamp(t0[i]),pd.Timestamp(t1[i]),freq=freq) for i in range(G)]
+        times = [tt.append(pd.date_range(tt[-1],periods=extra_steps+1,freq=freq)[1:]) if len(tt)>0 else tt for tt in times]
+        block = np.repeat(np.arange(G),[len(tt) for tt in times])
+        grid = np.concatenate([tt.values.astype('datetime64[ns]').view(np.int64) for tt in times])
+        position = pd.MultiIndex.from_arrays([block,grid]).get_indexer(pd.MultiIndex.from_arrays([codes,t]))
+        position[~observed] = -1
+
+    if is_datetime:
+        grid = pd.DatetimeIndex(grid.view('datetime64[ns]'))
+        if tz is not None:
+            grid = grid.tz_localize('UTC').tz_convert(tz)
+    empty = pd.DataFrame({'time':grid}) if group is None else pd.DataFrame({group:uniques.take(block),'time':grid})
+    return empty,position
+
+
 def extend_time_df(x:pd.DataFrame,freq:Union[str,int],group:Union[str,None]=None,global_minmax:bool=False)-> pd.DataFrame:
-    """Utility for generating a full dataset and then merge the real data
+    """Utility for generating a full dataset and then merge the real data (see `fill_time_holes` for doing both at once)
 
     Args:
         x (pd.DataFrame): dataframe containing the column time
@@ -45,33 +110,108 @@ def extend_time_df(x:pd.DataFrame,freq:Union[str,int],group:Union[str,None]=None
     Returns:
         pd.DataFrame: a dataframe with the column time ranging from thr minumum of x to the maximum with frequency `freq`
     """
+    return _time_grid(x,freq,group,global_minmax)[0]
 
-    if group is None:
 
-        if isinstance(freq,int):
-            empty = pd.DataFrame({'time':list(range(x.time.min(),x.time.max(),freq))})
-        else:
-            empty = pd.DataFrame({'time':pd.date_range(x.time.min(),x.time.max(),freq=freq)})
+def fill_time_holes(x:pd.DataFrame,freq:Union[str,int],group:Union[str,None]=None,global_minmax:bool=False,extra_steps:int=0)-> pd.DataFrame:
+    """Reindex x on the regular time grid of each group inserting NaN in the holes, the same as `extend_time_df(x,freq,group,global_minmax).merge(x,how='left')`
+    without the merge: each column is allocated once on the grid and the observed rows are scattered in with a single vectorized take.
+    Rows not aligned with the grid are discarded and, for duplicated times, the last row is kept.
 
-    else:
-        
-        if global_minmax:
-            _min = pd.DataFrame({group:x[group].unique(),'time':x.time.min()})
-            _max = pd.DataFrame({group:x[group].unique(),'time':x.time.max()})
+    Args:
+        x (pd.DataFrame): dataframe containing the column time (datetime or integer)
+        freq (Union[str,int]): frequency (in pandas notation or integer) of the grid
+        group (Union[str,None], optional): if not None the min max are computed by the group column. Defaults to None.
+        global_minmax (bool, optional): if True the min_max is computed globally for each group. Defaults to False.
+        extra_steps (int, optional): number of steps added after the maximum of each group. Defaults to 0.
 
-        else:
-            _min = x.groupby(group).time.min().reset_index()
-            _max = x.groupby(group).time.max().reset_index()
-        empty = []
-        for c in x[group].unique():
-            if isinstance(freq,int):
-                empty.append(pd.DataFrame({group:c,'time':np.arange(_min.time[_min[group]==c].values[0],_max.time[_max[group]==c].values[0],freq)}))
+    Returns:
+        pd.DataFrame: the reindexed dataframe
+    """
+    empty,position = _time_grid(x,freq,group,global_minmax,extra_steps)
+    source = np.full(len(empty),-1,dtype=np.int64)
+    valid = position>=0
+    source[position[valid]] = np.where(valid)[0]
+    columns = {c:pd.api.extensions.take(x[c].values,source,allow_fill=True) for c in x.columns if c not in empty.columns}
+    return pd.concat([empty,pd.DataFrame(columns)],axis=1)
 
-            else:
-                empty.append(pd.DataFrame({group:c,'time':pd.date_range(_min.time[_min[group]==c].values[0],_max.time[_max[group]==c].values[0],freq=freq)}))
-            
-        empty = pd.concat(empty,ignore_index=True)
-    return empty
+
+def finite_windows(x:np.array,length:int)->np.array:
+    """Check, for each possible window of length `length`, if all the values inside it are finite. It uses the prefix sum of the non finite rows so the cost does not depend on `length`
+
+    Args:
+        x (np.array): array of shape N or NxC
+        length (int): length of the window
+
+    Returns:
+        np.array: boolean array of length max(N-length+1,0), the element j is True if x[j:j+length] contains only finite values
+    """
+    x = np.asarray(x,dtype=float)
+    bad = ~np.isfinite(x) if x.ndim==1 else ~np.isfinite(x).all(axis=1)
+    if length<=0 or len(bad)<length:
+        return np.zeros(max(len(bad)-length+1,0),dtype=bool)
+    cs = np.concatenate([[0],np.cumsum(bad)])
+    return (cs[length:]-cs[:len(cs)-length])==0
+
+def valid_window_starts(group_codes:np.array,
+                        past_steps:int,
+                        future_steps:int,
+                        skip_stacked:int,
+                        skip_step:int,
+                        check:Union[np.array,None],
+                        x_num_past:np.array,
+                        y_target:np.array,
+                        x_num_future:Union[np.array,None]=None,
+                        shift:int=0,
+                        future_length:int=0)->np.array:
+    """Compute the positions of the valid samples for arrays where the groups are stored in contiguous blocks. A position p means that the past window is [p-past_steps,p) and the target window is [p+skip_stacked,p+skip_stacked+future_steps)
+
+    Args:
+        group_codes (np.array): integer code of the group of each row, the rows of the same group must be contiguous
+        past_steps (int): past context length
+        future_steps (int): future lags to predict
+        skip_stacked (int): offset of the target window (used by stacked models)
+        skip_step (int): distance between two candidate samples
+        check (Union[np.array,None]): boolean array, if not None a position is a candidate only if check is True
+        x_num_past (np.array): past numerical array, all the values in the past window must be finite
+        y_target (np.array): target array, all the values in the target window must be finite
+        x_num_future (Union[np.array,None], optional): future numerical array, if not None all the values in the future window must be finite. Defaults to None.
+        shift (int, optional): shift of the future window. Defaults to 0.
+        future_length (int, optional): length of the future window. Defaults to 0.
+
+    Returns:
+        np.array: sorted array of the valid positions
+    """
+    N = len(group_codes)
+    counts = np.bincount(group_codes) if N>0 else np.zeros(0,dtype=int)
+    begin = np.concatenate([[0],np.cumsum(counts)[:-1]]).astype(int)
+    local = np.arange(N)-begin[group_codes]
+    mask = (local>=past_steps)&(local<counts[group_codes]-future_steps-skip_stacked)&((local-past_steps)%skip_step==0)
+    if check is not None:
+        mask &= np.asarray(check,dtype=bool)
+    starts = np.where(mask)[0]
+
+    starts = starts[finite_windows(x_num_past,past_steps)[starts-past_steps]]
+    starts = starts[finite_windows(y_target,future_steps)[starts+skip_stacked]]
+    if x_num_future is not None:
+        starts = starts[finite_windows(x_num_future,future_length)[starts-shift+skip_stacked]]
+    return starts
+
+def sliding_windows(x:np.array,starts:np.array,length:int)->np.array:
+    """Extract the windows x[s:s+length] for each s in starts using a strided view of the array
+
+    Args:
+        x (np.array): array of shape N or NxC
+        starts (np.array): starting positions
+        length (int): length of the windows
+
+    Returns:
+        np.array: array of shape len(starts) x length (x C)
+    """
+    if len(x)<length:
+        return np.zeros((0,length)+x.shape[1:],dtype=x.dtype)
+    view = np.lib.stride_tricks.sliding_window_view(x,length,axis=0)
+    return np.ascontiguousarray(np.moveaxis(view[starts],-1,1))
 
 
 class MetricsCallback(Callback):
@@ -108,6 +248,42 @@ class MetricsCallback(Callback):
        
 
 
+def _to_shared(x:np.array)->Union[tuple,None]:
+    """Copy a numerical array in a shared memory tensor, datetimes are stored as int64. Other objects are returned as they are
+
+    :meta private:
+    """
+    if not isinstance(x,np.ndarray) or x.dtype.kind not in 'biufmM':
+        return x
+    base = x.view(np.int64) if x.dtype.kind in 'mM' else x
+    return torch.from_numpy(np.ascontiguousarray(base)).share_memory_(),x.dtype
+
+def _from_shared(x:Union[tuple,object])->np.array:
+    """Numpy view of a shared tensor created by `_to_shared`
+
+    :meta private:
+    """
+    if not isinstance(x,tuple):
+        return x
+    tensor,dtype = x
+    return tensor.numpy().view(dtype)
+
+def _hash_value(h:'hashlib._Hash',x:object)->None:
+    """Update the hash with the content of numerical arrays (bytes, type and shape), dictionaries and other picklable objects
+
+    :meta private:
+    """
+    if isinstance(x,dict):
+        for k in sorted(x.keys(),key=str):
+            h.update(str(k).encode())
+            _hash_value(h,x[k])
+    elif isinstance(x,np.ndarray) and x.dtype.kind in 'biufmM':
+        h.update(f'{x.dtype.str}{x.shape}'.encode())
+        h.update(np.ascontiguousarray(x).view(np.uint8).data)
+    else:
+        h.update(pickle.dumps(x))
+
+
 class MyDataset(Dataset):
 
     def __init__(self, data:dict,t:np.array,groups:np.array,idx_target:Union[np.array,None],idx_target_future:Union[np.array,None])->torch.utils.data.Dataset:
@@ -140,15 +316,377 @@ class MyDataset(Dataset):
         return len(self.data['y'])
 
     def __getitem__(self, idxs):
+        if np.ndim(idxs)>0:
+            return self.get_batch(idxs)
         sample = {}
         for k in self.data:
-            sample[k] = self.data[k][idxs]
+            sample[k] = self.get_window(k,idxs)
         if self.idx_target is not None:
             sample['idx_target'] = self.idx_target
         if self.idx_target_future is not None:
             sample['idx_target_future'] = self.idx_target_future
         return sample
 
+    _shared_attributes = ['data','t','groups']
+
+    def share_memory(self)->'MyDataset':
+        """Move the numerical arrays in shared memory (`torch.Tensor.share_memory_`). The arrays become numpy views of the shared tensors and,
+        when the dataset is sent to other processes with the torch multiprocessing pickler, only the handles of the shared memory are sent so the workers do not copy the data
+
+        Returns:
+            MyDataset: the dataset itself
+        """
+        if getattr(self,'_shared',None) is not None:
+            return self
+        shared = {}
+        try:
+            for attribute in self._shared_attributes:
+                value = getattr(self,attribute)
+                if isinstance(value,dict):
+                    shared[attribute] = {k:_to_shared(v) for k,v in value.items()}
+                else:
+                    shared[attribute] = _to_shared(value)
+        except RuntimeError as e:
+            beauty_string(f'Can not move the dataset in shared memory: {e}','info',True)
+            return self
+        self._shared = shared
+        self._set_shared_views()
+        return self
+
+    def fingerprint(self)->str:
+        """Key of the content of the dataset, used by `WorkerPool` for reusing a dataset already sent to the workers. It is computed once,
+        `TimeSeries.split_for_train` sets it from the key of the `DatasetCache` entry if the cache is used
+
+        Returns:
+            str: hexadecimal digest
+        """
+        if getattr(self,'_fingerprint',None) is None:
+            h = hashlib.sha1(type(self).__name__.encode())
+            for k in sorted(self.__dict__.keys()):
+                if k not in ['_shared','_fingerprint']:
+                    h.update(k.encode())
+                    _hash_value(h,self.__dict__[k])
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+    def _set_shared_views(self)->None:
+        for attribute,value in self._shared.items():
+            if isinstance(value,dict):
+                setattr(self,attribute,{k:_from_shared(v) for k,v in value.items()})
+            else:
+                setattr(self,attribute,_from_shared(value))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attribute in (state.get('_shared') or {}):
+            state.pop(attribute,None)
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        if self.__dict__.get('_shared') is not None:
+            self._set_shared_views()
+
+    def get_time(self,idxs)->np.array:
+        """Time of the target windows of the samples
+
+        Args:
+            idxs (slice or np.array): samples to extract
+
+        Returns:
+            np.array: the time (samples x future steps)
+        """
+        return self.t[idxs]
+
+    def get_groups(self,idxs)->np.array:
+        """Group of the samples
+
+        Args:
+            idxs (slice or np.array): samples to extract
+
+        Returns:
+            np.array: the groups
+        """
+        return self.groups[idxs]
+
+    def get_window(self,k:str,idxs)->np.array:
+        """Samples of a given key
+
+        Args:
+            k (str): key of the batch
+            idxs (int, slice or np.array): samples to extract
+
+        Returns:
+            np.array: the selected samples
+        """
+        return self.data[k][idxs]
+
+    def get_batch(self,idxs)->dict:
+        """Gather a whole batch with one fancy index per key (used by `batch_data_loader`), it is the same as collating the single samples
+        but `idx_target` and `idx_target_future` are added only once with shape 1 x n (the models use `batch['idx_target'][0]`)
+
+        Args:
+            idxs (np.array): indexes of the samples
+
+        Returns:
+            dict: the batch as a dictionary of torch.Tensor
+        """
+        idxs = np.asarray(idxs,dtype=np.int64)
+        batch = {}
+        for k in self.data:
+            batch[k] = torch.from_numpy(np.ascontiguousarray(self.get_window(k,idxs)))
+        if self.idx_target is not None:
+            batch['idx_target'] = torch.from_numpy(self.idx_target[None])
+        if self.idx_target_future is not None:
+            batch['idx_target_future'] = torch.from_numpy(self.idx_target_future[None])
+        return batch
+
+
+def batch_data_loader(dataset:Dataset,batch_size:int,shuffle:bool=False,drop_last:bool=False,num_workers:int=0,persistent_workers:bool=False)->DataLoader:
+    """DataLoader that fetches whole batches: the sampler yields the indexes of a batch and the dataset returns the ready batch (see `MyDataset.get_batch`),
+    so there is no per-sample indexing and no collate. Datasets not derived from `MyDataset` use the standard DataLoader
+
+    Args:
+        dataset (Dataset): the dataset
+        batch_size (int): batch size
+        shuffle (bool, optional): shuffle the samples at each epoch. Defaults to False.
+        drop_last (bool, optional): drop the last incomplete batch. Defaults to False.
+        num_workers (int, optional): number of workers. Defaults to 0.
+        persistent_workers (bool, optional): see DataLoader. Defaults to False.
+
+    Returns:
+        DataLoader: the data loader
+    """
+    persistent_workers = persistent_workers and num_workers>0
+    if not isinstance(dataset,MyDataset):
+        return DataLoader(dataset,batch_size=batch_size,shuffle=shuffle,drop_last=drop_last,num_workers=num_workers,persistent_workers=persistent_workers)
+    sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+    return DataLoader(dataset,sampler=BatchSampler(sampler,batch_size,drop_last),batch_size=None,num_workers=num_workers,persistent_workers=persistent_workers)
+
+
+
+class DeviceDataLoader():
+
+    def __init__(self,dataset:MyDataset,batch_size:int,shuffle:bool=False,drop_last:bool=False,device:Union[str,torch.device]='cpu',pin_memory:bool=False):
+        """Iterable used in place of the DataLoader when the whole dataset fits in memory: all the tensors are built once (see `MyDataset.get_batch`)
+        and the batches are sliced with a permutation of the indexes, so there are no workers.
+        The tensors are stored on `device` or, with `pin_memory`, in pinned CPU memory: each batch is gathered in one of two preallocated pinned buffers
+        and copied on `device` asynchronously (pinned only if cuda is available, on a CPU only machine the same code runs with ordinary memory)
+
+        Args:
+            dataset (MyDataset): the dataset
+            batch_size (int): batch size
+            shuffle (bool, optional): shuffle the samples at each epoch. Defaults to False.
+            drop_last (bool, optional): drop the last incomplete batch. Defaults to False.
+            device (Union[str,torch.device], optional): device of the batches. Defaults to 'cpu'.
+            pin_memory (bool, optional): if True the tensors are kept in pinned CPU memory and each batch is copied on `device`. Defaults to False.
+        """
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.device = torch.device(device)
+        self.pin_memory = pin_memory
+        pin = pin_memory and torch.cuda.is_available()
+        self.tensors = {}
+        self.static = {}
+        for k,v in dataset.get_batch(np.arange(len(dataset))).items():
+            if k in ['idx_target','idx_target_future']:
+                self.static[k] = v.to(self.device)
+            elif pin_memory:
+                self.tensors[k] = v.pin_memory() if pin else v
+            else:
+                self.tensors[k] = v.to(self.device)
+        if pin_memory:
+            ##two buffers: a batch is gathered while the copy of the previous one can still be running
+            self.buffers = [{k:torch.empty((batch_size,)+tuple(v.shape[1:]),dtype=v.dtype,pin_memory=pin) for k,v in self.tensors.items()} for _ in range(2)]
+            self.events = [None,None]
+        self.n = len(dataset)
+
+    def __len__(self):
+        if self.drop_last:
+            return self.n//self.batch_size
+        return (self.n+self.batch_size-1)//self.batch_size
+
+    def _gather(self,idxs:torch.Tensor,slot:int)->dict:
+        """Gather the samples in the pinned buffers of `slot` and copy them on the device
+
+        :meta private:
+        """
+        if self.events[slot] is not None:
+            ##the previous copy from this buffer must be finished
+            self.events[slot].synchronize()
+        batch = {}
+        for k,v in self.tensors.items():
+            buffer = self.buffers[slot][k][:len(idxs)]
+            torch.index_select(v,0,idxs,out=buffer)
+            batch[k] = buffer.to(self.device,non_blocking=True,copy=True)
+        if self.device.type=='cuda':
+            self.events[slot] = torch.cuda.Event()
+            self.events[slot].record()
+        return batch
+
+    def __iter__(self):
+        storage = torch.device('cpu') if self.pin_memory else self.device
+        if self.shuffle:
+            order = torch.randperm(self.n,device=storage)
+        else:
+            order = torch.arange(self.n,device=storage)
+        for i in range(len(self)):
+            idxs = order[i*self.batch_size:(i+1)*self.batch_size]
+            if self.pin_memory:
+                batch = self._gather(idxs,i%2)
+            else:
+                batch = {k:v[idxs] for k,v in self.tensors.items()}
+            batch.update(self.static)
+            yield batch
+
+class LazyWindows(Mapping):
+    """Read only dictionary materializing the windows of a `WindowedDataset` only when a key is accessed
+
+    :meta private:
+    """
+    def __init__(self,dataset):
+        self.dataset = dataset
+
+    def __getitem__(self,k):
+        return self.dataset.get_window(k,slice(None))
+
+    def __iter__(self):
+        return iter(self.dataset.windows)
+
+    def __len__(self):
+        return len(self.dataset.windows)
+
+
+class WindowedDataset(MyDataset):
+
+    _shared_attributes = ['arrays','time','group_array']
+
+    def __init__(self, arrays:dict,windows:dict,starts:np.array,time:np.array,groups:np.array,t_window:tuple,idx_target:Union[np.array,None],idx_target_future:Union[np.array,None])->torch.utils.data.Dataset:
+        """
+            Same as `MyDataset` but the overlapping windows are not materialized: the dataset stores one contiguous array per variable block and the starting positions of the valid samples, the windows are sliced in `__getitem__`.
+            The memory is O(series length) instead of O(samples x window)
+
+        Args:
+            arrays (dict): a dictionary of contiguous np.array (rows of the same group are contiguous)
+            windows (dict): for each key of the batch (y, x_num_past, ...) a tuple (name of the array, offset respect to the starting position, length of the window)
+            starts (np.array): positions of the valid samples (see `valid_window_starts`)
+            time (np.array): the time array, aligned with the arrays
+            groups (np.array): the group array, aligned with the arrays
+            t_window (tuple): offset and length of the window used for computing the time of the targets
+            idx_target (Union[np.array,None]): see `MyDataset`
+            idx_target_future (Union[np.array,None]): see `MyDataset`
+
+        Returns:
+            torch.utils.data.Dataset: a torch Dataset to be used in a Dataloader
+        """
+        self.arrays = arrays
+        self.windows = windows
+        self.starts = np.asarray(starts,dtype=np.int64)
+        self.time = time
+        self.group_array = groups
+        self.t_window = t_window
+        self.idx_target = np.array(idx_target) if idx_target is not None else None
+        self.idx_target_future = np.array(idx_target_future) if idx_target_future is not None else None
+
+    @property
+    def data(self)->Mapping:
+        return LazyWindows(self)
+
+    @property
+    def t(self)->np.array:
+        return self.get_time(slice(None))
+
+    @property
+    def groups(self)->np.array:
+        return self.get_groups(slice(None))
+
+    def get_time(self,idxs)->np.array:
+        offset,length = self.t_window
+        return sliding_windows(self.time,np.atleast_1d(self.starts[idxs])+offset,length)
+
+    def get_groups(self,idxs)->np.array:
+        return self.group_array[self.starts[idxs]]
+
+    def get_window(self,k:str,idxs)->np.array:
+        """Slice the windows of a given key
+
+        Args:
+            k (str): key of the batch
+            idxs (int, slice or np.array): samples to extract
+
+        Returns:
+            np.array: the window if idxs is an integer, the stacked windows otherwise
+        """
+        name, offset, length = self.windows[k]
+        positions = self.starts[idxs]+offset
+        if np.ndim(positions)==0:
+            return self.arrays[name][positions:positions+length]
+        return sliding_windows(self.arrays[name],positions,length)
+
+    def __len__(self):
+        return len(self.starts)
+
+class MemmapDataset(WindowedDataset):
+
+    def __init__(self, path:str)->torch.utils.data.Dataset:
+        """
+            `WindowedDataset` reading the arrays written by `TimeSeries.create_stored_dataset` as read-only memory maps.
+            When the dataset is sent to the DataLoader workers only the path is pickled and each worker opens the same files.
+
+        Args:
+            path (str): folder containing the `.npy` files and the `index.json` file
+
+        Returns:
+            torch.utils.data.Dataset: a torch Dataset to be used in a Dataloader
+        """
+        self.path = path
+        with open(os.path.join(path,'index.json'),'r') as f:
+            index = json.load(f)
+        arrays = {}
+        for name in set([w[0] for w in index['windows'].values()]+['time','groups']):
+            if os.path.exists(os.path.join(path,f'{name}.npy')):
+                arrays[name] = np.load(os.path.join(path,f'{name}.npy'),mmap_mode='r')
+        self.group_names = np.array(index['groups'],dtype=object)
+        super().__init__(arrays,
+                         {k:tuple(v) for k,v in index['windows'].items()},
+                         np.load(os.path.join(path,'starts.npy')),
+                         arrays.get('time'),
+                         arrays.get('groups'),
+                         tuple(index['t_window']),
+                         index['idx_target'],
+                         index['idx_target_future'])
+
+    def get_time(self,idxs)->np.array:
+        if len(self.starts[idxs])==0:
+            return np.zeros((0,self.t_window[1]))
+        return super().get_time(idxs)
+
+    def get_groups(self,idxs)->np.array:
+        if len(self.starts[idxs])==0:
+            return np.zeros(0,dtype=object)
+        return self.group_names[super().get_groups(idxs)]
+
+    def get_window(self,k:str,idxs)->np.array:
+        ##copy the data out of the read-only memory map
+        return np.array(super().get_window(k,idxs))
+
+    def share_memory(self)->'MemmapDataset':
+        ##the memory maps are already shared among the processes by the page cache
+        return self
+
+    def fingerprint(self)->str:
+        ##the files are identified by the folder and the time they were written
+        stat = os.stat(os.path.join(self.path,'index.json'))
+        return hashlib.sha1(f'{os.path.abspath(self.path)}{stat.st_mtime_ns}{stat.st_size}'.encode()).hexdigest()
+
+    def __getstate__(self):
+        return {'path':self.path}
+
+    def __setstate__(self,state):
+        self.__init__(state['path'])
+
 class ActionEnum(Enum):
     """action of categorical variable
     
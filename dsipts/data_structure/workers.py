@@ -0,0 +1,211 @@
+import os
+import queue
+import traceback
+import numpy as np
+import pandas as pd
+import torch
+import torch.multiprocessing as mp
+from collections import OrderedDict
+from typing import Iterator, List
+from torch.utils.data import BatchSampler, RandomSampler, SequentialSampler
+from .utils import MyDataset
+
+
+def memory_usage()->dict:
+    """Resident and shared memory of the current process in MB (from /proc/self/statm, peak RSS if not available)
+
+    Returns:
+        dict: pid, rss_mb and shared_mb
+    """
+    try:
+        with open('/proc/self/statm','r') as f:
+            pages = f.read().split()
+        page_size = os.sysconf('SC_PAGE_SIZE')/1024**2
+        return {'pid':os.getpid(),'rss_mb':int(pages[1])*page_size,'shared_mb':int(pages[2])*page_size}
+    except Exception as _:
+        import resource
+        return {'pid':os.getpid(),'rss_mb':resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,'shared_mb':np.nan}
+
+
+def _worker_loop(inputs:mp.Queue,outputs:mp.Queue)->None:
+    """Loop of a worker: it keeps the registered datasets and returns the requested batches
+
+    :meta private:
+    """
+    torch.set_num_threads(1)
+    datasets = {}
+    while True:
+        message = inputs.get()
+        if message is None:
+            break
+        kind = message[0]
+        if kind=='register':
+            datasets[message[1]] = message[2]
+        elif kind=='drop':
+            datasets.pop(message[1],None)
+        else:
+            job = message[1]
+            try:
+                if kind=='batch':
+                    outputs.put((job,True,datasets[message[2]].get_batch(message[3])))
+                elif kind=='memory':
+                    outputs.put((job,True,memory_usage()))
+            except Exception as _:
+                outputs.put((job,False,traceback.format_exc()))
+
+
+class WorkerPool():
+
+    def __init__(self,num_workers:int,max_datasets:int=4,prefetch_factor:int=2):
+        """Pool of processes building the batches, it is created once by `TimeSeries` and reused by all the training and inference calls.
+        Each dataset is moved in shared memory and sent once to every worker (see `MyDataset.share_memory`), then only the indexes of the batches are sent.
+
+        Args:
+            num_workers (int): number of processes
+            max_datasets (int, optional): number of datasets kept by the workers, the least recently used are dropped. Defaults to 4.
+            prefetch_factor (int, optional): number of batches requested in advance for each worker. Defaults to 2.
+        """
+        self.num_workers = num_workers
+        self.max_datasets = max_datasets
+        self.prefetch_factor = prefetch_factor
+        ctx = mp.get_context()
+        self.outputs = ctx.Queue()
+        self.inputs = [ctx.Queue() for _ in range(num_workers)]
+        self.workers = [ctx.Process(target=_worker_loop,args=(q,self.outputs),daemon=True) for q in self.inputs]
+        for w in self.workers:
+            w.start()
+        self.datasets = OrderedDict()
+        self.results = {}
+        self.abandoned = set()
+        self.job = 0
+
+    def is_alive(self)->bool:
+        return len(self.workers)>0 and all([w.is_alive() for w in self.workers])
+
+    def register(self,dataset:MyDataset)->str:
+        """Send a dataset to the workers (if a dataset with the same content was not already sent, see `MyDataset.fingerprint`)
+
+        Args:
+            dataset (MyDataset): the dataset
+
+        Returns:
+            str: key of the dataset
+        """
+        ##the datasets are rebuilt (or unpickled from the cache) at each call, the content identifies them
+        key = dataset.fingerprint()
+        if key in self.datasets:
+            self.datasets.move_to_end(key)
+            return key
+        dataset.share_memory()
+        for q in self.inputs:
+            q.put(('register',key,dataset))
+        self.datasets[key] = dataset
+        while len(self.datasets)>self.max_datasets:
+            self.release(next(iter(self.datasets)))
+        return key
+
+    def release(self,key:str)->None:
+        """Drop a dataset from the pool and from the workers: once the references are gone the shared memory of the dataset is freed
+        (unless the dataset is still used in the main process)
+
+        Args:
+            key (str): key of the dataset (see `register`)
+        """
+        if self.datasets.pop(key,None) is not None:
+            for q in self.inputs:
+                q.put(('drop',key))
+
+    def _submit(self,worker:int,*message)->int:
+        self.job+=1
+        self.inputs[worker].put((message[0],self.job)+message[1:])
+        return self.job
+
+    def _result(self,job:int):
+        while job not in self.results:
+            try:
+                res_job,ok,payload = self.outputs.get(timeout=5)
+            except queue.Empty:
+                if not self.is_alive():
+                    raise RuntimeError('A worker of the pool died unexpectedly')
+                continue
+            if res_job in self.abandoned:
+                self.abandoned.discard(res_job)
+            else:
+                self.results[res_job] = (ok,payload)
+        ok,payload = self.results.pop(job)
+        if not ok:
+            raise RuntimeError(f'Error in a worker of the pool:\n{payload}')
+        return payload
+
+    def map_batches(self,dataset:MyDataset,batches:Iterator[List[int]])->Iterator[dict]:
+        """Build the batches in the workers, keeping the order
+
+        Args:
+            dataset (MyDataset): the dataset
+            batches (Iterator[List[int]]): indexes of the samples of each batch
+
+        Yields:
+            dict: the batches
+        """
+        key = self.register(dataset)
+        pending = []
+        i = 0
+        try:
+            for idxs in batches:
+                pending.append(self._submit(i%self.num_workers,'batch',key,np.asarray(idxs,dtype=np.int64)))
+                i+=1
+                if len(pending)>=self.prefetch_factor*self.num_workers:
+                    yield self._result(pending.pop(0))
+            while len(pending)>0:
+                yield self._result(pending.pop(0))
+        finally:
+            ##the iteration can be interrupted, the results still running will be discarded
+            for job in pending:
+                if job in self.results:
+                    self.results.pop(job)
+                else:
+                    self.abandoned.add(job)
+
+    def memory_usage(self)->pd.DataFrame:
+        """Memory used by each worker
+
+        Returns:
+            pd.DataFrame: one row per worker with pid, rss_mb and shared_mb
+        """
+        jobs = [self._submit(i,'memory') for i in range(self.num_workers)]
+        return pd.DataFrame([self._result(job) for job in jobs])
+
+    def close(self)->None:
+        """Stop the workers
+        """
+        for q in self.inputs:
+            q.put(None)
+        for w in self.workers:
+            w.join(timeout=5)
+            if w.is_alive():
+                w.terminate()
+        self.workers = []
+        self.datasets = OrderedDict()
+
+
+class PoolDataLoader():
+
+    def __init__(self,dataset:MyDataset,batch_size:int,shuffle:bool,drop_last:bool,pool:WorkerPool):
+        """Iterable used in place of the DataLoader, the batches are built by a `WorkerPool`
+
+        Args:
+            dataset (MyDataset): the dataset
+            batch_size (int): batch size
+            shuffle (bool): shuffle the samples at each epoch
+            drop_last (bool): drop the last incomplete batch
+            pool (WorkerPool): the pool of workers
+        """
+        self.dataset = dataset
+        self.pool = pool
+        self.batch_sampler = BatchSampler(RandomSampler(dataset) if shuffle else SequentialSampler(dataset),batch_size,drop_last)
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def __iter__(self):
+        return self.pool.map_batches(self.dataset,iter(self.batch_sampler))
@@ -11,6 +11,7 @@ from typing import List,Union
 from einops import  repeat
 from ..data_structure.utils import beauty_string
 from .utils import  get_scope
+from .attention import set_attention_backend
 from .crossformer.cross_encoder import Encoder
 from .crossformer.cross_decoder import Decoder
 from .crossformer.cross_embed import DSW_embedding
@@ -49,6 +50,7 @@ class CrossFormer(Base):
                  loss_type: str='l1',
                  quantiles:List[int]=[],
                  dropout_rate:float=0.1,
+                 attention_backend:str='sdpa',
                  optim:Union[str,None]=None,
                  optim_config:dict=None,
                  scheduler_config:dict=None,
@@ -75,6 +77,7 @@ class CrossFormer(Base):
             loss_type (str, optional): this model uses custom losses or l1 or mse. Custom losses can be linear_penalization or exponential_penalization. Default l1,
             quantiles (List[int], optional): NOT USED YET
             dropout_rate (float, optional):  dropout rate in Dropout layers. Defaults to 0.1.
+            attention_backend (str, optional): `sdpa` uses the fused attention of pytorch, `math` the explicit computation (see `models.attention`). Defaults to 'sdpa'.
             optim (str, optional): if not None it expects a pytorch optim method. Defaults to None that is mapped to Adam.
             optim_config (dict, optional): configuration for Adam optimizer. Defaults to None.
             scheduler_config (dict, optional): configuration for stepLR scheduler. Defaults to None.
@@ -117,6 +120,7 @@ class CrossFormer(Base):
         self.dec_pos_embedding = nn.Parameter(torch.randn(1, past_channels, (self.pad_future_steps // seg_len), d_model))
         self.decoder = Decoder(seg_len, n_layer_encoder + 1, d_model, n_head, hidden_size, dropout_rate, \
                                     out_seg_num = (self.pad_future_steps // seg_len), factor = factor)
+        set_attention_backend(self,attention_backend)
         
     def forward(self, batch):
 
@@ -14,6 +14,7 @@ from .utils import QuantileLossMO,Permute, get_activation
 from typing import List, Union
 from ..data_structure.utils import beauty_string
 from .utils import  get_scope
+from .attention import set_attention_backend
 
 
 
@@ -49,6 +50,7 @@ class ITransformer(Base):
                  persistence_weight:float=0.0,
                  loss_type: str='l1',
                  quantiles:List[float]=[],
+                 attention_backend:str='sdpa',
                  optim:Union[str,None]=None,
                  optim_config:Union[dict,None]=None,
                  scheduler_config:Union[dict,None]=None,
@@ -76,6 +78,7 @@ class ITransformer(Base):
             persistence_weight (float, optional): Defaults to 0.0.
             loss_type (str, optional): Defaults to 'l1'.
             quantiles (List[float], optional): Defaults to []. NOT USED
+            attention_backend (str, optional): `sdpa` uses the fused attention of pytorch, `math` the explicit computation (see `models.attention`). Defaults to 'sdpa'.
             optim (Union[str,None], optional): Defaults to None.
             optim_config (Union[dict,None], optional): Defaults to None.
             scheduler_config (Union[dict,None], optional): Defaults to None.
@@ -143,6 +146,7 @@ class ITransformer(Base):
             norm_layer=torch.nn.LayerNorm(d_model)
         )
         self.projector = nn.Linear(d_model, future_steps*self.mul, bias=True)
+        set_attention_backend(self,attention_backend)
 
     def forecast(self, x_enc, x_mark_enc, x_dec, x_mark_dec):
         if self.use_norm:
@@ -13,6 +13,7 @@ from .informer.attn import FullAttention, ProbAttention, AttentionLayer
 from .informer.embed import DataEmbedding
 from ..data_structure.utils import beauty_string
 from .utils import  get_scope,QuantileLossMO
+from .attention import set_attention_backend
   
     
   
@@ -46,6 +47,7 @@ class Informer(Base):
                  loss_type: str='l1',
                  quantiles:List[int]=[],
                  dropout_rate:float=0.1,
+                 attention_backend:str='sdpa',
                  optim:Union[str,None]=None,
                  optim_config:dict=None,
                  scheduler_config:dict=None,
@@ -74,6 +76,7 @@ class Informer(Base):
             loss_type (str, optional): this model uses custom losses or l1 or mse. Custom losses can be linear_penalization or exponential_penalization. Default l1,
             quantiles (List[int], optional): NOT USED YET
             dropout_rate (float, optional):  dropout rate in Dropout layers. Defaults to 0.1.
+            attention_backend (str, optional): `sdpa` uses the fused attention of pytorch, `math` the explicit computation (see `models.attention`). Defaults to 'sdpa'.
             optim (str, optional): if not None it expects a pytorch optim method. Defaults to None that is mapped to Adam.
             optim_config (dict, optional): configuration for Adam optimizer. Defaults to None.
             scheduler_config (dict, optional): configuration for stepLR scheduler. Defaults to None.
@@ -146,6 +149,7 @@ class Informer(Base):
         )
 
         self.projection = nn.Linear(d_model, out_channels*self.mul, bias=True)
+        set_attention_backend(self,attention_backend)
         
                 
         
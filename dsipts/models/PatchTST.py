@@ -11,6 +11,7 @@ from typing import List,Union
 from ..data_structure.utils import beauty_string
 from .utils import  get_scope
 from .utils import  get_activation
+from .attention import set_attention_backend
 from .patchtst.layers import series_decomp, PatchTST_backbone
 
 
@@ -45,6 +46,8 @@ class PatchTST(Base):
                  loss_type: str='l1',
                  quantiles:List[int]=[],
                  dropout_rate:float=0.1,
+                 res_attention:bool=True,
+                 attention_backend:str='sdpa',
                  optim:Union[str,None]=None,
                  optim_config:dict=None,
                  scheduler_config:dict=None,
@@ -71,6 +74,8 @@ class PatchTST(Base):
             loss_type (str, optional): this model uses custom losses or l1 or mse. Custom losses can be linear_penalization or exponential_penalization. Default l1,
             quantiles (List[int], optional): NOT USED YET
             dropout_rate (float, optional):  dropout rate in Dropout layers. Defaults to 0.1.
+            res_attention (bool, optional): residual attention (the scores of a layer are added to the ones of the next layer), it requires the explicit computation of the scores. Defaults to True.
+            attention_backend (str, optional): `sdpa` uses the fused attention of pytorch, `math` the explicit computation (see `models.attention`). Defaults to 'sdpa'.
             optim (str, optional): if not None it expects a pytorch optim method. Defaults to None that is mapped to Adam.
             optim_config (dict, optional): configuration for Adam optimizer. Defaults to None.
             scheduler_config (dict, optional): configuration for stepLR scheduler. Defaults to None.
@@ -116,7 +121,7 @@ class PatchTST(Base):
                                   max_seq_len=past_steps+future_steps, n_layers=n_layer, d_model=d_model,
                                   n_heads=n_head, d_k=None, d_v=None, d_ff=hidden_size, norm='BatchNorm', attn_dropout=dropout_rate,
                                   dropout=dropout_rate, act=activation(), key_padding_mask='auto', padding_var=None, 
-                                  attn_mask=None, res_attention=True, pre_norm=False, store_attn=False,
+                                  attn_mask=None, res_attention=res_attention, pre_norm=False, store_attn=False,
                                   pe='zeros', learn_pe=True, fc_dropout=dropout_rate, head_dropout=dropout_rate, padding_patch = 'end',
                                   pretrain_head=False, head_type='flatten', individual=False, revin=True, affine=False,
                                   subtract_last=remove_last, verbose=False)
@@ -124,7 +129,7 @@ class PatchTST(Base):
                                   max_seq_len=past_steps+future_steps, n_layers=n_layer, d_model=d_model,
                                   n_heads=n_head, d_k=None, d_v=None, d_ff=hidden_size, norm='BatchNorm', attn_dropout=dropout_rate,
                                   dropout=dropout_rate, act=activation(), key_padding_mask='auto', padding_var=None, 
-                                  attn_mask=None, res_attention=True, pre_norm=False, store_attn=False,
+                                  attn_mask=None, res_attention=res_attention, pre_norm=False, store_attn=False,
                                   pe='zeros', learn_pe=True, fc_dropout=dropout_rate, head_dropout=dropout_rate, padding_patch = 'end',
                                   pretrain_head=False, head_type='flatten', individual=False, revin=True, affine=False,
                                   subtract_last=remove_last, verbose=False)
@@ -133,10 +138,11 @@ class PatchTST(Base):
                                   max_seq_len=past_steps+future_steps, n_layers=n_layer, d_model=d_model,
                                   n_heads=n_head, d_k=None, d_v=None, d_ff=hidden_size, norm='BatchNorm', attn_dropout=dropout_rate,
                                   dropout=dropout_rate, act=activation(), key_padding_mask='auto', padding_var=None, 
-                                  attn_mask=None, res_attention=True, pre_norm=False, store_attn=False,
+                                  attn_mask=None, res_attention=res_attention, pre_norm=False, store_attn=False,
                                   pe='zeros', learn_pe=True, fc_dropout=dropout_rate, head_dropout=dropout_rate, padding_patch = 'end',
                                   pretrain_head=False, head_type='flatten', individual=False, revin=True, affine=False,
                                   subtract_last=remove_last, verbose=False)
+        set_attention_backend(self,attention_backend)
     
         #self.final_linear = nn.Sequential(nn.Linear(past_channels,past_channels//2),activation(),nn.Dropout(dropout_rate), nn.Linear(past_channels//2,out_channels)  )
     
@@ -9,6 +9,7 @@ from torch.nn import functional as F
 from .base import Base
 from typing import List, Union
 from .vva.minigpt import Block
+from .attention import set_attention_backend
 from .vva.vqvae import VQVAE
 import logging
 from random import random
@@ -46,6 +47,7 @@ class VQVAEA(Base):
                  persistence_weight:float=0.0,
                  loss_type: str='l1',
                  quantiles:List[int]=[],
+                 attention_backend:str='sdpa',
                  optim:Union[str,None]=None,
                  optim_config:dict=None,
                  scheduler_config:dict=None,
@@ -75,6 +77,7 @@ class VQVAEA(Base):
             use_glu (bool,optional): use GLU for feature selection. Defaults to True.
             glu_percentage (float, optiona): percentage of features to use. Defaults to 1.0.
             n_classes (int): number of classes (0 in regression)
+            attention_backend (str, optional): `sdpa` uses the fused attention of pytorch, `math` the explicit computation (see `models.attention`). Defaults to 'sdpa'.
             optim (str, optional): if not None it expects a pytorch optim method. Defaults to None that is mapped to Adam.
             optim_config (dict, optional): configuration for Adam optimizer. Defaults to None.
             scheduler_config (dict, optional): configuration for stepLR scheduler. Defaults to None.
@@ -107,6 +110,7 @@ class VQVAEA(Base):
             ln_f = nn.LayerNorm(d_model),
             lm_head = nn.Linear(d_model, max_voc_size, bias=False)
         ))
+        set_attention_backend(self,attention_backend)
         # report number of parameters (note we don't count the decoder parameters in lm_head)
         n_params = sum(p.numel() for p in self.transformer.parameters())
         beauty_string("number of parameters: %.2fM" % (n_params/1e6,),'info',self.verbose)
@@ -4,6 +4,7 @@ import torch
 from .base import Base
 from typing import List, Union
 from .vva.minigpt import Block
+from .attention import set_attention_backend
 import math
 from torch.nn import functional as F
 from ..data_structure.utils import beauty_string
@@ -37,6 +38,7 @@ class VVA(Base):
                  persistence_weight:float=0.0,
                  loss_type: str='l1',
                  quantiles:List[int]=[],
+                 attention_backend:str='sdpa',
                  optim:Union[str,None]=None,
                  optim_config:dict=None,
                  scheduler_config:dict=None,
@@ -66,6 +68,7 @@ class VVA(Base):
             use_glu (bool,optional): use GLU for feature selection. Defaults to True.
             glu_percentage (float, optiona): percentage of features to use. Defaults to 1.0.
             n_classes (int): number of classes (0 in regression)
+            attention_backend (str, optional): `sdpa` uses the fused attention of pytorch, `math` the explicit computation (see `models.attention`). Defaults to 'sdpa'.
             optim (str, optional): if not None it expects a pytorch optim method. Defaults to None that is mapped to Adam.
             optim_config (dict, optional): configuration for Adam optimizer. Defaults to None.
             scheduler_config (dict, optional): configuration for stepLR scheduler. Defaults to None.
@@ -86,6 +89,7 @@ class VVA(Base):
             ln_f = nn.LayerNorm(d_model),
         ))
         self.lm_head = nn.Linear(d_model, max_voc_size, bias=False)
+        set_attention_backend(self,attention_backend)
 
 
         for pn, p in self.named_parameters():
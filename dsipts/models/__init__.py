@@ -0,0 +1,46 @@
+import importlib
+from typing import Dict, Tuple
+
+##name used in the configurations -> (module, class), the module of an architecture is imported only when it is selected
+MODELS:Dict[str,Tuple[str,str]] = {'linear':('.LinearTS','LinearTS'),
+                                   'rnn':('.RNN','RNN'),
+                                   'dilated_conv':('.DilatedConv','DilatedConv'),
+                                   'persistent':('.Persistent','Persistent'),
+                                   'd3vae':('.D3VAE','D3VAE'),
+                                   'tft':('.TFT','TFT'),
+                                   'vva':('.VVA','VVA'),
+                                   'vqvae':('.VQVAEA','VQVAEA'),
+                                   'crossformer':('.CrossFormer','CrossFormer'),
+                                   'informer':('.Informer','Informer'),
+                                   'autoformer':('.Autoformer','Autoformer'),
+                                   'patchtst':('.PatchTST','PatchTST'),
+                                   'diffusion':('.Diffusion','Diffusion'),
+                                   'dilated_conv_ed':('.DilatedConvED','DilatedConvED'),
+                                   'tide':('.TIDE','TIDE'),
+                                   'itransformer':('.ITransformer','ITransformer')}
+
+
+def register_model(name:str,module:str,class_name:str)->None:
+    """Add a model to the registry (for example a custom architecture outside dsipts)
+
+    Args:
+        name (str): name used in the configurations
+        module (str): absolute module containing the model (relative to `dsipts.models` if it starts with a dot)
+        class_name (str): name of the class
+    """
+    MODELS[name] = (module,class_name)
+
+
+def get_model(name:str)->type:
+    """Class of a model, the module is imported now
+
+    Args:
+        name (str): name used in the configurations (see `MODELS`)
+
+    Returns:
+        type: the class of the model
+    """
+    if name not in MODELS:
+        raise KeyError(f'Model {name} not found, available models: {list(MODELS.keys())}')
+    module,class_name = MODELS[name]
+    return getattr(importlib.import_module(module,__name__),class_name)
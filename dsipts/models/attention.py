@@ -0,0 +1,105 @@
+## Common attention backend of the transformer models (Informer, iTransformer, CrossFormer, PatchTST, VVA/VQVAEA)
+import math
+import torch
+import torch.nn.functional as F
+from torch import nn
+from typing import Union, Tuple
+
+BACKENDS = ['sdpa','math']
+##fused kernel of pytorch (torch>=2.0), the scale argument is available from torch 2.1
+HAS_SDPA = hasattr(F,'scaled_dot_product_attention')
+SDPA_SCALE = HAS_SDPA and tuple([int(x) for x in torch.__version__.split('+')[0].split('.')[:2]])>=(2,1)
+
+
+def scaled_dot_product_attention(query:torch.Tensor,key:torch.Tensor,value:torch.Tensor,attn_mask:Union[torch.Tensor,None]=None,is_causal:bool=False,
+                                 dropout_p:float=0.0,training:bool=False,scale:Union[float,torch.Tensor,None]=None,backend:str='sdpa',
+                                 need_weights:bool=False)->Tuple[torch.Tensor,Union[torch.Tensor,None]]:
+    """Scaled dot product attention softmax(QK^T*scale+mask)V. With the `sdpa` backend the computation is dispatched to `torch.nn.functional.scaled_dot_product_attention`
+    (flash or memory efficient kernels when available, the BxHxLxS score matrix is not kept for the backward), the `math` backend is the explicit computation used before.
+    The `math` backend is used anyway if the attention weights are required or the fused kernel is not available
+
+    Args:
+        query (torch.Tensor): queries B x H x L x E
+        key (torch.Tensor): keys B x H x S x E
+        value (torch.Tensor): values B x H x S x D
+        attn_mask (Union[torch.Tensor,None], optional): boolean mask (True means NOT attended, as in the masks of the models) or additive float mask, broadcastable to B x H x L x S. Defaults to None.
+        is_causal (bool, optional): mask the future positions (upper triangular mask). Defaults to False.
+        dropout_p (float, optional): dropout on the attention weights. Defaults to 0.0.
+        training (bool, optional): the dropout is applied only in training. Defaults to False.
+        scale (Union[float,torch.Tensor,None], optional): scale of the scores, a tensor in case of learnable scale. Defaults to None that is 1/sqrt(E).
+        backend (str, optional): `sdpa` or `math`. Defaults to 'sdpa'.
+        need_weights (bool, optional): return also the attention weights. Defaults to False.
+
+    Returns:
+        Tuple[torch.Tensor,Union[torch.Tensor,None]]: output B x H x L x D and the attention weights B x H x L x S (None if not required)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f'Attention backend {backend} not in {BACKENDS}')
+    dropout_p = dropout_p if training else 0.0
+    if backend=='math' or need_weights or not HAS_SDPA:
+        return _math_attention(query,key,value,attn_mask,is_causal,dropout_p,scale)
+
+    if attn_mask is not None:
+        if attn_mask.dtype==torch.bool:
+            ##in the fused kernel True means attended
+            attn_mask = ~attn_mask
+        if is_causal:
+            attn_mask = _merge_causal(attn_mask,query.shape[-2],key.shape[-2])
+            is_causal = False
+    if isinstance(scale,torch.Tensor) or (scale is not None and not SDPA_SCALE):
+        ##learnable scale (or old torch): the queries are rescaled so that the default scale 1/sqrt(E) gives the required one
+        query = query*(scale*math.sqrt(query.shape[-1]))
+        scale = None
+    kwargs = {'scale':scale} if SDPA_SCALE else {}
+    return F.scaled_dot_product_attention(query,key,value,attn_mask=attn_mask,dropout_p=dropout_p,is_causal=is_causal,**kwargs),None
+
+
+def _math_attention(query:torch.Tensor,key:torch.Tensor,value:torch.Tensor,attn_mask:Union[torch.Tensor,None],is_causal:bool,
+                    dropout_p:float,scale:Union[float,torch.Tensor,None])->Tuple[torch.Tensor,torch.Tensor]:
+    """Explicit computation of `scaled_dot_product_attention`
+
+    :meta private:
+    """
+    scale = 1./math.sqrt(query.shape[-1]) if scale is None else scale
+    scores = torch.matmul(query,key.transpose(-2,-1))*scale
+    if is_causal:
+        scores = scores.masked_fill(torch.ones(query.shape[-2],key.shape[-2],dtype=torch.bool,device=query.device).triu(1),-math.inf)
+    if attn_mask is not None:
+        if attn_mask.dtype==torch.bool:
+            scores = scores.masked_fill(attn_mask,-math.inf)
+        else:
+            scores = scores+attn_mask
+    A = F.dropout(torch.softmax(scores,dim=-1),dropout_p,training=dropout_p>0)
+    return torch.matmul(A,value),A
+
+
+def _merge_causal(attn_mask:torch.Tensor,L:int,S:int)->torch.Tensor:
+    """Add the causal mask to a mask in the `torch.nn.functional.scaled_dot_product_attention` convention
+
+    :meta private:
+    """
+    causal = torch.ones(L,S,dtype=torch.bool,device=attn_mask.device).tril()
+    if attn_mask.dtype==torch.bool:
+        return attn_mask & causal
+    return attn_mask.masked_fill(~causal,-math.inf)
+
+
+def set_attention_backend(model:nn.Module,backend:str)->int:
+    """Select the attention backend of all the attention layers of a model (the layers with the `attention_backend` attribute), it can be changed also after the training
+    for example to inspect the attention weights
+
+    Args:
+        model (nn.Module): the model
+        backend (str): `sdpa` or `math`, see `scaled_dot_product_attention`
+
+    Returns:
+        int: number of attention layers modified
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f'Attention backend {backend} not in {BACKENDS}')
+    n = 0
+    for module in model.modules():
+        if hasattr(module,'attention_backend'):
+            module.attention_backend = backend
+            n+=1
+    return n
@@ -17,29 +17,34 @@ class AutoCorrelation(nn.Module):
         self.mask_flag = mask_flag
         self.output_attention = output_attention
         self.dropout = nn.Dropout(attention_dropout)
+        self.init_index = None
+
+    def _init_index(self, length, device):
+        """
+        Index 0..length-1 of the time steps, built once for each length and device
+        """
+        if self.init_index is None or self.init_index.shape[0] != length or self.init_index.device != device:
+            self.init_index = torch.arange(length, device=device)
+        return self.init_index
 
     def time_delay_agg_training(self, values, corr):
         """
         SpeedUp version of Autocorrelation (a batch-normalization style design)
         This is for the training phase.
         """
-        head = values.shape[1]
-        channel = values.shape[2]
         length = values.shape[3]
         # find top k
         top_k = int(self.factor * math.log(length))
         mean_value = torch.mean(torch.mean(corr, dim=1), dim=1)
         index = torch.topk(torch.mean(mean_value, dim=0), top_k, dim=-1)[1]
-        weights = torch.stack([mean_value[:, index[i]] for i in range(top_k)], dim=-1)
+        weights = mean_value[:, index]
         # update corr
-        tmp_corr = torch.softmax(weights, dim=-1)
-        # aggregation
-        tmp_values = values
+        tmp_corr = torch.softmax(weights, dim=-1)[:, None, None, :, None]
+        # aggregation: the same delays for all the batch, the series rolled by the delay is a slice of the series repeated twice
+        tmp_values = values.repeat(1, 1, 1, 2)
         delays_agg = torch.zeros_like(values).float()
-        for i in range(top_k):
-            pattern = torch.roll(tmp_values, -int(index[i]), -1)
-            delays_agg = delays_agg + pattern * \
-                         (tmp_corr[:, i].unsqueeze(1).unsqueeze(1).unsqueeze(1).repeat(1, head, channel, length))
+        for i, delay in enumerate(index.tolist()):
+            delays_agg = delays_agg + tmp_values[..., delay:delay + length] * tmp_corr[..., i, :]
         return delays_agg
 
     def time_delay_agg_inference(self, values, corr):
@@ -47,51 +52,38 @@ class AutoCorrelation(nn.Module):
         SpeedUp version of Autocorrelation (a batch-normalization style design)
         This is for the inference phase.
         """
-        batch = values.shape[0]
-        head = values.shape[1]
-        channel = values.shape[2]
-        length = values.shape[3]
-        # index init
-        init_index = torch.arange(length).unsqueeze(0).unsqueeze(0).unsqueeze(0).repeat(batch, head, channel, 1).to(self.device)
+        batch, head, channel, length = values.shape
         # find top k
         top_k = int(self.factor * math.log(length))
         mean_value = torch.mean(torch.mean(corr, dim=1), dim=1)
-        weights = torch.topk(mean_value, top_k, dim=-1)[0]
-        delay = torch.topk(mean_value, top_k, dim=-1)[1]
+        weights, delay = torch.topk(mean_value, top_k, dim=-1)
         # update corr
-        tmp_corr = torch.softmax(weights, dim=-1)
-        # aggregation
+        tmp_corr = torch.softmax(weights, dim=-1)[:, None, None, :, None]
+        # aggregation: the indexes of the delays are broadcasted on heads and channels
+        tmp_delay = (self._init_index(length, values.device) + delay.unsqueeze(-1))[:, None, None, :, :]
         tmp_values = values.repeat(1, 1, 1, 2)
         delays_agg = torch.zeros_like(values).float()
         for i in range(top_k):
-            tmp_delay = init_index + delay[:, i].unsqueeze(1).unsqueeze(1).unsqueeze(1).repeat(1, head, channel, length)
-            pattern = torch.gather(tmp_values, dim=-1, index=tmp_delay)
-            delays_agg = delays_agg + pattern * \
-                         (tmp_corr[:, i].unsqueeze(1).unsqueeze(1).unsqueeze(1).repeat(1, head, channel, length))
+            pattern = torch.gather(tmp_values, dim=-1, index=tmp_delay[..., i, :].expand(batch, head, channel, length))
+            delays_agg = delays_agg + pattern * tmp_corr[..., i, :]
         return delays_agg
 
     def time_delay_agg_full(self, values, corr):
         """
         Standard version of Autocorrelation
         """
-        batch = values.shape[0]
-        head = values.shape[1]
-        channel = values.shape[2]
         length = values.shape[3]
-        # index init
-        init_index = torch.arange(length).unsqueeze(0).unsqueeze(0).unsqueeze(0).repeat(batch, head, channel, 1).to(self.device)
         # find top k
         top_k = int(self.factor * math.log(length))
-        weights = torch.topk(corr, top_k, dim=-1)[0]
-        delay = torch.topk(corr, top_k, dim=-1)[1]
+        weights, delay = torch.topk(corr, top_k, dim=-1)
         # update corr
         tmp_corr = torch.softmax(weights, dim=-1)
         # aggregation
+        init_index = self._init_index(length, values.device)
         tmp_values = values.repeat(1, 1, 1, 2)
         delays_agg = torch.zeros_like(values).float()
         for i in range(top_k):
-            tmp_delay = init_index + delay[..., i].unsqueeze(-1)
-            pattern = torch.gather(tmp_values, dim=-1, index=tmp_delay)
+            pattern = torch.gather(tmp_values, dim=-1, index=init_index + delay[..., i].unsqueeze(-1))
             delays_agg = delays_agg + pattern * (tmp_corr[..., i].unsqueeze(-1))
         return delays_agg
 
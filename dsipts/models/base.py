@@ -4,12 +4,10 @@ import torch
 import pytorch_lightning as pl
 from torch.optim.lr_scheduler import StepLR
 from abc import  abstractmethod
-from .utils import SinkhornDistance, SoftDTWBatch,PathDTWBatch,pairwise_distances
+from .utils import SinkhornDistance, SoftDTWBatch,PathDTWBatch
 from ..data_structure.utils import beauty_string
 from .utils import  get_scope
 import numpy as np
-from aim import Image
-import matplotlib.pyplot as plt
 def standardize_momentum(x,order):
     mean = torch.mean(x,1).unsqueeze(1).repeat(1,x.shape[1],1)
     num = torch.pow(x-mean,order).mean(axis=1)
@@ -18,21 +16,17 @@ def standardize_momentum(x,order):
     
     return num/den
 
-
-def dilate_loss(outputs, targets, alpha, gamma, device):
-	# outputs, targets: shape (batch_size, N_output, 1)
-	batch_size, N_output = outputs.shape[0:2]
-	loss_shape = 0
-	softdtw_batch = SoftDTWBatch.apply
-	D = torch.zeros((batch_size, N_output,N_output )).to(device)
-	for k in range(batch_size):
-		Dk = pairwise_distances(targets[k,:,:].view(-1,1),outputs[k,:,:].view(-1,1))
-		D[k:k+1,:,:] = Dk     
-	loss_shape = softdtw_batch(D,gamma)
+def dilate_loss(outputs, targets, alpha, gamma):
+	# outputs, targets: shape (batch_size, N_output, channels), the loss is the sum of the losses of the channels
+	batch_size, N_output, channels = outputs.shape
+	## squared distances between all the time steps, all the samples and channels at once: batch_size x channels x N_output x N_output
+	D = torch.cdist(targets.permute(0,2,1).reshape(-1,N_output,1),outputs.permute(0,2,1).reshape(-1,N_output,1),compute_mode='donot_use_mm_for_euclid_dist')**2
+	D = D.view(batch_size,channels,N_output,N_output)
+	loss_shape = SoftDTWBatch.apply(D,gamma)
 	
-	path_dtw = PathDTWBatch.apply
-	path = path_dtw(D,gamma)           
-	Omega =  pairwise_distances(torch.range(1,N_output).view(N_output,1)).to(device)
+	path = PathDTWBatch.apply(D,gamma)
+	steps = torch.arange(1,N_output+1,dtype=D.dtype,device=D.device)
+	Omega = (steps.view(-1,1)-steps.view(1,-1))**2
 	loss_temporal =  torch.sum( path*Omega ) / (N_output*N_output) 
 	loss = alpha*loss_shape+ (1-alpha)*loss_temporal
 	return loss#, loss_shape, loss_temporal
@@ -61,6 +55,8 @@ class Base(pl.LightningModule):
         self.train_loss_epoch = -100.0
         self.verbose = verbose
         self.name = self.__class__.__name__
+        ##the hyperparameters are the arguments of the model: the Sinkhorn loss is created once and reused in all the steps
+        self.sinkhorn = SinkhornDistance(eps=0.1, max_iter=100, reduction='mean') if self.hparams.get('loss_type',None)=='sinkhorn' else None
         beauty_string(self.description,'info',True)
     @abstractmethod
     def forward(self, batch:dict)-> torch.tensor:
@@ -146,6 +142,9 @@ class Base(pl.LightningModule):
             #track the predictions! 
 
             if self.count_epoch%int(max(self.trainer.max_epochs/100,1))==0:
+                ##imported here for not slowing down the import of the package
+                from aim import Image
+                import matplotlib.pyplot as plt
 
                 for i in range(batch['y'].shape[2]):
                     real =  batch['y'][0,:,i].cpu().detach().numpy()
@@ -224,8 +223,7 @@ class Base(pl.LightningModule):
             loss =  torch.mean(torch.abs(x- batch['y'])*weights)
          
         elif self.loss_type=='sinkhorn':
-            sinkhorn = SinkhornDistance(eps=0.1, max_iter=100, reduction='mean')
-            loss = sinkhorn.compute(x,batch['y'])
+            loss = self.sinkhorn.compute(x,batch['y'])
 
             
         elif self.loss_type == 'additive_iv':
@@ -264,12 +262,8 @@ class Base(pl.LightningModule):
             #BxLxCxMUL
             alpha = 0.5
             gamma = 0.01
-            loss = 0
-            ##no multichannel here
-            for i in range(y_hat.shape[2]):
-                ##error here
-                
-                loss+= dilate_loss( batch['y'][:,:,i:i+1],x[:,:,i:i+1], alpha, gamma, y_hat.device)
+            ##all the channels in one call
+            loss = dilate_loss( batch['y'],x, alpha, gamma)
             
             
         else:
@@ -4,6 +4,7 @@ from einops import rearrange, repeat
 
 
 from math import sqrt
+from ..attention import scaled_dot_product_attention
 
 class FullAttention(nn.Module):
     '''
@@ -13,17 +14,13 @@ class FullAttention(nn.Module):
         super(FullAttention, self).__init__()
         self.scale = scale
         self.dropout = nn.Dropout(attention_dropout)
+        self.attention_backend = 'sdpa'
         
     def forward(self, queries, keys, values):
-        B, L, H, E = queries.shape
-        _, S, _, D = values.shape
-        scale = self.scale or 1./sqrt(E)
-
-        scores = torch.einsum("blhe,bshe->bhls", queries, keys)
-        A = self.dropout(torch.softmax(scale * scores, dim=-1))
-        V = torch.einsum("bhls,bshd->blhd", A, values)
+        V, _ = scaled_dot_product_attention(queries.transpose(1,2), keys.transpose(1,2), values.transpose(1,2), dropout_p=self.dropout.p,
+                                            training=self.training, scale=self.scale, backend=self.attention_backend)
         
-        return V.contiguous()
+        return V.transpose(1,2).contiguous()
 
 
 class AttentionLayer(nn.Module):
@@ -5,6 +5,7 @@ import torch.nn as nn
 import numpy as np
 
 from math import sqrt
+from ..attention import scaled_dot_product_attention
 
 
 class TriangularCausalMask():
@@ -19,10 +20,8 @@ class TriangularCausalMask():
 
 class ProbMask():
     def __init__(self, B, H, L, index, scores,device):
-        _mask = torch.ones(L, scores.shape[-1], dtype=torch.bool).triu(1).to(device)
-        _mask_ex = _mask[None, None, :].expand(B, H, L, scores.shape[-1])
-        indicator = _mask_ex[torch.arange(B)[:, None, None],torch.arange(H)[None, :, None],index, :]
-        self._mask = indicator.view(scores.shape)
+        ## causal mask of the selected queries only (B x H x u x S): the key s is masked for the query in position i if s>i
+        self._mask = torch.arange(scores.shape[-1], device=device)[None, None, None, :] > index.unsqueeze(-1)
     
     @property
     def mask(self):
@@ -36,21 +35,16 @@ class FullAttention(nn.Module):
         self.mask_flag = mask_flag
         self.output_attention = output_attention
         self.dropout = nn.Dropout(attention_dropout)
+        self.attention_backend = 'sdpa'
         
     def forward(self, queries, keys, values, attn_mask):
-        B, L, H, E = queries.shape
-        _, S, _, D = values.shape
-        scale = self.scale or 1./sqrt(E)
-
-        scores = torch.einsum("blhe,bshe->bhls", queries, keys)
-        if self.mask_flag:
-            if attn_mask is None:
-                attn_mask = TriangularCausalMask(B, L, device=queries.device)
-
-            scores.masked_fill_(attn_mask.mask, -np.inf)
-
-        A = self.dropout(torch.softmax(scale * scores, dim=-1))
-        V = torch.einsum("bhls,bshd->blhd", A, values)
+        mask = None
+        if self.mask_flag and attn_mask is not None:
+            mask = attn_mask.mask
+        V, A = scaled_dot_product_attention(queries.transpose(1,2), keys.transpose(1,2), values.transpose(1,2), attn_mask=mask,
+                                            is_causal=self.mask_flag and attn_mask is None, dropout_p=self.dropout.p, training=self.training,
+                                            scale=self.scale, backend=self.attention_backend, need_weights=self.output_attention)
+        V = V.transpose(1,2)
         
         if self.output_attention:
             return (V.contiguous(), A)
@@ -71,15 +65,16 @@ class ProbAttention(nn.Module):
         B, H, L_K, E = K.shape
         _, _, L_Q, _ = Q.shape
 
-        # calculate the sampled Q_K
-        K_expand = K.unsqueeze(-3).expand(B, H, L_Q, L_K, E)
-        index_sample = torch.randint(L_K, (L_Q, sample_k)) # real U = U_part(factor*ln(L_k))*L_q
-        K_sample = K_expand[:, :, torch.arange(L_Q).unsqueeze(1), index_sample, :]
-        Q_K_sample = torch.matmul(Q.unsqueeze(-2), K_sample.transpose(-2, -1)).squeeze(-2)
+        # calculate the sampled Q_K: the same sample_k keys for all the queries of a head (B x H x sample_k x E instead of B x H x L_Q x sample_k x E),
+        # the measurement is used only for selecting the queries so no gradient is needed
+        with torch.no_grad():
+            index_sample = torch.randint(L_K, (H, sample_k), device=K.device) # real U = U_part(factor*ln(L_k)) for each head
+            K_sample = K[:, torch.arange(H, device=K.device).unsqueeze(1), index_sample, :]
+            Q_K_sample = torch.matmul(Q, K_sample.transpose(-2, -1))
 
-        # find the Top_k query with sparisty measurement
-        M = Q_K_sample.max(-1)[0] - torch.div(Q_K_sample.sum(-1), L_K)
-        M_top = M.topk(n_top, sorted=False)[1]
+            # find the Top_k query with sparisty measurement
+            M = Q_K_sample.max(-1)[0] - torch.div(Q_K_sample.sum(-1), L_K)
+            M_top = M.topk(n_top, sorted=False)[1]
 
         # use the reduced Q to calculate Q_K
         Q_reduce = Q[torch.arange(B)[:, None, None],
@@ -7,6 +7,7 @@ from typing import Optional
 from torch import Tensor
 import torch.nn.functional as F
 import numpy as np
+from ..attention import scaled_dot_product_attention
 
 
 class Transpose(nn.Module):
@@ -330,7 +331,7 @@ class TSTEncoderLayer(nn.Module):
 
         # Multi-Head attention
         self.res_attention = res_attention
-        self.self_attn = _MultiheadAttention(d_model, n_heads, d_k, d_v, attn_dropout=attn_dropout, proj_dropout=dropout, res_attention=res_attention)
+        self.self_attn = _MultiheadAttention(d_model, n_heads, d_k, d_v, attn_dropout=attn_dropout, proj_dropout=dropout, res_attention=res_attention, need_weights=store_attn)
 
         # Add & Norm
         self.dropout_attn = nn.Dropout(dropout)
@@ -392,7 +393,7 @@ class TSTEncoderLayer(nn.Module):
 
 
 class _MultiheadAttention(nn.Module):
-    def __init__(self, d_model, n_heads, d_k=None, d_v=None, res_attention=False, attn_dropout=0., proj_dropout=0., qkv_bias=True, lsa=False):
+    def __init__(self, d_model, n_heads, d_k=None, d_v=None, res_attention=False, attn_dropout=0., proj_dropout=0., qkv_bias=True, lsa=False, need_weights=True):
         """Multi Head Attention Layer
         Input shape:
             Q:       [batch_size (bs) x max_q_len x d_model]
@@ -411,7 +412,7 @@ class _MultiheadAttention(nn.Module):
 
         # Scaled Dot-Product Attention (multiple heads)
         self.res_attention = res_attention
-        self.sdp_attn = _ScaledDotProductAttention(d_model, n_heads, attn_dropout=attn_dropout, res_attention=self.res_attention, lsa=lsa)
+        self.sdp_attn = _ScaledDotProductAttention(d_model, n_heads, attn_dropout=attn_dropout, res_attention=self.res_attention, lsa=lsa, need_weights=need_weights)
 
         # Poject output
         self.to_out = nn.Sequential(nn.Linear(n_heads * d_v, d_model), nn.Dropout(proj_dropout))
@@ -451,15 +452,17 @@ class _MultiheadAttention(nn.Module):
 class _ScaledDotProductAttention(nn.Module):
     r"""Scaled Dot-Product Attention module (Attention is all you need by Vaswani et al., 2017) with optional residual attention from previous layer
     (Realformer: Transformer likes residual attention by He et al, 2020) and locality self sttention (Vision Transformer for Small-Size Datasets
-    by Lee et al, 2021)"""
+    by Lee et al, 2021). Without residual attention and if the weights are not needed the computation is done by the attention backend"""
 
-    def __init__(self, d_model, n_heads, attn_dropout=0., res_attention=False, lsa=False):
+    def __init__(self, d_model, n_heads, attn_dropout=0., res_attention=False, lsa=False, need_weights=True):
         super().__init__()
         self.attn_dropout = nn.Dropout(attn_dropout)
         self.res_attention = res_attention
         head_dim = d_model // n_heads
         self.scale = nn.Parameter(torch.tensor(head_dim ** -0.5), requires_grad=lsa)
         self.lsa = lsa
+        self.need_weights = need_weights
+        self.attention_backend = 'sdpa'
 
     def forward(self, q:Tensor, k:Tensor, v:Tensor, prev:Optional[Tensor]=None, key_padding_mask:Optional[Tensor]=None, attn_mask:Optional[Tensor]=None):
         '''
@@ -475,6 +478,17 @@ class _ScaledDotProductAttention(nn.Module):
             attn   : [bs x n_heads x q_len x seq_len]
             scores : [bs x n_heads x q_len x seq_len]
         '''
+        if not self.res_attention:
+            if key_padding_mask is not None:
+                key_padding_mask = key_padding_mask.unsqueeze(1).unsqueeze(2)
+                if attn_mask is None:
+                    attn_mask = key_padding_mask
+                elif attn_mask.dtype == torch.bool:
+                    attn_mask = attn_mask | key_padding_mask
+                else:
+                    attn_mask = attn_mask.masked_fill(key_padding_mask, -np.inf)
+            return scaled_dot_product_attention(q, k.transpose(-2, -1), v, attn_mask=attn_mask, dropout_p=self.attn_dropout.p, training=self.training,
+                                                scale=self.scale, backend=self.attention_backend, need_weights=self.need_weights)
 
         # Scaled MatMul (q, k) - similarity scores for all pairs of positions in an input sequence
         attn_scores = torch.matmul(q, k) * self.scale      # attn_scores : [bs x n_heads x max_q_len x q_len]
@@ -2,7 +2,8 @@ import torch
 import torch.nn.init as init
 from torch import nn
 import numpy as np
-from numba import jit
+from numba import jit, prange
+from functools import lru_cache
 from torch.autograd import Function
 
 
@@ -22,6 +23,9 @@ class SinkhornDistance():
     Given two empirical measures each with :math:`P_1` locations
     :math:`x\in\mathbb{R}^{D_1}` and :math:`P_2` locations :math:`y\in\mathbb{R}^{D_2}`,
     outputs an approximation of the regularized OT cost for point clouds.
+    The object can be reused for all the training steps: the log marginals are computed once for each number of points (e.g. future_steps),
+    the kernel -C/eps is computed once and on the gpu the stopping criterion is read from the device only every `check_every` iterations
+    (the iterations after the convergence do not update the potentials, the result is the same as checking at each iteration).
 
     Args:
         eps (float): regularization coefficient
@@ -30,55 +34,68 @@ class SinkhornDistance():
             'none' | 'mean' | 'sum'. 'none': no reduction will be applied,
             'mean': the sum of the output will be divided by the number of
             elements in the output, 'sum': the output will be summed. Default: 'none'
+        check_every (int, optional): number of iterations between two checks of the stopping criterion, not used on the CPU (checked at each iteration). Default: 10
 
     Shape:
-        - Input: :math:`(N, P_1, D_1)`, :math:`(N, P_2, D_2)`
+        - Input: :math:`(N, P_1, D_1)`, :math:`(N, P_2, D_2)` (or with more batch dimensions, e.g. :math:`(N, C, P_1, 1)` for one measure for each channel)
         - Output: :math:`(N)` or :math:`()`, depending on `reduction`
     """
-    def __init__(self, eps, max_iter, reduction='none'):
+    ## the exponential of very negative numbers (underflow) is much slower on the CPU
+    log_floor = -80.0
+
+    def __init__(self, eps, max_iter, reduction='none', check_every=10):
         super(SinkhornDistance, self).__init__()
         self.eps = eps
         self.max_iter = max_iter
         self.reduction = reduction
+        self.check_every = check_every
+        self.log_marginals = {}
+
+    def _log_marginal(self, points, device, dtype):
+        "log of the uniform marginal over `points` locations"
+        key = (points, device, dtype)
+        if key not in self.log_marginals:
+            self.log_marginals[key] = torch.log(torch.full((points,), 1.0 / points, dtype=dtype, device=device) + 1e-8)
+        return self.log_marginals[key]
 
     def compute(self, x, y):
         # The Sinkhorn algorithm takes as input three variables :
-        C = self._cost_matrix(x, y).to(x.device)  # Wasserstein cost function
-        x_points = x.shape[-2]
-        y_points = y.shape[-2]
-        if x.dim() == 2:
-            batch_size = 1
-        else:
-            batch_size = x.shape[0]
-
+        C = self._cost_matrix(x, y)  # Wasserstein cost function
         # both marginals are fixed with equal weights
-        mu = torch.empty(batch_size, x_points, dtype=torch.float,
-                         requires_grad=False).fill_(1.0 / x_points).squeeze().to(x.device)
-        nu = torch.empty(batch_size, y_points, dtype=torch.float,
-                         requires_grad=False).fill_(1.0 / y_points).squeeze().to(x.device)
-
-        u = torch.zeros_like(mu).to(x.device)
-        v = torch.zeros_like(nu).to(x.device)
-        # To check if algorithm terminates because of threshold
-        # or max iterations reached
-        actual_nits = 0
+        log_mu = self._log_marginal(x.shape[-2], C.device, C.dtype)
+        log_nu = self._log_marginal(y.shape[-2], C.device, C.dtype)
+
+        u = torch.zeros(C.shape[:-1], dtype=C.dtype, device=C.device)
+        v = torch.zeros(C.shape[:-2] + C.shape[-1:], dtype=C.dtype, device=C.device)
+        ## log kernel, the potentials are added to it in each iteration: eps*(log(mu)-logsumexp(M)) + u = eps*(log(mu)-logsumexp(-C/eps+v/eps))
+        K = -C / self.eps
         # Stopping criterion
         thresh = 1e-1
+        ## on the CPU the criterion can be read at each iteration without synchronizations
+        check_every = 1 if C.device.type == 'cpu' else self.check_every
+        ## False after the convergence, it stays on the device
+        running = torch.ones((), dtype=torch.bool, device=C.device)
 
         # Sinkhorn iterations
         for i in range(self.max_iter):
             u1 = u  # useful to check the update
-            u = self.eps * (torch.log(mu+1e-8) - torch.logsumexp(self.M(C, u, v), dim=-1)) + u
-            v = self.eps * (torch.log(nu+1e-8) - torch.logsumexp(self.M(C, u, v).transpose(-2, -1), dim=-1)) + v
-            err = (u - u1).abs().sum(-1).mean()
-
-            actual_nits += 1
-            if err.item() < thresh:
+            u_new = self.eps * (log_mu - self._logsumexp(K + v.unsqueeze(-2) / self.eps, dim=-1))
+            v_new = self.eps * (log_nu - self._logsumexp(K + u_new.unsqueeze(-1) / self.eps, dim=-2))
+            err = (u_new - u1).abs().sum(-1).mean()
+            if check_every == 1:
+                u, v = u_new, v_new
+                if err.item() < thresh:
+                    break
+                continue
+            u = torch.where(running, u_new, u)
+            v = torch.where(running, v_new, v)
+            running = running & (err >= thresh)
+            if (i + 1) % check_every == 0 and not running:
                 break
 
         U, V = u, v
         # Transport plan pi = diag(a)*K*diag(b)
-        pi = torch.exp(self.M(C, U, V))
+        pi = torch.exp(self.M(C, U, V).clamp(min=self.log_floor))
         # Sinkhorn distance
         cost = torch.sum(pi * C, dim=(-2, -1))
 
@@ -94,6 +111,12 @@ class SinkhornDistance():
         "$M_{ij} = (-c_{ij} + u_i + v_j) / \epsilon$"
         return (-C + u.unsqueeze(-1) + v.unsqueeze(-2)) / self.eps
 
+    @classmethod
+    def _logsumexp(cls, A, dim):
+        "logsumexp with the terms smaller than exp(log_floor) times the largest one set to exp(log_floor), they do not change the sum"
+        m = A.detach().amax(dim, keepdim=True)
+        return torch.log(torch.sum(torch.exp((A - m).clamp(min=cls.log_floor)), dim)) + m.squeeze(dim)
+
     @staticmethod
     def _cost_matrix(x, y, p=2):
         "Returns the matrix of $|x_i-y_j|^p$."
@@ -351,39 +374,98 @@ def compute_softdtw_backward(D_, R, gamma):
   return E[1:N + 1, 1:M + 1]
  
 
+@jit(nopython = True, parallel = True, cache = True)
+def compute_softdtw_batch(D, gamma):
+  R = np.zeros((D.shape[0], D.shape[1] + 2, D.shape[2] + 2))
+  for k in prange(D.shape[0]):
+    R[k] = compute_softdtw(D[k], gamma)
+  return R
+
+@jit(nopython = True, parallel = True, cache = True)
+def compute_softdtw_backward_batch(D, R, gamma):
+  E = np.zeros(D.shape)
+  for k in prange(D.shape[0]):
+    E[k] = compute_softdtw_backward(D[k], R[k].copy(), gamma)
+  return E
+
+
+@lru_cache(maxsize=None)
+def antidiagonals(N, M, device):
+    """Cells of the N x M dynamic programming grid grouped by anti-diagonal (i+j constant, 1-based indexes as in the numba kernels).
+    The cells of an anti-diagonal depend only on the previous ones, so each of them is updated in parallel for all the samples of the batch
+
+    Args:
+        N (int): number of rows
+        M (int): number of columns
+        device (torch.device): device of the indexes
+
+    Returns:
+        list: tuples (i,j) of index tensors, one for each anti-diagonal from the top-left corner
+    """
+    idx = torch.arange(1, N + 1, device=device)
+    return [(idx[max(1, d - M) - 1:min(N, d - 1)], d - idx[max(1, d - M) - 1:min(N, d - 1)]) for d in range(2, N + M + 1)]
+
+def wavefront_dtype(device):
+    ##the numba kernels work in double precision, mps does not support it
+    return torch.float32 if device.type == 'mps' else torch.float64
+
+def compute_softdtw_wavefront(D, gamma):
+    """Same as `compute_softdtw` for a batch of cost matrices on the device of D (BxNxM)"""
+    K, N, M = D.shape
+    D = D.to(wavefront_dtype(D.device))
+    R = torch.full((K, N + 2, M + 2), 1e8, dtype=D.dtype, device=D.device)
+    R[:, 0, 0] = 0
+    for i, j in antidiagonals(N, M, D.device):
+        r = torch.stack([R[:, i - 1, j - 1], R[:, i - 1, j], R[:, i, j - 1]], -1)
+        R[:, i, j] = D[:, i - 1, j - 1] - gamma * torch.logsumexp(-r / gamma, -1)
+    return R
+
+def compute_softdtw_backward_wavefront(D_, R, gamma):
+    """Same as `compute_softdtw_backward` for a batch of cost matrices on the device of D_ (BxNxM)"""
+    K, N, M = D_.shape
+    dtype = wavefront_dtype(D_.device)
+    D = torch.zeros((K, N + 2, M + 2), dtype=dtype, device=D_.device)
+    D[:, 1:N + 1, 1:M + 1] = D_
+    R = R.to(dtype).clone()
+    R[:, :, -1] = -1e8
+    R[:, -1, :] = -1e8
+    R[:, -1, -1] = R[:, -2, -2]
+    E = torch.zeros_like(D)
+    E[:, -1, -1] = 1
+    for i, j in reversed(antidiagonals(N, M, D.device)):
+        a = torch.exp((R[:, i + 1, j] - R[:, i, j] - D[:, i + 1, j]) / gamma)
+        b = torch.exp((R[:, i, j + 1] - R[:, i, j] - D[:, i, j + 1]) / gamma)
+        c = torch.exp((R[:, i + 1, j + 1] - R[:, i, j] - D[:, i + 1, j + 1]) / gamma)
+        E[:, i, j] = E[:, i + 1, j] * a + E[:, i, j + 1] * b + E[:, i + 1, j + 1] * c
+    return E[:, 1:N + 1, 1:M + 1]
+
+
 class SoftDTWBatch(Function):
+    """Soft-DTW averaged over the batch. D has shape [batch_size, ..., N, M]: the additional dimensions (e.g. the channels) are summed.
+    On the CPU the samples are processed in parallel by the numba kernels, on the other devices with an anti-diagonal wavefront in torch.
+    """
     @staticmethod
-    def forward(ctx, D, gamma = 1.0): # D.shape: [batch_size, N , N]
-        dev = D.device
-        batch_size,N,N = D.shape
-        gamma = torch.FloatTensor([gamma]).to(dev)
-        D_ = D.detach().cpu().numpy()
-        g_ = gamma.item()
-
-        total_loss = 0
-        R = torch.zeros((batch_size, N+2 ,N+2)).to(dev)   
-        for k in range(0, batch_size): # loop over all D in the batch    
-            Rk = torch.FloatTensor(compute_softdtw(D_[k,:,:], g_)).to(dev)
-            R[k:k+1,:,:] = Rk
-            total_loss = total_loss + Rk[-2,-2]
-        ctx.save_for_backward(D, R, gamma)
-        return total_loss / batch_size
-  
+    def forward(ctx, D, gamma = 1.0): # D.shape: [batch_size, ..., N , M]
+        batch_size = D.shape[0]
+        D_ = D.detach().reshape(-1, D.shape[-2], D.shape[-1])
+        if D.device.type == 'cpu':
+            R = torch.from_numpy(compute_softdtw_batch(D_.numpy(), gamma))
+        else:
+            R = compute_softdtw_wavefront(D_, gamma)
+        R = R.to(D.dtype)
+        ctx.gamma = gamma
+        ctx.save_for_backward(D, R)
+        return R[:, -2, -2].sum() / batch_size
+
     @staticmethod
     def backward(ctx, grad_output):
-        dev = grad_output.device
-        D, R, gamma = ctx.saved_tensors
-        batch_size,N,N = D.shape
-        D_ = D.detach().cpu().numpy()
-        R_ = R.detach().cpu().numpy()
-        g_ = gamma.item()
-
-        E = torch.zeros((batch_size, N ,N)).to(dev) 
-        for k in range(batch_size):         
-            Ek = torch.FloatTensor(compute_softdtw_backward(D_[k,:,:], R_[k,:,:], g_)).to(dev)
-            E[k:k+1,:,:] = Ek
-
-        return grad_output * E, None
+        D, R = ctx.saved_tensors
+        D_ = D.detach().reshape(-1, D.shape[-2], D.shape[-1])
+        if D.device.type == 'cpu':
+            E = torch.from_numpy(compute_softdtw_backward_batch(D_.numpy(), R.numpy(), ctx.gamma))
+        else:
+            E = compute_softdtw_backward_wavefront(D_, R, ctx.gamma)
+        return grad_output * E.to(D.dtype).view(D.shape), None
 
 
 
@@ -478,41 +560,103 @@ def dtw_hessian_prod(theta, Z, Q, E, gamma):
     return V_dot[m, n], E_dot[1:m + 1, 1:n + 1]
 
 
+@jit(nopython = True, parallel = True, cache = True)
+def dtw_grad_batch(theta, gamma):
+    K, m, n = theta.shape
+    grad = np.zeros((K, m, n))
+    Q = np.zeros((K, m + 2, n + 2, 3))
+    E = np.zeros((K, m + 2, n + 2))
+    for k in prange(K):
+        _, grad_k, Q_k, E_k = dtw_grad(theta[k], gamma)
+        grad[k] = grad_k
+        Q[k] = Q_k
+        E[k] = E_k
+    return grad, Q, E
+
+
+@jit(nopython = True, parallel = True, cache = True)
+def dtw_hessian_prod_batch(theta, Z, Q, E, gamma):
+    hessian = np.zeros(Z.shape)
+    for k in prange(Z.shape[0]):
+        _, hessian_k = dtw_hessian_prod(theta[k], Z[k], Q[k], E[k], gamma)
+        hessian[k] = hessian_k
+    return hessian
+
+
+def dtw_grad_wavefront(theta, gamma):
+    """Same as `dtw_grad` for a batch of cost matrices on the device of theta (BxMxN), the value of the soft-DTW is not returned"""
+    K, m, n = theta.shape
+    theta = theta.to(wavefront_dtype(theta.device))
+    V = torch.zeros((K, m + 1, n + 1), dtype=theta.dtype, device=theta.device)
+    V[:, :, 0] = 1e10
+    V[:, 0, :] = 1e10
+    V[:, 0, 0] = 0
+    Q = torch.zeros((K, m + 2, n + 2, 3), dtype=theta.dtype, device=theta.device)
+    diagonals = antidiagonals(m, n, theta.device)
+    for i, j in diagonals:
+        v = -torch.stack([V[:, i, j - 1], V[:, i - 1, j - 1], V[:, i - 1, j]], -1) / gamma
+        Q[:, i, j] = torch.softmax(v, -1)
+        V[:, i, j] = theta[:, i - 1, j - 1] - gamma * torch.logsumexp(v, -1)
+
+    E = torch.zeros((K, m + 2, n + 2), dtype=theta.dtype, device=theta.device)
+    E[:, m + 1, n + 1] = 1
+    Q[:, m + 1, n + 1] = 1
+    for i, j in reversed(diagonals):
+        E[:, i, j] = Q[:, i, j + 1, 0] * E[:, i, j + 1] + \
+                     Q[:, i + 1, j + 1, 1] * E[:, i + 1, j + 1] + \
+                     Q[:, i + 1, j, 2] * E[:, i + 1, j]
+    return E[:, 1:m + 1, 1:n + 1], Q, E
+
+
+def dtw_hessian_prod_wavefront(Z, Q, E, gamma):
+    """Same as `dtw_hessian_prod` for a batch of directions on the device of Z (BxMxN)"""
+    K, m, n = Z.shape
+    dtype = wavefront_dtype(Z.device)
+    Z, Q, E = Z.to(dtype), Q.to(dtype), E.to(dtype)
+    V_dot = torch.zeros((K, m + 1, n + 1), dtype=dtype, device=Z.device)
+    Q_dot = torch.zeros((K, m + 2, n + 2, 3), dtype=dtype, device=Z.device)
+    diagonals = antidiagonals(m, n, Z.device)
+    for i, j in diagonals:
+        q = Q[:, i, j]
+        qv = q * torch.stack([V_dot[:, i, j - 1], V_dot[:, i - 1, j - 1], V_dot[:, i - 1, j]], -1)
+        V_dot[:, i, j] = Z[:, i - 1, j - 1] + qv.sum(-1)
+        Q_dot[:, i, j] = -(qv - q * qv.sum(-1, keepdim=True)) / gamma
+
+    E_dot = torch.zeros((K, m + 2, n + 2), dtype=dtype, device=Z.device)
+    for i, j in reversed(diagonals):
+        E_dot[:, i, j] = Q_dot[:, i, j + 1, 0] * E[:, i, j + 1] + \
+                         Q[:, i, j + 1, 0] * E_dot[:, i, j + 1] + \
+                         Q_dot[:, i + 1, j + 1, 1] * E[:, i + 1, j + 1] + \
+                         Q[:, i + 1, j + 1, 1] * E_dot[:, i + 1, j + 1] + \
+                         Q_dot[:, i + 1, j, 2] * E[:, i + 1, j] + \
+                         Q[:, i + 1, j, 2] * E_dot[:, i + 1, j]
+    return E_dot[:, 1:m + 1, 1:n + 1]
+
+
 class PathDTWBatch(Function):
+    """Expected DTW alignment averaged over the batch. D has shape [batch_size, ..., N, M] and the output [..., N, M] (e.g. one path for each channel).
+    On the CPU the samples are processed in parallel by the numba kernels, on the other devices with an anti-diagonal wavefront in torch.
+    """
     @staticmethod
-    def forward(ctx, D, gamma): # D.shape: [batch_size, N , N]
-        batch_size,N,N = D.shape
-        device = D.device
-        D_cpu = D.detach().cpu().numpy()
-        gamma_gpu = torch.FloatTensor([gamma]).to(device)
-        
-        grad_gpu = torch.zeros((batch_size, N ,N)).to(device)
-        Q_gpu = torch.zeros((batch_size, N+2 ,N+2,3)).to(device)
-        E_gpu = torch.zeros((batch_size, N+2 ,N+2)).to(device)  
-        
-        for k in range(0,batch_size): # loop over all D in the batch    
-            _, grad_cpu_k, Q_cpu_k, E_cpu_k = dtw_grad(D_cpu[k,:,:], gamma)     
-            grad_gpu[k,:,:] = torch.FloatTensor(grad_cpu_k).to(device)
-            Q_gpu[k,:,:,:] = torch.FloatTensor(Q_cpu_k).to(device)
-            E_gpu[k,:,:] = torch.FloatTensor(E_cpu_k).to(device)
-        ctx.save_for_backward(grad_gpu,D, Q_gpu ,E_gpu, gamma_gpu) 
-        return torch.mean(grad_gpu, dim=0) 
-    
+    def forward(ctx, D, gamma): # D.shape: [batch_size, ..., N , M]
+        D_ = D.detach().reshape(-1, D.shape[-2], D.shape[-1])
+        if D.device.type == 'cpu':
+            grad, Q, E = [torch.from_numpy(x) for x in dtw_grad_batch(D_.numpy(), gamma)]
+        else:
+            grad, Q, E = dtw_grad_wavefront(D_, gamma)
+        grad, Q, E = grad.to(D.dtype), Q.to(D.dtype), E.to(D.dtype)
+        ctx.gamma = gamma
+        ctx.save_for_backward(D, Q, E)
+        return torch.mean(grad.view(D.shape), dim=0)
+
     @staticmethod
     def backward(ctx, grad_output):
-        device = grad_output.device
-        grad_gpu, D_gpu, Q_gpu, E_gpu, gamma = ctx.saved_tensors
-        D_cpu = D_gpu.detach().cpu().numpy()
-        Q_cpu = Q_gpu.detach().cpu().numpy()
-        E_cpu = E_gpu.detach().cpu().numpy()
-        gamma = gamma.detach().cpu().numpy()[0]
-        Z = grad_output.detach().cpu().numpy()
-        
-        batch_size,N,N = D_cpu.shape
-        Hessian = torch.zeros((batch_size, N ,N)).to(device)
-        for k in range(0,batch_size):
-            _, hess_k = dtw_hessian_prod(D_cpu[k,:,:], Z, Q_cpu[k,:,:,:], E_cpu[k,:,:], gamma)
-            Hessian[k:k+1,:,:] = torch.FloatTensor(hess_k).to(device)
-
-        return  Hessian, None
-    
+        D, Q, E = ctx.saved_tensors
+        D_ = D.detach().reshape(-1, D.shape[-2], D.shape[-1])
+        ##the same direction for all the samples of the batch
+        Z = grad_output.detach().to(D.dtype).expand(D.shape).reshape(D_.shape)
+        if D.device.type == 'cpu':
+            Hessian = torch.from_numpy(dtw_hessian_prod_batch(D_.numpy(), Z.contiguous().numpy(), Q.numpy(), E.numpy(), ctx.gamma))
+        else:
+            Hessian = dtw_hessian_prod_wavefront(Z, Q, E, ctx.gamma)
+        return Hessian.to(D.dtype).view(D.shape), None
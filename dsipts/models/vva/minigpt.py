@@ -4,6 +4,7 @@ import math
 import torch
 import torch.nn as nn
 from torch.nn import functional as F
+from ..attention import scaled_dot_product_attention
 
 
 # -----------------------------------------------------------------------------
@@ -33,11 +34,12 @@ class CausalSelfAttention(nn.Module):
         # regularization
         self.attn_dropout = nn.Dropout(attn_pdrop)
         self.resid_dropout = nn.Dropout(resid_pdrop)
-        # causal mask to ensure that attention is only applied to the left in the input sequence
+        # causal mask to ensure that attention is only applied to the left in the input sequence (now applied by the attention backend, kept for the saved checkpoints)
         self.register_buffer("bias", torch.tril(torch.ones(block_size, block_size))
                                      .view(1, 1, block_size, block_size))
         self.n_head = n_head
         self.n_embd = n_embd
+        self.attention_backend = 'sdpa'
 
     def forward(self, x):
         B, T, C = x.size() # batch size, sequence length, embedding dimensionality (n_embd)
@@ -49,11 +51,8 @@ class CausalSelfAttention(nn.Module):
         v = v.view(B, T, self.n_head, C // self.n_head).transpose(1, 2) # (B, nh, T, hs)
 
         # causal self-attention; Self-attend: (B, nh, T, hs) x (B, nh, hs, T) -> (B, nh, T, T)
-        att = (q @ k.transpose(-2, -1)) * (1.0 / math.sqrt(k.size(-1)))
-        att = att.masked_fill(self.bias[:,:,:T,:T] == 0, float('-inf'))
-        att = F.softmax(att, dim=-1)
-        att = self.attn_dropout(att)
-        y = att @ v # (B, nh, T, T) x (B, nh, T, hs) -> (B, nh, T, hs)
+        y, _ = scaled_dot_product_attention(q, k, v, is_causal=True, dropout_p=self.attn_dropout.p, training=self.training,
+                                            backend=self.attention_backend) # (B, nh, T, T) x (B, nh, T, hs) -> (B, nh, T, hs)
         y = y.transpose(1, 2).contiguous().view(B, T, C) # re-assemble all head outputs side by side
 
         # output projection
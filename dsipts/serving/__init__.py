@@ -0,0 +1,3 @@
+from .server import ForecastServer
+from .http_server import serve_http, request_forecast
+from .registry import ModelRegistry
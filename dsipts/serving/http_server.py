@@ -0,0 +1,109 @@
+import json
+import threading
+import urllib.request
+import numpy as np
+import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Union
+from .server import ForecastServer
+
+
+def _to_frame(records:Union[list,dict,None],datetime:bool)->Union[pd.DataFrame,None]:
+    if records is None:
+        return None
+    res = pd.DataFrame(records)
+    if datetime:
+        res['time'] = pd.to_datetime(res['time'])
+    return res
+
+
+def _handler(server:ForecastServer):
+
+    datetime = isinstance(server.ts.freq,(pd.Timedelta,np.timedelta64))
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self,code:int,body:str)->None:
+            body = body.encode()
+            self.send_response(code)
+            self.send_header('Content-Type','application/json')
+            self.send_header('Content-Length',str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path=='/stats':
+                self._send(200,json.dumps(server.stats(),default=str))
+            elif self.path=='/health':
+                self._send(200,json.dumps({'status':'ok'}))
+            else:
+                self._send(404,json.dumps({'error':f'unknown path {self.path}'}))
+
+        def do_POST(self):
+            if self.path!='/forecast':
+                self._send(404,json.dumps({'error':f'unknown path {self.path}'}))
+                return None
+            try:
+                message = json.loads(self.rfile.read(int(self.headers.get('Content-Length',0))))
+                res = server.forecast(_to_frame(message['history'],datetime),_to_frame(message.get('future'),datetime))
+                self._send(200,'{"predictions":'+res.to_json(orient='records',date_format='iso')+'}')
+            except (ValueError,KeyError) as e:
+                self._send(400,json.dumps({'error':str(e)}))
+            except Exception as e:
+                self._send(500,json.dumps({'error':str(e)}))
+
+        def log_message(self,*args):
+            ##one line per request is too much for a low latency service
+            return None
+
+    return Handler
+
+
+def serve_http(server:ForecastServer,host:str='127.0.0.1',port:int=8000)->ThreadingHTTPServer:
+    """Local HTTP front end of a `ForecastServer` (standard library only), each connection is handled in a thread so the concurrent requests are batched by the server.
+    Endpoints: `POST /forecast` with a json `{"history":[...records...],"future":[...records...]}` (future is optional), `GET /stats` and `GET /health`
+
+    Args:
+        server (ForecastServer): the forecasting server
+        host (str, optional): host. Defaults to '127.0.0.1'.
+        port (int, optional): port, 0 for a free one. Defaults to 8000.
+
+    Returns:
+        ThreadingHTTPServer: the running HTTP server (call `shutdown` to stop it), the address is in `server_address`
+    """
+    httpd = ThreadingHTTPServer((host,port),_handler(server))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever,daemon=True).start()
+    return httpd
+
+
+def request_forecast(url:str,history:pd.DataFrame,future:Union[pd.DataFrame,None]=None,timeout:float=10)->pd.DataFrame:
+    """Client of `serve_http`
+
+    Args:
+        url (str): address of the server, for example http://127.0.0.1:8000
+        history (pd.DataFrame): see `TimeSeries.prepare_forecast`
+        future (Union[pd.DataFrame,None], optional): see `TimeSeries.prepare_forecast`. Defaults to None.
+        timeout (float, optional): seconds to wait. Defaults to 10.
+
+    Returns:
+        pd.DataFrame: the predictions
+    """
+    message = '{"history":'+history.to_json(orient='records',date_format='iso')
+    if future is not None:
+        message += ',"future":'+future.to_json(orient='records',date_format='iso')
+    message += '}'
+    request = urllib.request.Request(f'{url}/forecast',data=message.encode(),headers={'Content-Type':'application/json'})
+    with urllib.request.urlopen(request,timeout=timeout) as f:
+        res = pd.DataFrame(json.loads(f.read())['predictions'])
+    ##same types returned by `ForecastServer.forecast`: float32 predictions and the times (sent as iso strings) parsed back
+    for c in res.columns:
+        if c not in history.columns and res[c].dtype==np.float64:
+            res[c] = res[c].astype(np.float32)
+    if pd.api.types.is_datetime64_any_dtype(history['time']) and res.shape[0]>0:
+        tz = history['time'].dt.tz
+        for c in ['time','prediction_time']:
+            res[c] = pd.to_datetime(res[c],utc=tz is not None)
+            if tz is not None:
+                res[c] = res[c].dt.tz_convert(tz)
+    return res
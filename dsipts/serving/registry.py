@@ -0,0 +1,218 @@
+import hashlib
+import pickle
+import threading
+import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Union
+from ..data_structure.data_structure import TimeSeries
+from ..data_structure.utils import beauty_string
+from ..models.base import Base
+from .server import ForecastServer
+
+
+class ModelRegistry():
+
+    ##attributes that are not modified after the training, models trained on the same data keep a single copy
+    shared_attributes = ['scaler_num','scaler_cat','config','split_params','past_variables','future_variables','target_variables','num_var','cat_var']
+
+    def __init__(self,max_models:Union[int,None]=8,max_memory_mb:Union[float,None]=None,preload:Union[List[str],None]=None,num_workers:int=4,drop_dataset:bool=True,server_params:Union[dict,None]=None,verbose:bool=False):
+        """Collection of saved models loaded on first use. The loaded models are kept in a LRU cache: when there are more than `max_models` models (or the estimated memory is more than `max_memory_mb`)
+        the least recently used one is evicted and it will be loaded again at the next request. The scalers and the metadata (configuration, split parameters and variables) equal to the ones of a loaded model are shared
+
+        Args:
+            max_models (Union[int,None], optional): maximum number of loaded models, None for no limit. Defaults to 8.
+            max_memory_mb (Union[float,None], optional): maximum memory of the loaded models (weights, buffers and dataset), None for no limit. Defaults to None.
+            preload (Union[List[str],None], optional): models to load in background as soon as they are registered. Defaults to None.
+            num_workers (int, optional): threads used for loading the models. Defaults to 4.
+            drop_dataset (bool, optional): remove the dataset from the loaded timeseries, it is not used for forecasting (see `TimeSeries.prepare_forecast`). Defaults to True.
+            server_params (Union[dict,None], optional): parameters of the `ForecastServer` of each model used by `forecast`. Defaults to None.
+            verbose (bool, optional): verbosity of the loaded timeseries. Defaults to False.
+        """
+        self.max_models = max_models
+        self.max_memory_mb = max_memory_mb
+        self.to_preload = set(preload) if preload is not None else set()
+        self.drop_dataset = drop_dataset
+        self.server_params = server_params if server_params is not None else {}
+        self.verbose = verbose
+        self.specs = {}
+        self.loaded = OrderedDict()
+        self.loading = {}
+        self.servers = {}
+        self.shared = {}
+        self.stats_ = {'hits':0,'misses':0,'evictions':0}
+        self.lock = threading.RLock()
+        self.executor = ThreadPoolExecutor(max_workers=num_workers,thread_name_prefix='dsipts-registry')
+
+    def register(self,name:str,model:Base,filename:str,**kwargs)->None:
+        """Register a saved model, nothing is loaded until it is requested (or preloaded)
+
+        Args:
+            name (str): name of the model in the registry
+            model (Base): class of the model
+            filename (str): filename of the saved timeseries (see `TimeSeries.save`)
+            kwargs: other parameters of `TimeSeries.load` (load_last, dirpath, weight_path)
+        """
+        with self.lock:
+            self.specs[name] = (model,filename,kwargs)
+        if name in self.to_preload:
+            self.preload([name])
+
+    def preload(self,names:Union[List[str],None]=None)->List[Future]:
+        """Load some models in the background threads
+
+        Args:
+            names (Union[List[str],None], optional): names of the models, None for all the registered models. Defaults to None.
+
+        Returns:
+            List[Future]: one future for each model, the result is the loaded timeseries
+        """
+        names = list(self.specs.keys()) if names is None else names
+        return [self._future(name) for name in names]
+
+    def get(self,name:str)->TimeSeries:
+        """Loaded timeseries of a registered model
+
+        Args:
+            name (str): name of the model
+
+        Returns:
+            TimeSeries: the timeseries with the model, do not modify the shared scalers and metadata (see `shared_attributes`)
+        """
+        return self._future(name,count=True).result()
+
+    def forecast(self,name:str,history:pd.DataFrame,future:Union[pd.DataFrame,None]=None,timeout:Union[float,None]=None)->pd.DataFrame:
+        """Forecast with a registered model, the concurrent calls for the same model are batched (see `ForecastServer`)
+
+        Args:
+            name (str): name of the model
+            history (pd.DataFrame): see `TimeSeries.prepare_forecast`
+            future (Union[pd.DataFrame,None], optional): see `TimeSeries.prepare_forecast`. Defaults to None.
+            timeout (Union[float,None], optional): seconds to wait. Defaults to None.
+
+        Returns:
+            pd.DataFrame: see `ForecastServer.result`
+        """
+        while True:
+            ts = self.get(name)
+            with self.lock:
+                if self.loaded.get(name) is not ts:
+                    ##evicted in the meantime
+                    continue
+                if name not in self.servers:
+                    self.servers[name] = ForecastServer(ts,**self.server_params)
+                server = self.servers[name]
+            try:
+                return server.forecast(history,future,timeout)
+            except RuntimeError:
+                if server.running:
+                    raise
+
+    def _future(self,name:str,count:bool=False)->Future:
+        with self.lock:
+            if name not in self.specs:
+                raise KeyError(f'Model {name} not registered')
+            if name in self.loaded:
+                self.loaded.move_to_end(name)
+                if count:
+                    self.stats_['hits']+=1
+                future = Future()
+                future.set_result(self.loaded[name])
+                return future
+            if count:
+                self.stats_['misses']+=1
+            if name not in self.loading:
+                self.loading[name] = self.executor.submit(self._load,name)
+            return self.loading[name]
+
+    def _load(self,name:str)->TimeSeries:
+        model,filename,kwargs = self.specs[name]
+        ts = TimeSeries(name)
+        ts.set_verbose(self.verbose)
+        try:
+            ts.load(model,filename,**kwargs)
+            ts.model.eval()
+            if self.drop_dataset:
+                ts.dataset = None
+            self._share(ts)
+        except Exception:
+            with self.lock:
+                self.loading.pop(name)
+            raise
+        with self.lock:
+            self.loading.pop(name)
+            self.loaded[name] = ts
+            evicted = self._evict()
+        ##the servers complete their pending requests outside the lock, the other models are not blocked
+        for server in evicted:
+            server.close()
+        beauty_string(f'Model {name} loaded','info',self.verbose)
+        return ts
+
+    def _share(self,ts:TimeSeries)->None:
+        for attribute in self.shared_attributes:
+            value = getattr(ts,attribute,None)
+            if value is None:
+                continue
+            key = (attribute,hashlib.sha1(pickle.dumps(value)).hexdigest())
+            with self.lock:
+                setattr(ts,attribute,self.shared.setdefault(key,value))
+
+    def _memory(self,ts:TimeSeries)->int:
+        size = sum([p.numel()*p.element_size() for p in ts.model.parameters()])+sum([b.numel()*b.element_size() for b in ts.model.buffers()])
+        ##a dataset not read yet (see `TimeSeries.load`) is not counted
+        if isinstance(ts.__dict__.get('dataset',None),pd.DataFrame):
+            size+=int(ts.dataset.memory_usage(index=True).sum())
+        return size
+
+    def memory_mb(self)->float:
+        """Estimated memory of the loaded models (the shared scalers and metadata are not counted)
+
+        Returns:
+            float: memory in MB
+        """
+        with self.lock:
+            return sum([self._memory(ts) for ts in self.loaded.values()])/1024**2
+
+    def _evict(self)->List[ForecastServer]:
+        ##the last loaded model is never evicted, the servers of the evicted models are returned and closed by the caller
+        servers = []
+        while len(self.loaded)>1:
+            too_many = self.max_models is not None and len(self.loaded)>self.max_models
+            too_large = self.max_memory_mb is not None and self.memory_mb()>self.max_memory_mb
+            if not (too_many or too_large):
+                break
+            name,_ = self.loaded.popitem(last=False)
+            self.stats_['evictions']+=1
+            if name in self.servers:
+                servers.append(self.servers.pop(name))
+            beauty_string(f'Model {name} evicted','info',self.verbose)
+        ##the objects not used by any loaded model are released
+        used = set([id(getattr(ts,a,None)) for ts in self.loaded.values() for a in self.shared_attributes])
+        self.shared = {k:v for k,v in self.shared.items() if id(v) in used}
+        return servers
+
+    def stats(self)->dict:
+        """Statistics of the registry
+
+        Returns:
+            dict: hits, misses and evictions of `get`, loaded models (from the least recently used) and their estimated memory in MB
+        """
+        with self.lock:
+            return {**self.stats_,'loaded':list(self.loaded.keys()),'memory_mb':self.memory_mb()}
+
+    def close(self)->None:
+        """Stop the loading threads and the forecast servers
+        """
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            servers,self.servers = list(self.servers.values()),{}
+        for server in servers:
+            server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+        return False
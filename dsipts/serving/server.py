@@ -0,0 +1,212 @@
+import time
+import queue
+import threading
+import numpy as np
+import pandas as pd
+import torch
+from collections import Counter, deque
+from typing import List, Union
+from ..data_structure.data_structure import TimeSeries
+from ..data_structure.utils import beauty_string
+
+
+class _Request():
+
+    def __init__(self,sample:dict,arrival:float):
+        self.sample = sample
+        self.arrival = arrival
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ForecastServer():
+
+    def __init__(self,ts:TimeSeries,max_batch_size:int=64,max_latency_ms:float=5.0,device:Union[str,None]=None,rescaling:bool=True,history_size:int=10000):
+        """In process forecasting service: the model is kept on the device and the concurrent requests are coalesced in a single batched forward.
+        The inputs are built in the thread of the caller (see `TimeSeries.prepare_forecast`), a background thread waits at most `max_latency_ms` after the first pending request (or until `max_batch_size` requests are pending) and runs the model
+
+        Args:
+            ts (TimeSeries): a trained (or loaded) timeseries with its model
+            max_batch_size (int, optional): maximum number of requests in a forward. Defaults to 64.
+            max_latency_ms (float, optional): maximum time a request waits for other requests. Defaults to 5.0.
+            device (Union[str,None], optional): device of the model, if None cuda if available. Defaults to None.
+            rescaling (bool, optional): return the predictions in the original scale. Defaults to True.
+            history_size (int, optional): number of latencies kept for the statistics. Defaults to 10000.
+        """
+        self.ts = ts
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms/1000
+        self.rescaling = rescaling
+        self.device = torch.device(device if device is not None else ("cuda:0" if torch.cuda.is_available() else "cpu"))
+        self.model = ts.model.to(self.device)
+        self.model.eval()
+        self.columns = [ts.num_var.index(c) for c in ts.target_variables]
+        idx_target = [ts.past_variables.index(c) for c in ts.target_variables]
+        idx_target_future = [ts.future_variables.index(c) for c in ts.target_variables if c in ts.future_variables]
+        self.indexes = {'idx_target':torch.tensor([idx_target],device=self.device)}
+        if len(idx_target_future)>0:
+            self.indexes['idx_target_future'] = torch.tensor([idx_target_future],device=self.device)
+        self.suffixes = ['_low','_median','_high'] if self.model.use_quantiles else ['_pred']
+        self.latencies = deque(maxlen=history_size)
+        self.batch_sizes = Counter()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.running = True
+        self.thread = threading.Thread(target=self._loop,daemon=True)
+        self.thread.start()
+        beauty_string(f'Forecast server started on {self.device}','info',ts.verbose)
+
+    def submit(self,history:pd.DataFrame,future:Union[pd.DataFrame,None]=None)->_Request:
+        """Prepare the input and queue the request without waiting
+
+        Args:
+            history (pd.DataFrame): see `TimeSeries.prepare_forecast`
+            future (Union[pd.DataFrame,None], optional): see `TimeSeries.prepare_forecast`. Defaults to None.
+
+        Returns:
+            _Request: the pending request, see `result`
+        """
+        if not self.running:
+            raise RuntimeError('The server is closed')
+        ##the latency budget and the statistics include the preparation of the input
+        arrival = time.perf_counter()
+        request = _Request(self.ts.prepare_forecast(history,future),arrival)
+        ##the check and the put are atomic with respect to `close`, so a queued request is always served
+        with self.lock:
+            if not self.running:
+                raise RuntimeError('The server is closed')
+            self.queue.put(request)
+        return request
+
+    def result(self,request:_Request,timeout:Union[float,None]=None)->pd.DataFrame:
+        """Wait for a request
+
+        Args:
+            request (_Request): a request returned by `submit`
+            timeout (Union[float,None], optional): seconds to wait. Defaults to None.
+
+        Returns:
+            pd.DataFrame: the predictions, one row per lag with the group (if any), lag, time, predictions and prediction_time
+        """
+        if not request.done.wait(timeout):
+            raise TimeoutError('The forecast is not ready')
+        if request.error is not None:
+            raise request.error
+        res = request.result
+        L = res.shape[0]
+        tot = {}
+        if self.ts.group is not None:
+            tot[self.ts.group] = np.repeat(request.sample['group'],L)
+        tot['lag'] = np.arange(1,L+1)
+        tot['time'] = request.sample['time']
+        for i,c in enumerate(self.ts.target_variables):
+            for j,suffix in enumerate(self.suffixes):
+                tot[c+suffix] = res[:,i,j]
+        tot = pd.DataFrame(tot)
+        tot['prediction_time'] = tot['time']-tot['lag']*self.ts.freq
+        return tot
+
+    def forecast(self,history:pd.DataFrame,future:Union[pd.DataFrame,None]=None,timeout:Union[float,None]=None)->pd.DataFrame:
+        """Forecast the next steps of a series, the call is batched with the concurrent ones
+
+        Args:
+            history (pd.DataFrame): see `TimeSeries.prepare_forecast`
+            future (Union[pd.DataFrame,None], optional): see `TimeSeries.prepare_forecast`. Defaults to None.
+            timeout (Union[float,None], optional): seconds to wait. Defaults to None.
+
+        Returns:
+            pd.DataFrame: see `result`
+        """
+        return self.result(self.submit(history,future),timeout)
+
+    def forecast_many(self,histories:List[pd.DataFrame],futures:Union[List[pd.DataFrame],None]=None)->List[pd.DataFrame]:
+        """Forecast several series, all the requests are queued before waiting
+
+        Args:
+            histories (List[pd.DataFrame]): the histories
+            futures (Union[List[pd.DataFrame],None], optional): the future known variables. Defaults to None.
+
+        Returns:
+            List[pd.DataFrame]: the predictions
+        """
+        requests = [self.submit(h,None if futures is None else futures[i]) for i,h in enumerate(histories)]
+        return [self.result(r) for r in requests]
+
+    def _next_batch(self)->List[_Request]:
+        try:
+            requests = [self.queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = requests[0].arrival+self.max_latency
+        while len(requests)<self.max_batch_size:
+            try:
+                requests.append(self.queue.get(timeout=max(deadline-time.perf_counter(),0)))
+            except queue.Empty:
+                break
+        return requests
+
+    def _run(self,requests:List[_Request])->None:
+        batch = {}
+        for k in requests[0].sample['batch']:
+            batch[k] = torch.from_numpy(np.concatenate([r.sample['batch'][k] for r in requests])).to(self.device)
+        batch.update(self.indexes)
+        with torch.inference_mode():
+            res = self.model.inference(batch)
+            if self.rescaling:
+                groups = np.array([r.sample['group'] for r in requests]) if self.ts.normalize_per_group else None
+                self.ts.scaler_num.inverse_transform_(res,groups,self.columns,axis=2)
+            res = res.cpu().numpy()
+        for i,r in enumerate(requests):
+            r.result = res[i]
+
+    def _serve_batch(self)->None:
+        requests = self._next_batch()
+        if len(requests)==0:
+            return None
+        try:
+            self._run(requests)
+        except Exception as e:
+            for r in requests:
+                r.error = e
+        now = time.perf_counter()
+        with self.lock:
+            self.batch_sizes[len(requests)]+=1
+            self.latencies.extend([now-r.arrival for r in requests])
+        for r in requests:
+            r.done.set()
+
+    def _loop(self)->None:
+        while self.running:
+            self._serve_batch()
+
+    def stats(self)->dict:
+        """Statistics of the last requests
+
+        Returns:
+            dict: number of requests and batches, p50 and p99 of the latency (in ms, from the call of `submit` to the end of the forward) and histogram of the batch sizes
+        """
+        with self.lock:
+            latencies = np.array(self.latencies)*1000
+            batch_sizes = dict(sorted(self.batch_sizes.items()))
+        return {'requests':sum([k*v for k,v in batch_sizes.items()]),
+                'batches':sum(batch_sizes.values()),
+                'p50_ms':float(np.percentile(latencies,50)) if len(latencies)>0 else np.nan,
+                'p99_ms':float(np.percentile(latencies,99)) if len(latencies)>0 else np.nan,
+                'batch_sizes':batch_sizes}
+
+    def close(self)->None:
+        """Stop the background thread, the pending requests are completed
+        """
+        with self.lock:
+            self.running = False
+        self.thread.join()
+        while not self.queue.empty():
+            self._serve_batch()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+        return False
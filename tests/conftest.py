@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dsipts import TimeSeries, LinearTS
+
+
+@pytest.fixture
+def small_frame():
+    ##hourly series with a numerical past variable and a categorical variable
+    n = 300
+    rng = np.random.default_rng(0)
+    t = pd.date_range('2020-01-01',periods=n,freq='h')
+    return pd.DataFrame({'time':t,'y':rng.normal(size=n),'x':rng.normal(size=n),'hh':t.hour%5})
+
+
+@pytest.fixture
+def split_params():
+    return dict(past_steps=12,future_steps=6,perc_train=0.6,perc_valid=0.2)
+
+
+@pytest.fixture
+def small_ts(small_frame):
+    ts = TimeSeries('small')
+    ts.set_verbose(False)
+    ts.load_signal(small_frame,past_variables=['x'],target_variables=['y'],cat_var=['hh'])
+    return ts
+
+
+@pytest.fixture
+def small_split(small_ts,split_params):
+    return small_ts.split_for_train(**split_params)
+
+
+@pytest.fixture
+def small_model(small_ts,split_params,tmp_path,monkeypatch):
+    ##the aim logger of `train_model` writes in the working directory
+    monkeypatch.chdir(tmp_path)
+    model_conf = dict(past_steps=split_params['past_steps'],future_steps=split_params['future_steps'],past_channels=len(small_ts.past_variables),future_channels=0,
+                      embs=[small_ts.dataset[c].nunique() for c in small_ts.cat_var],out_channels=1,cat_emb_dim=4,hidden_size=8,kernel_size=3,
+                      sum_emb=True,kind='linear',quantiles=[],activation='torch.nn.ReLU')
+    optim_config = {'lr':1e-3}
+    small_ts.set_model(LinearTS(**model_conf,optim_config=optim_config,scheduler_config=None,verbose=False),
+                       config=dict(model_configs=model_conf,optim_config=optim_config,scheduler_config=None))
+    return small_ts
+
+
+@pytest.fixture
+def trained_ts(small_model,split_params,tmp_path):
+    small_model.train_model(str(tmp_path/'model'),split_params,batch_size=64,num_workers=0,max_epochs=1,auto_lr_find=False)
+    return small_model
@@ -0,0 +1,33 @@
+import os
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from dsipts.data_structure.dataset_cache import DatasetCache
+
+
+def test_fingerprint_uses_fitted_state(small_frame):
+    a = StandardScaler().fit(np.arange(10.0).reshape(-1,1))
+    b = StandardScaler().fit(np.arange(10.0).reshape(-1,1)*2)
+    assert DatasetCache.fingerprint(small_frame,scalers=(a,)) != DatasetCache.fingerprint(small_frame,scalers=(b,))
+    assert DatasetCache.fingerprint(small_frame,scalers=(a,)) == DatasetCache.fingerprint(small_frame,scalers=(StandardScaler().fit(np.arange(10.0).reshape(-1,1)),))
+
+
+def test_changed_scaler_misses_cache(small_ts,split_params,tmp_path):
+    small_ts.set_dataset_cache(str(tmp_path))
+    small_ts.split_for_train(**split_params)
+    ##as after the training: the fitted scalers are part of the key
+    small_ts.is_trained = True
+    entries = len(os.listdir(tmp_path))
+    small_ts.split_for_train(**split_params)
+    assert len(os.listdir(tmp_path))==entries
+    small_ts.scaler_num.center = small_ts.scaler_num.center+1.0
+    small_ts.split_for_train(**split_params)
+    assert len(os.listdir(tmp_path))==entries+1
+
+
+def test_inference_after_training_hits_cache(small_model,split_params,tmp_path):
+    cache = tmp_path/'cache'
+    small_model.set_dataset_cache(str(cache))
+    small_model.train_model(str(tmp_path/'model'),split_params,batch_size=64,num_workers=0,max_epochs=1,auto_lr_find=False)
+    entries = sorted(os.listdir(cache))
+    small_model.inference_on_set(batch_size=64,num_workers=0,set='test')
+    assert sorted(os.listdir(cache))==entries
@@ -0,0 +1,26 @@
+import numpy as np
+import torch
+from dsipts.data_structure.utils import DeviceDataLoader
+
+
+def test_pinned_same_batches_as_device(small_split):
+    train = small_split[0]
+    ##it runs also without cuda: the buffers are in ordinary memory
+    for shuffle in [False,True]:
+        for drop_last in [False,True]:
+            batches = {}
+            for pinned in [False,True]:
+                loader = DeviceDataLoader(train,batch_size=32,shuffle=shuffle,drop_last=drop_last,pin_memory=pinned)
+                torch.manual_seed(0)
+                batches[pinned] = list(loader)
+                assert len(batches[pinned])==len(loader)
+            for a,b in zip(batches[False],batches[True]):
+                assert a.keys()==b.keys()
+                for k in a:
+                    assert torch.equal(a[k],b[k])
+    ##the batches do not share the reused buffers
+    loader = DeviceDataLoader(train,batch_size=32,pin_memory=True)
+    batches = list(loader)
+    expected = train.get_batch(np.arange(32))
+    assert all([torch.equal(batches[0][k],expected[k]) for k in expected])
+    assert all([batches[0][k].data_ptr()!=loader.buffers[0][k].data_ptr() for k in loader.tensors])
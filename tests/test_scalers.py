@@ -0,0 +1,40 @@
+import numpy as np
+import torch
+from sklearn.preprocessing import StandardScaler, MaxAbsScaler, PowerTransformer
+from dsipts.data_structure.scalers import NumericalScaler
+
+
+def make_data(n=5000):
+    rng = np.random.default_rng(0)
+    x = np.stack([1e8+rng.normal(size=n),rng.normal(size=n)*1e-3+5,rng.exponential(size=n)],1)
+    x[rng.choice(n,50),1] = np.nan
+    return x,rng.integers(0,3,n)
+
+
+def test_standard_scaler_same_as_sklearn():
+    x,groups = make_data()
+    scaler = NumericalScaler().fit(x,groups)
+    for k,g in enumerate(scaler.groups):
+        for j in range(x.shape[1]):
+            sk = StandardScaler().fit(x[groups==g,j:j+1])
+            assert scaler.center[k,j]==sk.mean_[0]
+            assert scaler.scale[k,j]==sk.scale_[0]
+
+
+def test_other_sklearn_scalers():
+    x,groups = make_data()
+    for name,cls in [('MaxAbsScaler()',MaxAbsScaler),('PowerTransformer()',PowerTransformer)]:
+        scaler = NumericalScaler(name).fit(x,groups)
+        assert scaler.kind=='sklearn'
+        res = scaler.transform(x,groups)
+        for g in scaler.groups:
+            for j in range(x.shape[1]):
+                sk = cls().fit(x[groups==g,j:j+1])
+                np.testing.assert_array_equal(res[groups==g,j],sk.transform(x[groups==g,j:j+1])[:,0])
+        np.testing.assert_allclose(scaler.inverse_transform(res,groups),x,rtol=1e-6)
+        ##on tensors with the columns on another axis
+        y = torch.from_numpy(np.repeat(res[:,None,1:],4,1).transpose(0,2,1).copy())
+        scaler.inverse_transform_(y,groups,[1,2],axis=1)
+        np.testing.assert_allclose(y[:,:,0].numpy(),x[:,1:],rtol=1e-6)
+        meta,arrays = scaler.to_arrays()
+        np.testing.assert_array_equal(NumericalScaler.from_arrays(meta,arrays).transform(x,groups),res)
@@ -0,0 +1,66 @@
+import json
+import threading
+import urllib.request
+import pandas as pd
+import pytest
+from dsipts.serving import ForecastServer, ModelRegistry, serve_http, request_forecast
+
+
+def test_submit_concurrent_with_close(trained_ts,small_frame):
+    history,future = small_frame.iloc[-18:-6],small_frame.iloc[-6:][['time','hh']]
+    server = ForecastServer(trained_ts,max_batch_size=8,max_latency_ms=1,device='cpu')
+    accepted,rejected = [],[]
+    def client():
+        for _ in range(20):
+            try:
+                accepted.append(server.submit(history,future))
+            except RuntimeError as _:
+                rejected.append(1)
+    threads = [threading.Thread(target=client) for _ in range(4)]
+    for th in threads:
+        th.start()
+    server.close()
+    for th in threads:
+        th.join()
+    ##every accepted request is served, the others fail immediately
+    assert len(accepted)+len(rejected)==80
+    for r in accepted:
+        assert server.result(r,timeout=5).shape[0]==6
+    with pytest.raises(RuntimeError):
+        server.submit(history,future)
+
+
+def test_http_round_trip(trained_ts,small_frame):
+    history,future = small_frame.iloc[-18:-6],small_frame.iloc[-6:][['time','hh']]
+    with ForecastServer(trained_ts,max_batch_size=8,max_latency_ms=1,device='cpu') as server:
+        httpd = serve_http(server,port=0)
+        try:
+            url = f'http://127.0.0.1:{httpd.server_address[1]}'
+            expected = server.forecast(history,future)
+            res = request_forecast(url,history,future)
+            ##same schema as the in process api
+            pd.testing.assert_frame_equal(res,expected,check_exact=False)
+            pd.testing.assert_series_equal(res.time,future.time.reset_index(drop=True),check_names=False)
+            with urllib.request.urlopen(f'{url}/stats',timeout=10) as f:
+                stats = json.loads(f.read())
+        finally:
+            httpd.shutdown()
+    assert stats['requests']==2 and sum(stats['batch_sizes'].values())==stats['batches']
+    assert 0<stats['p50_ms']<=stats['p99_ms']
+    assert server.stats()['batch_sizes']=={int(k):v for k,v in stats['batch_sizes'].items()}
+
+
+def test_registry_shares_metadata_and_evicts(trained_ts,small_frame,tmp_path):
+    history,future = small_frame.iloc[-18:-6],small_frame.iloc[-6:][['time','hh']]
+    trained_ts.save(str(tmp_path/'saved'))
+    with ModelRegistry(max_models=1,server_params={'device':'cpu'}) as registry:
+        for name in ['a','b']:
+            registry.register(name,type(trained_ts.model),str(tmp_path/'saved'))
+        res = registry.forecast('a',history,future)
+        a,server = registry.get('a'),registry.servers['a']
+        b = registry.get('b')
+        ##the server of the evicted model is closed after its pending requests
+        assert registry.stats()['loaded']==['b'] and not server.running
+        for attribute in ModelRegistry.shared_attributes:
+            assert getattr(a,attribute) is getattr(b,attribute)
+        pd.testing.assert_frame_equal(registry.forecast('b',history,future),res)
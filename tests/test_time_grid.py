@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+from dsipts.data_structure.utils import fill_time_holes
+
+
+def test_fill_time_holes_with_missing_times():
+    t = pd.Series(pd.date_range('2020-01-01',periods=10,freq='h'))
+    data = pd.DataFrame({'time':t,'y':np.arange(10.0),'g':['a']*5+['b']*5}).drop([3]).reset_index(drop=True)
+    data.loc[1,'time'] = pd.NaT
+    for group in [None,'g']:
+        res = fill_time_holes(data,'h',group)
+        ##same as the grid between min and max (without NaT) merged with the data
+        if group is None:
+            expected = pd.DataFrame({'time':pd.date_range(data.time.min(),data.time.max(),freq='h')})
+        else:
+            expected = pd.concat([pd.DataFrame({'g':k,'time':pd.date_range(v.time.min(),v.time.max(),freq='h')}) for k,v in data.groupby('g')],ignore_index=True)
+        expected = expected.merge(data,how='left')
+        pd.testing.assert_frame_equal(res[expected.columns],expected)
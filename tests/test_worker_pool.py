@@ -0,0 +1,31 @@
+import gc
+import pickle
+import weakref
+import numpy as np
+import torch
+from dsipts.data_structure.workers import WorkerPool
+
+
+def test_register_by_content_and_release(small_split):
+    train,validation,test = small_split
+    pool = WorkerPool(1,max_datasets=2)
+    try:
+        ##a new object with the same content (e.g. unpickled from the dataset cache) is not sent again
+        first = pickle.loads(pickle.dumps(train))
+        key = pool.register(first)
+        assert pool.register(train)==key
+        assert len(pool.datasets)==1 and getattr(train,'_shared',None) is None
+        batches = list(pool.map_batches(train,[[0,1,2],[3,4]]))
+        expected = train.get_batch(np.arange(3))
+        assert all([torch.equal(batches[0][k],expected[k]) for k in expected])
+        ##the least recently used dataset is released
+        pool.register(validation)
+        pool.register(test)
+        assert key not in pool.datasets and len(pool.datasets)==2
+        ref = weakref.ref(first)
+        del first
+        gc.collect()
+        assert ref() is None
+        assert len(list(pool.map_batches(test,[[0,1]])))==1
+    finally:
+        pool.close()